@@ -0,0 +1,54 @@
+"""
+Cold-start benchmark for the tifinity command line.
+
+Times fresh interpreter invocations of ``python -m tifinity`` (e.g. --version, --help and a module's --help), which
+import only the selected module, against an interpreter that eagerly imports every module as tifinity used to.
+
+Usage: python benchmarks/bench_startup.py [-n RUNS]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EAGER = ("import sys, importlib; from tifinity.modules import manifest; "
+         "[importlib.import_module(path) for (path, help_text) in manifest.values()]; "
+         "from tifinity.__main__ import main; main(sys.argv[1:])")
+
+COMMANDS = [
+    ("--version", ["-m", "tifinity", "--version"]),
+    ("--help", ["-m", "tifinity", "--help"]),
+    ("show_tags --help", ["-m", "tifinity", "show_tags", "--help"]),
+    ("--version (eager imports)", ["-c", EAGER, "--version"]),
+]
+
+
+def time_command(args, runs):
+    """Returns the wall clock times, in milliseconds, of running the interpreter with the specified arguments"""
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONDONTWRITEBYTECODE="1")
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Measures tifinity command line start up time")
+    ap.add_argument("-n", "--runs", type=int, default=10, help="number of runs per command (default 10)")
+    args = ap.parse_args()
+
+    print("{0:<28}{1:>10}{2:>10}".format("command", "min ms", "median ms"))
+    for name, command in COMMANDS:
+        times = time_command(command, args.runs)
+        print("{0:<28}{1:>10.1f}{2:>10.1f}".format(name, min(times), statistics.median(times)))
+
+
+if __name__ == '__main__':
+    main()
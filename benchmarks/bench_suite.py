@@ -0,0 +1,199 @@
+"""
+Benchmark suite for tifinity's hot paths.
+
+Generates synthetic TIFFs (varying image size, strip count, tag count, byte order and number of pages) and measures
+the time and peak (traced) memory of loading (Tiff.load_tiff, reading the file into memory or strips from disk),
+saving (Tiff.save_tiff), checksumming (Checksum.checksum), comparing (the compare module's checksum-images metric)
+and RGB72 migration (rgb72_to_rgb96.migrate). Synthetic images use a fixed random seed, so results are reproducible.
+
+Results are written as JSON, and can be compared against a previous run (e.g. from another commit) to find
+regressions.
+
+Usage: python benchmarks/bench_suite.py [-n RUNS] [-k FILTER] [--quick] [-o RESULTS] [--compare BASELINE]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import Namespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np                                                      # noqa: E402
+
+from tifinity.actions.checksum import Checksum                         # noqa: E402
+from tifinity.actions.rgb72_to_rgb96 import rgb72_to_rgb96             # noqa: E402
+from tifinity.modules.compare_tiffs import CompareTiffs                # noqa: E402
+from tifinity.parser.tiff import Tiff                                  # noqa: E402
+
+# name, width, height, samples, dtype ('rgb72' for 3x 24 bit samples), strips, extra tags, byte order, pages
+CASES = [
+    ("small-rgb8", 256, 256, 3, "uint8", 1, 0, "little", 1),
+    ("rgb8-1-strip", 2048, 2048, 3, "uint8", 1, 0, "little", 1),
+    ("rgb8-256-strips", 2048, 2048, 3, "uint8", 256, 0, "little", 1),
+    ("rgb16-64-strips-be", 1536, 1536, 3, "uint16", 64, 0, "big", 1),
+    ("gray16-500-tags", 1024, 1024, 1, "uint16", 16, 500, "little", 1),
+    ("rgb8-16-pages", 512, 512, 3, "uint8", 8, 10, "little", 16),
+    ("rgb72-32-strips", 1024, 1024, 3, "rgb72", 32, 0, "little", 1),
+    ("rgb72-32-strips-be", 1024, 1024, 3, "rgb72", 32, 0, "big", 1),
+]
+
+QUICK_SCALE = 4         # --quick divides image sizes by this
+
+def create_tiff(path, width, height, samples, dtype, strips, tags, byteorder, pages, seed=0):
+    """Writes a synthetic TIFF of random pixels with the specified properties"""
+    rng = np.random.default_rng(seed)
+    tiff = Tiff()
+    tiff.byteOrder = byteorder
+    tiff.tif_file.set_byte_order(byteorder)
+
+    for page in range(pages):
+        if dtype == "rgb72":
+            # 24 bit samples can't be created from numpy arrays: create the bytes, then describe them as 24 bit
+            data = rng.integers(0, 256, size=(height, width, samples * 3), dtype='uint8')
+            ifd = tiff.add_image(data, photometric=2)
+            ifd.set_tag("BitsPerSample", 3, [24] * samples)
+            ifd.set_tag("SamplesPerPixel", 3, [samples])
+            ifd.remove_tag("ExtraSamples")
+        else:
+            maximum = np.iinfo(dtype).max
+            ifd = tiff.add_image(rng.integers(0, maximum, size=(height, width, samples), dtype=dtype, endpoint=True))
+        for i in range(tags):
+            ifd.set_tag(65000 + i, 2, list("value {0}\0".format(i).encode()))
+        if page > 0:
+            ifd.set_tag("NewSubfileType", 4, [2])
+
+    row_bytes = width * samples * (3 if dtype == "rgb72" else np.dtype(dtype).itemsize)
+    rows_per_strip = -(-height // strips)
+    tiff.save_tiff(path, strip_size=rows_per_strip * row_bytes if strips > 1 else None)
+
+
+def operations(path, dtype, work_dir):
+    """Returns the operations to benchmark on the specified file, as (name, function) pairs"""
+    loaded = Tiff(path)
+    out = os.path.join(work_dir, "saved.tif")
+    ops = [("load", lambda: Tiff(path)),
+           ("load-disk", lambda: Tiff(path, in_memory=False)),
+           ("save", lambda: loaded.save_tiff(out)),
+           ("checksum", lambda: Checksum.checksum(loaded)),
+           ("compare", lambda: list(CompareTiffs().run(Namespace(tiff1=path, tiff2=path,
+                                                                  metric="checksum-images"))))]
+    if dtype == "rgb72":
+        ops.append(("migrate", lambda: rgb72_to_rgb96().migrate(Tiff(path))))
+    return ops
+
+
+def measure(func, runs):
+    """Returns the wall clock times (ms) of running the function, and its peak traced memory (KiB) in a separate
+       run (tracing slows the code, so is not timed)"""
+    func()                              # warm up (imports, caches)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter_ns()
+        func()
+        times.append((time.perf_counter_ns() - start) / 1e6)
+
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return times, peak / 1024
+
+
+def environment():
+    """Returns details of the environment the benchmarks ran in"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit,
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count()}
+
+
+def run_benchmarks(runs=5, name_filter=None, quick=False):
+    """Runs the benchmarks, printing each result, and returns the list of results"""
+    results = []
+    work_dir = tempfile.mkdtemp()
+    try:
+        for (name, width, height, samples, dtype, strips, tags, byteorder, pages) in CASES:
+            if name_filter and name_filter not in name:
+                continue
+            if quick:
+                width, height = max(16, width // QUICK_SCALE), max(16, height // QUICK_SCALE)
+            path = os.path.join(work_dir, name + ".tif")
+            create_tiff(path, width, height, samples, dtype, strips, tags, byteorder, pages)
+
+            for operation, func in operations(path, dtype, work_dir):
+                times, peak = measure(func, runs)
+                result = {"case": name, "operation": operation, "width": width, "height": height, "pages": pages,
+                          "file_bytes": os.path.getsize(path), "runs": runs,
+                          "min_ms": min(times), "median_ms": statistics.median(times), "peak_kib": peak}
+                results.append(result)
+                print("{case:<22}{operation:<10}{min_ms:>10.2f}{median_ms:>12.2f}{peak_kib:>12.0f}".format(**result))
+    finally:
+        shutil.rmtree(work_dir)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Prints the ratio of each result's median time and peak memory to the baseline's, returning the number of
+       results slower than the threshold ratio"""
+    previous = {(r["case"], r["operation"]): r for r in baseline["results"]}
+    regressions = 0
+    print("\n{0:<22}{1:<10}{2:>10}{3:>12}".format("case", "operation", "time x", "memory x"))
+    for result in results:
+        base = previous.get((result["case"], result["operation"]))
+        if base is None:
+            continue
+        time_ratio = result["median_ms"] / max(base["median_ms"], 1e-6)
+        memory_ratio = result["peak_kib"] / max(base["peak_kib"], 1e-6)
+        slower = time_ratio > threshold
+        regressions += slower
+        print("{0:<22}{1:<10}{2:>10.2f}{3:>12.2f}{4}".format(result["case"], result["operation"], time_ratio,
+                                                            memory_ratio, "  SLOWER" if slower else ""))
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmarks loading, saving, checksumming, comparing and migrating "
+                                             "synthetic TIFFs")
+    ap.add_argument("-n", "--runs", type=int, default=5, help="number of timed runs per operation (default 5)")
+    ap.add_argument("-k", dest="filter", help="only run cases whose name contains FILTER")
+    ap.add_argument("--quick", action="store_true", help="use smaller images (for a fast smoke test)")
+    ap.add_argument("-o", "--output", help="the JSON file to save results to")
+    ap.add_argument("--compare", help="a previous JSON results file to compare against")
+    ap.add_argument("--threshold", type=float, default=1.10,
+                    help="median time ratio above which a result is reported as slower (default 1.10)")
+    args = ap.parse_args()
+
+    print("{0:<22}{1:<10}{2:>10}{3:>12}{4:>12}".format("case", "operation", "min ms", "median ms", "peak KiB"))
+    results = run_benchmarks(args.runs, args.filter, args.quick)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"environment": environment(), "quick": args.quick, "results": results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -50,8 +50,9 @@ setup(
             'tifinity = tifinity.__main__:main'
         ]
     },
+    python_requires='>=3.7',
     install_requires=[
-        'numpy>=1.13.3'
+        'numpy>=1.17'
     ],
     classifiers=[
         'Development Status :: 2 - Pre-Alpha',
@@ -66,6 +67,7 @@ setup(
 
         # Specify the Python versions you support here. In particular, ensure
         # that you indicate whether you support Python 2, Python 3 or both.
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3.7',
     ]
 )
\ No newline at end of file
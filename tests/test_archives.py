@@ -0,0 +1,121 @@
+import json
+import os
+import pickle
+import shutil
+import tarfile
+import tempfile
+import unittest
+import zipfile
+from argparse import Namespace
+
+from tifinity.actions.checksum import Checksum
+from tifinity.actions.collection import find_tiffs
+from tifinity.actions.sniff import sniff_collection
+from tifinity.modules import checksum_image, rgb72_migration
+from tifinity.parser import sources
+from tifinity.parser.sources import MemorySource, SliceSource, archive_sources, open_source
+from tifinity.parser.tiff import Tiff
+
+
+class TestArchives(unittest.TestCase):
+    """ Tests relating to reading TIFFs from ZIP and tar archives
+
+    Tests:
+    * Stored members are read in place, and compressed members decompressed, giving the same checksums as the files
+    * Archives given as paths yield their TIFF members
+    * Compressed tar archives are processed in a single pass, rather than reopened for each member
+    * The checksum module reports each member of an archive
+    * The migrate_rgb72 module migrates archive members, writing alongside the archive
+    """
+
+    files = {"images/t_one_strip.tiff": './resources/t_one_strip/t_one_strip.tiff',
+             "images/rgb72.tif": './resources/stripes_one_strip_rgb72/stripes_one_strip_rgb72.tif'}
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.archives = {}
+        for name, mode in (("bundle.tar", "w"), ("bundle.tar.gz", "w:gz")):
+            path = os.path.join(self.test_dir, name)
+            with tarfile.open(path, mode) as tf:
+                for member, filename in self.files.items():
+                    tf.add(filename, member)
+                tf.add(__file__, "readme.txt")
+            self.archives[name] = path
+        for name, compression in (("stored.zip", zipfile.ZIP_STORED), ("deflated.zip", zipfile.ZIP_DEFLATED)):
+            path = os.path.join(self.test_dir, name)
+            with zipfile.ZipFile(path, "w", compression) as zf:
+                for member, filename in self.files.items():
+                    zf.write(filename, member)
+            self.archives[name] = path
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_members(self):
+        """ Tests members of each archive have the same checksums as the original files, stored members being read
+            in place """
+        for name, archive in self.archives.items():
+            for member, filename in self.files.items():
+                source = open_source(archive + "::" + member)
+                self.assertIsInstance(source, SliceSource if name in ("bundle.tar", "stored.zip") else MemorySource)
+                self.assertEqual(Checksum.checksum(Tiff(archive + "::" + member)), Checksum.checksum(Tiff(filename)))
+
+        with self.assertRaises(FileNotFoundError):
+            Tiff(self.archives["bundle.tar"] + "::missing.tif")
+
+    def test_find_tiffs(self):
+        """ Tests an archive yields its TIFF members, in archive order """
+        archive = self.archives["bundle.tar.gz"]
+        self.assertEqual(list(find_tiffs([archive])), [archive + "::" + member for member in self.files])
+
+    def test_single_pass(self):
+        """ Tests the members of a compressed tar are read in one pass through the archive, while other archives'
+            members are named, and that the members can be sent to worker processes """
+        self.assertEqual(list(archive_sources(self.archives["bundle.tar"])),
+                         [self.archives["bundle.tar"] + "::" + member for member in self.files])
+
+        archive = self.archives["bundle.tar.gz"]
+        members = list(archive_sources(archive))
+        self.assertEqual([m.name for m in members], [archive + "::" + member for member in self.files])
+        self.assertTrue(all(isinstance(m, MemorySource) for m in members))
+        copy = pickle.loads(pickle.dumps(members[0]))
+        self.assertEqual((copy.name, copy.read(0, copy.size)), (members[0].name, members[0].read(0, members[0].size)))
+
+        # modules processing the whole archive never open members by name
+        open_member = sources.open_member
+        sources.open_member = None
+        try:
+            args = Namespace(algorithm="md5", json=True, file=archive)
+            output_js = json.loads(checksum_image.module.process_cli(args))
+            self.assertEqual(output_js[archive + "::images/t_one_strip.tiff"]["full"],
+                             Checksum.checksum(Tiff(self.files["images/t_one_strip.tiff"]), "md5")["full"])
+            records = list(sniff_collection([archive], workers=1))
+            self.assertEqual([(r["file"], r["kind"]) for r in records],
+                             [(archive + "::" + member, "tiff") for member in self.files] +
+                             [(archive + "::readme.txt", "not_tiff")])
+        finally:
+            sources.open_member = open_member
+
+    def test_checksum_module(self):
+        """ Tests the checksum module reports the checksums of each member of an archive """
+        archive = self.archives["stored.zip"]
+        args = Namespace(algorithm="md5", json=True, file=archive)
+        output_js = json.loads(checksum_image.module.process_cli(args))
+        self.assertEqual(sorted(output_js), sorted(archive + "::" + member for member in self.files))
+        self.assertEqual(output_js[archive + "::images/t_one_strip.tiff"]["full"],
+                         Checksum.checksum(Tiff(self.files["images/t_one_strip.tiff"]), "md5")["full"])
+
+    def test_migrate_module(self):
+        """ Tests RGB72 members of an archive are migrated, and written alongside the archive """
+        archive = self.archives["bundle.tar"]
+        args = Namespace(path=[archive], output=None)
+        records = {r["file"]: r for r in rgb72_migration.module.run(args).records}
+        self.assertEqual(records[archive + "::images/t_one_strip.tiff"]["status"], "not required")
+        migrated = records[archive + "::images/rgb72.tif"]
+        self.assertEqual(migrated["status"], "migrated")
+        self.assertEqual(migrated["output"], os.path.join(self.test_dir, "rgb72.tif.conv.tif"))
+        self.assertEqual(Tiff(migrated["output"]).ifds[0].get_bits_per_sample(), [32, 32, 32])
+
+
+if __name__ == '__main__':
+    unittest.main()
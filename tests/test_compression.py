@@ -0,0 +1,121 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from tifinity.parser import compression
+from tifinity.parser.errors import UnsupportedCompressionError
+from tifinity.parser.tiff import Tiff
+
+
+class TestCompression(unittest.TestCase):
+    """ Tests relating to strip compression and compressed output from save_tiff.
+
+    Tests:
+    * LZW and PackBits encoding round trips
+    * LZW encoding matches an existing LZW compressed TIFF
+    * PackBits encoding splits runs and literals at 128 bytes and at row boundaries
+    * LZW strips encoded in worker processes match those encoded in a single thread
+    * Predictors round trip
+    * Saving with each compression type preserves the decoded image
+    * Saving with a target strip size re-strips the image
+    """
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    @staticmethod
+    def _resource(res_path):
+        return os.path.join("./resources", res_path, res_path + ".tiff")
+
+    def test_round_trip(self):
+        """ Tests that encoded data decodes back to the original """
+        data = bytes(range(256)) * 20 + b'\x00' * 5000 + os.urandom(3000)
+        for c in (compression.LZW, compression.ADOBE_DEFLATE, compression.PACKBITS):
+            encoded = compression.encode(data, c, row_bytes=30)
+            self.assertEqual(compression.decode(encoded, c).tobytes(), data)
+
+    def test_lzw_matches_existing(self):
+        """ Tests that LZW encoding reproduces the strip of an existing LZW compressed TIFF """
+        ifd = Tiff(self._resource("t_one_strip_compressed_lzw")).ifds[0]
+        uncompressed = Tiff(self._resource("t_one_strip")).ifds[0].img_data
+
+        self.assertTrue(np.array_equal(ifd.decode_image(), uncompressed))
+        predicted = compression.apply_predictor(uncompressed, 2, 10, 3, 8, 'little')
+        self.assertEqual(compression.lzw_encode(predicted), ifd.img_data.tobytes())
+
+    def test_packbits_packets(self):
+        """ Tests the packets of PackBits encoded data: replicated runs of 3 or more bytes, literals otherwise, each
+            of at most 128 bytes and not spanning rows """
+        data = b'\x01' * 130 + b'\x02\x03\x03' + b'\x04' * 3 + bytes(range(200))
+        self.assertEqual(compression.packbits_encode(data),
+                         bytes([129, 1, 4, 1, 1, 2, 3, 3, 254, 4, 127]) + bytes(range(128)) + bytes([71]) +
+                         bytes(range(128, 200)))
+        self.assertEqual(compression.packbits_encode(b'\x05' * 6, row_bytes=3), bytes([254, 5, 254, 5]))
+        self.assertEqual(compression.packbits_encode(b''), b'')
+
+    def test_lzw_processes(self):
+        """ Tests LZW strips encoded in worker processes match those encoded in the calling thread """
+        image = np.random.randint(0, 4, size=(64, 40, 3), dtype='uint8')
+        min_bytes = compression.LZW_PROCESS_MIN_BYTES
+        compression.LZW_PROCESS_MIN_BYTES = 0
+        try:
+            strips = []
+            for threads in (1, 2):
+                tiff = Tiff(threads=threads)
+                tiff.add_image(image)
+                tiff.encode_image(tiff.ifds[0], "lzw", strip_size=1024)
+                strips.append([s.tobytes() for s in tiff.ifds[0].get_strip_data()])
+                self.assertTrue(np.array_equal(tiff.ifds[0].pixels(), image))
+        finally:
+            compression.LZW_PROCESS_MIN_BYTES = min_bytes
+        self.assertEqual(strips[0], strips[1])
+        self.assertGreater(len(strips[0]), 1)
+
+    def test_predictors(self):
+        """ Tests that horizontal and floating point predictors are reversible """
+        data = np.random.randint(0, 256, size=6 * 5 * 3 * 4, dtype='uint8')
+        for predictor in (2, 3):
+            for byteorder in ('little', 'big'):
+                predicted = compression.apply_predictor(data, predictor, 5, 3, 32, byteorder)
+                self.assertTrue(np.array_equal(
+                    compression.undo_predictor(predicted, predictor, 5, 3, 32, byteorder), data))
+
+    def test_unsupported_predictor(self):
+        """ Tests that the floating point predictor is rejected for integer samples """
+        tiff = Tiff(self._resource("t_one_strip"))
+        with self.assertRaises(UnsupportedCompressionError):
+            tiff.save_tiff(os.path.join(self.test_dir, "out.tif"), compression="lzw", predictor=3)
+
+    def test_save_compressed(self):
+        """ Tests that saving with each compression preserves the (decoded) image data """
+        original = Tiff(self._resource("t_two_strips_seq")).ifds[0].decode_image()
+        for name in ("none", "lzw", "deflate", "packbits"):
+            out_file = os.path.join(self.test_dir, name + ".tif")
+            Tiff(self._resource("t_two_strips_seq")).save_tiff(out_file, compression=name, predictor=2)
+
+            saved = Tiff(out_file).ifds[0]
+            self.assertEqual(saved.get_compression(), compression.get_compression_code(name))
+            self.assertTrue(np.array_equal(saved.decode_image(), original))
+
+    def test_save_strip_size(self):
+        """ Tests that a target strip size re-strips the image and subsequent IFDs remain linked """
+        out_file = os.path.join(self.test_dir, "out.tif")
+        tiff = Tiff(self._resource("t_two_subfiles_one_strip"))
+        tiff.save_tiff(out_file, compression="deflate", strip_size=60)
+
+        saved = Tiff(out_file)
+        self.assertEqual(len(saved.ifds), 2)
+        for ifd in saved.ifds:
+            self.assertEqual(ifd.get_rows_per_strip(), 2)
+            self.assertEqual(len(ifd.get_strips()), 5)
+            self.assertEqual(len(ifd.decode_image()), 300)
+
+
+if __name__ == '__main__':
+    unittest.main()
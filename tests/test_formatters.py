@@ -0,0 +1,68 @@
+import io
+import json
+import os
+import unittest
+from argparse import Namespace
+
+import numpy as np
+
+from tifinity.modules import checksum_image, tiff_details
+from tifinity.scripts.formatters import Result, write_result
+
+
+class TestFormatters(unittest.TestCase):
+    """ Tests relating to module results and output formatters
+
+    Tests:
+    * Records are streamed from generators to JSON lines, CSV and text
+    * Modules return results (run) consistent with their --json output (process_cli)
+    """
+
+    def _result(self):
+        def records():
+            yield {"file": "a.tif", "values": np.array([1, 2]), "extra": "not output"}
+            yield {"file": "b.tif", "values": [3]}
+        return Result(records(), ["file", "values"])
+
+    def _write(self, result, output_format):
+        out = io.StringIO()
+        write_result(result, out, output_format)
+        return out.getvalue()
+
+    def test_jsonl(self):
+        """ Tests each record is written as a JSON line of its fields """
+        lines = self._write(self._result(), "jsonl").splitlines()
+        self.assertEqual([json.loads(line) for line in lines],
+                         [{"file": "a.tif", "values": [1, 2]}, {"file": "b.tif", "values": [3]}])
+
+    def test_csv(self):
+        """ Tests records are written as CSV rows with a header """
+        lines = self._write(self._result(), "csv").splitlines()
+        self.assertEqual(lines, ['file,values', 'a.tif,"[1, 2]"', 'b.tif,[3]'])
+
+    def test_text(self):
+        """ Tests default and module specific text output """
+        self.assertEqual(self._write(self._result(), "text"), "a.tif\t[1 2]\nb.tif\t[3]\n")
+
+        result = Result([{"n": 1}, {"n": 2}], text_lines=lambda records: ("n={0}".format(r["n"]) for r in records))
+        self.assertEqual(self._write(result, "text"), "n=1\nn=2\n")
+
+    def test_module_run(self):
+        """ Tests that module results match the module's --json output """
+        res_path = "t_two_subfiles_one_strip"
+        file = os.path.join("./resources", res_path, res_path + ".tiff")
+
+        args = Namespace(file=file, algorithm="md5", json=True)
+        records = list(checksum_image.module.run(args))
+        self.assertEqual([r["part"] for r in records], ["full", "image", "image", "ifd", "ifd"])
+        output = json.loads(checksum_image.module.process_cli(args))
+        self.assertEqual(output["images"], [r["digest"] for r in records if r["part"] == "image"])
+
+        args = Namespace(file=file, tags=["ImageWidth", "Make"], detail=False, csv=False, format="jsonl")
+        records = [json.loads(line) for line in tiff_details.module.process_cli(args).splitlines()]
+        self.assertEqual([(r["ifd"], r["name"], r["value"]) for r in records],
+                         [(0, "ImageWidth", [10]), (0, "Make", None), (1, "ImageWidth", [10]), (1, "Make", None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+
+import numpy as np
+
+from tifinity.actions.icc_parser import IccProfile, format_values
+
+
+def element(sig, payload):
+    """Returns an ICC tag element: type signature, reserved bytes and payload, padded to a multiple of 4 bytes"""
+    data = sig + bytes(4) + payload
+    return data + bytes(-len(data) % 4)
+
+
+def build_profile(tags):
+    """Returns the bytes of an RGB display ICC profile containing the (tag signature, element) tags"""
+    offset = 128 + 4 + 12 * len(tags)
+    table = len(tags).to_bytes(4, 'big')
+    data = b''
+    for sig, value in tags:
+        table += sig + (offset + len(data)).to_bytes(4, 'big') + len(value).to_bytes(4, 'big')
+        data += value
+
+    header = bytearray(128)
+    header[0:4] = (128 + len(table) + len(data)).to_bytes(4, 'big')
+    header[8:10] = b'\x04\x30'
+    header[12:24] = b'mntrRGB XYZ '
+    header[36:40] = b'acsp'
+    return bytes(header) + table + data
+
+
+def s15fixed16(values):
+    return np.round(np.asarray(values) * 65536).astype('>i4').tobytes()
+
+
+class TestIccParser(unittest.TestCase):
+    """ Tests relating to parsing ICC profiles
+
+    Tests:
+    * Curves are parsed as arrays, parametric curves as their function type and parameters
+    * XYZ and s15Fixed16 arrays are parsed as (signed) float arrays
+    * lut16Type tables are parsed as arrays of the right shapes
+    * Chromaticities are parsed as (x, y) arrays, and values are formatted as readable text
+    """
+
+    def test_curves(self):
+        """ Tests parsing 'curv' and 'para' curves """
+        samples = np.linspace(0, 65535, 4096).astype('uint16')
+        curv = element(b'curv', (4096).to_bytes(4, 'big') + samples.astype('>u2').tobytes())
+        para = element(b'para', (3).to_bytes(2, 'big') + bytes(2) + s15fixed16([2.4, 1 / 1.055, 0.055 / 1.055,
+                                                                                   1 / 12.92, 0.04045]))
+        profile = IccProfile(build_profile([(b'rTRC', curv), (b'gTRC', para)]))
+
+        self.assertEqual(profile.tag_count, 2)
+        rtrc = profile.tags['rTRC'][2]
+        self.assertEqual((rtrc.sig, len(rtrc)), ('curv', 4096))
+        np.testing.assert_array_equal(rtrc.values, samples)
+
+        gtrc = profile.tags['gTRC'][2]
+        self.assertEqual((gtrc.sig, gtrc.function_type), ('para', 3))
+        np.testing.assert_allclose(gtrc.values, [2.4, 1 / 1.055, 0.055 / 1.055, 1 / 12.92, 0.04045], atol=1e-4)
+
+    def test_numbers(self):
+        """ Tests parsing XYZ numbers and s15Fixed16 arrays, including negative values """
+        xyz = element(b'XYZ ', s15fixed16([0.4361, 0.2225, 0.0139]))
+        chad = element(b'sf32', s15fixed16([1.0479, 0.0229, -0.0502, 0.0296, 0.9904, -0.0171, -0.0092, 0.0151,
+                                            0.7519]))
+        desc = element(b'desc', (5).to_bytes(4, 'big') + b'sRGB\x00')
+        profile = IccProfile(build_profile([(b'rXYZ', xyz), (b'chad', chad), (b'desc', desc)]))
+
+        np.testing.assert_allclose(profile.tags['rXYZ'][2], [[0.4361, 0.2225, 0.0139]], atol=1e-4)
+        self.assertAlmostEqual(profile.tags['chad'][2][2], -0.0502, places=4)
+        self.assertEqual(profile.get_description(), "sRGB")
+        self.assertEqual(profile.header['profile_version_number'], "4.3.0")
+
+    def test_lut16(self):
+        """ Tests parsing a lut16Type (mft2) """
+        grid, entries = 3, 4
+        tables = np.arange(3 * entries + grid ** 3 * 3 + 3 * entries, dtype='uint16')
+        payload = bytes([3, 3, grid, 0]) + s15fixed16(np.eye(3).ravel()) + (entries).to_bytes(2, 'big') + \
+            (entries).to_bytes(2, 'big') + tables.astype('>u2').tobytes()
+        lut = IccProfile(build_profile([(b'A2B0', element(b'mft2', payload))])).tags['A2B0'][2]
+
+        np.testing.assert_array_equal(lut.matrix, np.eye(3))
+        self.assertEqual(lut.input_tables.shape, (3, entries))
+        self.assertEqual(lut.clut.shape, (grid, grid, grid, 3))
+        self.assertEqual(lut.output_tables.shape, (3, entries))
+        self.assertEqual(lut.output_tables[-1, -1], tables[-1])
+
+    def test_format(self):
+        """ Tests parsing chromaticities, and formatting XYZ numbers, chromaticities, float and long arrays """
+        xyz = element(b'XYZ ', s15fixed16([0.4361, 0.2225, 0.0139]))
+        chrm = element(b'chrm', (3).to_bytes(2, 'big') + (0).to_bytes(2, 'big') +
+                       s15fixed16([0.64, 0.33, 0.3, 0.6, 0.15, 0.06]))
+        chad = element(b'sf32', s15fixed16([1.0, -0.5]))
+        profile = IccProfile(build_profile([(b'rXYZ', xyz), (b'chrm', chrm), (b'chad', chad)]))
+
+        np.testing.assert_allclose(profile.tags['chrm'][2], [[0.64, 0.33], [0.3, 0.6], [0.15, 0.06]], atol=1e-4)
+        self.assertEqual(format_values(profile.tags['rXYZ'][2]), "X=0.436096, Y=0.222504, Z=0.0139008")
+        self.assertTrue(format_values(profile.tags['chrm'][2]).startswith("x=0.639999, y=0.330002; x=0.300003"))
+        self.assertEqual(format_values(profile.tags['chad'][2]), "1, -0.5")
+        self.assertEqual(format_values(np.arange(4096, dtype='uint16')), "0, 1, 2, ..., 4093, 4094, 4095")
+        self.assertIn("[chrm]", profile.tostring())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import unittest
+from argparse import Namespace
+
+import numpy as np
+
+from tifinity.actions.icc_parser import IccProfileCache
+from tifinity.modules import tiff_details
+from tifinity.parser.tiff import Tiff
+
+
+def create_profile(description, gamma=2.2):
+    """Returns the bytes of a minimal RGB display ICC profile with a description and a gamma curve"""
+    desc = b'desc' + bytes(4) + (len(description) + 1).to_bytes(4, 'big') + description.encode('ascii') + bytes(1)
+    desc += bytes(-len(desc) % 4)
+    curv = b'curv' + bytes(4) + (1).to_bytes(4, 'big') + int(gamma * 256).to_bytes(2, 'big') + bytes(2)
+    tags = [(b'desc', desc), (b'rTRC', curv)]
+
+    offset = 128 + 4 + 12 * len(tags)
+    table = len(tags).to_bytes(4, 'big')
+    data = b''
+    for sig, value in tags:
+        table += sig + (offset + len(data)).to_bytes(4, 'big') + len(value).to_bytes(4, 'big')
+        data += value
+
+    header = bytearray(128)
+    header[0:4] = (128 + len(table) + len(data)).to_bytes(4, 'big')
+    header[8:10] = b'\x02\x10'
+    header[12:24] = b'mntrRGB XYZ '
+    header[36:40] = b'acsp'
+    return bytes(header) + table + data
+
+
+class TestIccProfileCache(unittest.TestCase):
+    """ Tests relating to caching parsed ICC profiles
+
+    Tests:
+    * Profiles are parsed once per distinct profile bytes, and the least recently used evicted
+    * Profile summaries include the description
+    * show_tags lists the distinct profiles in a folder with their counts
+    """
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_cache(self):
+        """ Tests that equal profile bytes (in any form) are only parsed once, within the cache size """
+        cache = IccProfileCache(maxsize=1)
+        srgb, other = create_profile("sRGB"), create_profile("Other", 1.8)
+
+        profile = cache.get(srgb)
+        self.assertIs(cache.get(list(np.frombuffer(srgb, dtype='uint8'))), profile)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        cache.get(other)
+        self.assertEqual(len(cache), 1)
+        self.assertIsNot(cache.get(srgb), profile)
+        self.assertEqual(cache.misses, 3)
+
+    def test_summary(self):
+        """ Tests the profile summary """
+        summary = IccProfileCache().summary(create_profile("sRGB"))
+        self.assertEqual(summary["description"], "sRGB")
+        self.assertEqual(summary["colour_space"], "RGB ")
+        self.assertEqual(summary["device_class"], "mntr")
+        self.assertEqual(summary["version"], "2.1.0")
+
+    def test_inventory(self):
+        """ Tests the inventory of profiles in a folder of TIFFs """
+        for i, description in enumerate(["sRGB", "sRGB", "Other"]):
+            tiff = Tiff()
+            tiff.add_image(np.zeros((4, 4, 3), dtype='uint8'))
+            tiff.ifds[0].set_tag("ICC_Profile", 7, list(create_profile(description)))
+            tiff.save_tiff(os.path.join(self.test_dir, "{0}.tif".format(i)))
+
+        args = Namespace(file=self.test_dir, tags=None, profiles=True, workers=1, format="jsonl")
+        lines = tiff_details.module.process_cli(args).splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('"count": 2', lines[0])
+        self.assertIn('"description": "sRGB"', lines[0])
+        self.assertIn('"description": "Other"', lines[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
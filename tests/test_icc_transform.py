@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+from argparse import Namespace
+
+import numpy as np
+
+from tifinity.actions.icc_parser import IccProfile
+from tifinity.actions.icc_transform import SRGB_TO_XYZ_D50, get_transform, srgb_encode
+from tifinity.modules import image_stats
+from tifinity.parser.errors import UnsupportedProfileError
+from tifinity.parser.tiff import Tiff
+
+
+def s15fixed16(values):
+    return np.round(np.asarray(values) * 65536).astype('>i4').tobytes()
+
+
+def srgb_profile():
+    """Returns the bytes of a matrix/TRC sRGB ICC profile, with parametric curves"""
+    para = b'para' + bytes(4) + (3).to_bytes(2, 'big') + bytes(2) + \
+        s15fixed16([2.4, 1 / 1.055, 0.055 / 1.055, 1 / 12.92, 0.04045])
+    tags = [(b'rTRC', para), (b'gTRC', para), (b'bTRC', para)]
+    tags += [(sig, b'XYZ ' + bytes(4) + s15fixed16(SRGB_TO_XYZ_D50[:, i])) for i, sig in
+             enumerate([b'rXYZ', b'gXYZ', b'bXYZ'])]
+
+    offset = 128 + 4 + 12 * len(tags)
+    table = len(tags).to_bytes(4, 'big')
+    data = b''
+    for sig, value in tags:
+        table += sig + (offset + len(data)).to_bytes(4, 'big') + len(value).to_bytes(4, 'big')
+        data += value
+    header = bytearray(128)
+    header[0:4] = (128 + len(table) + len(data)).to_bytes(4, 'big')
+    header[12:24] = b'mntrRGB XYZ '
+    return bytes(header) + table + data
+
+
+class TestIccTransform(unittest.TestCase):
+    """ Tests relating to colour transforms with ICC profiles
+
+    Tests:
+    * Curves evaluate as their sampled table, gamma or parametric function
+    * sRGB pixels transformed to sRGB are unchanged, and white transforms to the D50 white point
+    * Compiled transforms are cached
+    * stats module calculates statistics of transformed pixels
+    """
+
+    def test_curves(self):
+        """ Tests evaluating curves """
+        x = np.linspace(0, 1, 11)
+        profile = IccProfile(srgb_profile())
+        linear = np.where(x <= 0.04045, x / 12.92, ((x + 0.055) / 1.055) ** 2.4)
+        np.testing.assert_allclose(profile.tags['rTRC'][2].evaluate(x), linear, atol=1e-4)
+        np.testing.assert_allclose(srgb_encode(linear), x, atol=1e-6)
+
+    def test_transform(self):
+        """ Tests transforming 8 and 16 bit pixels """
+        image = np.random.randint(0, 256, size=(16, 16, 3), dtype='uint8')
+        srgb = get_transform(srgb_profile(), "srgb", 8).apply(image)
+        self.assertEqual(srgb.dtype, np.uint8)
+        self.assertLessEqual(np.abs(srgb.astype('int') - image).max(), 1)
+
+        white = np.full((1, 1, 3), 65535, dtype='uint16')
+        np.testing.assert_allclose(get_transform(srgb_profile(), "xyz", 16).apply(white)[0, 0],
+                                   [0.9642, 1.0, 0.8249], atol=1e-3)
+        np.testing.assert_allclose(get_transform(srgb_profile(), "linear", 16).apply(white // 2)[0, 0],
+                                   [0.2140] * 3, atol=1e-3)
+        self.assertIs(get_transform(srgb_profile(), "xyz", 16), get_transform(srgb_profile(), "xyz", 16))
+
+    def test_stats(self):
+        """ Tests statistics of linear light pixels """
+        test_dir = tempfile.mkdtemp()
+        try:
+            tiff = Tiff()
+            tiff.add_image(np.full((8, 8, 3), 255, dtype='uint8'))
+            path = os.path.join(test_dir, "plain.tif")
+            tiff.save_tiff(path)
+            args = Namespace(file=path, bins=16, subsample=1, histogram=False, colour="linear", format="json")
+            with self.assertRaises(UnsupportedProfileError):
+                image_stats.module.run(args).document()
+
+            tiff.ifds[0].set_tag("ICC_Profile", 7, list(srgb_profile()))
+            tiff.save_tiff(path)
+            channels = image_stats.module.run(args).document()["images"][0]["channels"]
+            self.assertEqual(len(channels), 3)
+            self.assertAlmostEqual(channels[0]["mean"], 1.0, places=4)
+        finally:
+            shutil.rmtree(test_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+from argparse import Namespace
+
+from tifinity.__main__ import main
+from tifinity.actions.checksum import Checksum
+from tifinity.parser.tiff import Tiff
+from tifinity.scripts.instrument import instruments, phase, run_profiled
+
+
+class TestInstrument(unittest.TestCase):
+    """ Tests relating to the instrumentation of phases and byte counts
+
+    Tests:
+    * Nothing is recorded unless instrumentation is enabled
+    * Loading and checksumming a TIFF records phases and byte counts
+    * Profiles are written as JSON reports or cProfile statistics
+    """
+
+    file = './resources/t_two_strips_seq/t_two_strips_seq.tiff'
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        instruments.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def test_disabled(self):
+        """ Tests that phases and counts are not recorded by default """
+        instruments.reset()
+        with phase("header"):
+            pass
+        Checksum.checksum(Tiff(self.file))
+        self.assertEqual(instruments.phases, {})
+        self.assertEqual(instruments.counters, {})
+
+    def test_phases(self):
+        """ Tests that loading and checksumming a TIFF records its phases and the bytes read and hashed """
+        instruments.start()
+        tiff = Tiff(self.file)
+        Checksum.checksum(tiff)
+        instruments.stop()
+
+        report = instruments.report()
+        for name in ("file_read", "header", "ifd_parse", "strip_read", "hash"):
+            self.assertIn(name, report["phases"])
+        self.assertEqual(report["phases"]["ifd_parse"]["calls"], len(tiff.ifds))
+        self.assertEqual(report["counters"]["bytes_read"], os.path.getsize(self.file))
+        self.assertEqual(report["counters"]["strip_bytes_read"], sum(len(ifd.img_data) for ifd in tiff.ifds))
+        self.assertGreater(report["wall_ms"], 0)
+        self.assertNotIn("peak_memory_kib", report)
+
+    def test_profile_files(self):
+        """ Tests that --profile writes a JSON report, and cProfile statistics for .prof files """
+        report_file = os.path.join(self.temp_dir, "profile.json")
+        main(["--profile", report_file, "--profile-memory", "checksum", self.file])
+        with open(report_file) as f:
+            report = json.load(f)
+        self.assertEqual(report["command"], "checksum")
+        self.assertIn("hash", report["phases"])
+        self.assertGreater(report["peak_memory_kib"], 0)
+
+        stats_file = os.path.join(self.temp_dir, "profile.prof")
+        result = run_profiled(lambda args: args.value, Namespace(value=42), stats_file)
+        self.assertEqual(result, 42)
+        self.assertGreater(pstats.Stats(stats_file).total_calls, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import unittest
+
+import numpy as np
+
+from tifinity.parser import io_plan
+from tifinity.parser.tiff import Tiff
+from tifinity.scripts.instrument import instruments
+
+
+class TestIoPlan(unittest.TestCase):
+    """ Tests relating to coalesced reads of strip data
+
+    Tests:
+    * Extents are read in file order, merged across small gaps and split at large gaps, overlaps and size limits
+    * Out of order strips read from disk match those read in memory, with a single read request
+    * Reads without preadv or pread (e.g. on Windows) match those with them
+    * Images of a header-only Tiff can be read individually
+    """
+
+    reverse_file = './resources/t_two_strips_seq_reverse/t_two_strips_seq_reverse.tiff'
+
+    def test_plan_reads(self):
+        """ Tests merging of extents into reads """
+        extents = [(300, 100), (0, 100), (100, 100), (1000, 50), (1010, 10), (500, 0)]
+        reads = io_plan.plan_reads(extents, max_gap=200)
+        self.assertEqual(reads, [io_plan.Read(0, 400, [(1, 0), (2, 100), (0, 300)]),
+                                 io_plan.Read(1000, 50, [(3, 0)]),        # overlapping extent starts a new read
+                                 io_plan.Read(1010, 10, [(4, 0)])])
+
+        self.assertEqual(len(io_plan.plan_reads(extents, max_gap=0)), 4)
+        self.assertEqual(len(io_plan.plan_reads(extents[:3], max_gap=200, max_read=250)), 2)
+        self.assertEqual(io_plan.plan_reads([]), [])
+
+    def test_read_from_disk(self):
+        """ Tests that reverse ordered strips read from disk match the file read into memory """
+        expected = Tiff(self.reverse_file)
+        instruments.start()
+        try:
+            tiff = Tiff(self.reverse_file, in_memory=False)
+        finally:
+            instruments.stop()
+        self.assertTrue(tiff.tif_file.is_mapped())
+        self.assertTrue(np.array_equal(tiff.ifds[0].img_data, expected.ifds[0].img_data))
+        self.assertEqual(instruments.counters["read_requests"], 1)
+
+    def test_read_fallbacks(self):
+        """ Tests reads with pread, and with a seek and read, match those with preadv """
+        expected = Tiff(self.reverse_file)
+        for have_preadv, have_pread in ((False, True), (False, False)):
+            io_plan.HAVE_PREADV, io_plan.HAVE_PREAD = have_preadv, have_pread
+            try:
+                tiff = Tiff(self.reverse_file, in_memory=False, threads=2)
+            finally:
+                io_plan.HAVE_PREADV, io_plan.HAVE_PREAD = hasattr(os, "preadv"), hasattr(os, "pread")
+            self.assertTrue(np.array_equal(tiff.ifds[0].img_data, expected.ifds[0].img_data))
+
+    def test_read_image_on_demand(self):
+        """ Tests that an image can be read after only the IFDs were parsed """
+        expected = Tiff(self.reverse_file)
+        tiff = Tiff(self.reverse_file, images=False)
+        self.assertIsNone(tiff.ifds[0].img_data)
+        tiff.read_image(tiff.ifds[0])
+        self.assertTrue(np.array_equal(tiff.ifds[0].img_data, expected.ifds[0].img_data))
+
+
+if __name__ == '__main__':
+    unittest.main()
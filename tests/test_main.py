@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import tifinity
+from tifinity.__main__ import load_modules
+from tifinity.modules import manifest
+
+
+class TestMain(unittest.TestCase):
+    """ Tests relating to the command line entry point
+
+    Tests:
+    * Module manifest lists every module in tifinity.modules, under its cli_name
+    * Only the selected module is imported
+    """
+
+    def test_manifest(self):
+        """ Tests that the manifest matches the modules discovered in the package """
+        discovered = {module.module.cli_name: module.__name__ for module in load_modules("tifinity.modules")}
+        self.assertEqual(discovered, {name: path for name, (path, help_text) in manifest.items()})
+
+    def test_lazy_import(self):
+        """ Tests that numpy is not imported for --help, and only the selected module is imported """
+        code = ("import sys\n"
+                "from tifinity.__main__ import main\n"
+                "try:\n"
+                "    main(sys.argv[1:])\n"
+                "except SystemExit:\n"
+                "    pass\n"
+                "print(sorted(m for m in sys.modules if m.startswith(('numpy', 'tifinity.modules.'))))")
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(tifinity.__file__))))
+
+        def imported(*args):
+            result = subprocess.run([sys.executable, "-c", code] + list(args), env=env, stdout=subprocess.PIPE,
+                                    universal_newlines=True, check=True)
+            return result.stdout.strip().splitlines()[-1]
+
+        self.assertEqual(imported("--help"), "[]")
+        modules = imported("checksum", "--help")
+        self.assertIn("tifinity.modules.checksum_image", modules)
+        self.assertNotIn("tifinity.modules.pyramid", modules)
+
+
+if __name__ == '__main__':
+    unittest.main()
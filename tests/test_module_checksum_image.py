@@ -2,6 +2,10 @@ import json
 import os
 import unittest
 from argparse import Namespace
+
+import numpy as np
+
+from tifinity.actions.checksum import Checksum
 from tifinity.modules import checksum_image
 
 class TestModuleChecksumImage(unittest.TestCase):
@@ -18,6 +22,7 @@ class TestModuleChecksumImage(unittest.TestCase):
     *  8) File, Image and IFD MD5 check for two subfile single strip LE TIFF
     *  9) File, Image and IFD MD5 check for single strip LE TIFF with exif metadata.
     * 10) File, Image and IFD MD5 check for single strip big-endian TIFF
+    * 11) Pixel digests are reported per image, and independent of byte order
 
     Todo: Other tests
     *  Check MD5 for non-image data for single strip TIFF
@@ -101,5 +106,19 @@ class TestModuleChecksumImage(unittest.TestCase):
         """ Tests the checksums for a single strip big-endian TIFF file """
         self._evaluate_checksums("t_one_strip_big_endian")
 
+    def test_pixel_digests(self):
+        """ Tests that --pixels adds a pixel digest per image, and that the digest of 16 bit pixels is the same
+            whichever byte order they are stored in """
+        res_path = "t_two_subfiles_one_strip"
+        args = Namespace(algorithm="sha256", json=True, pixels=True,
+                         file=os.path.join("./resources", res_path, res_path + ".tiff"))
+        output_js = json.loads(checksum_image.module.process_cli(args))
+        self.assertEqual(len(output_js["pixels"]), 2)
+        self.assertNotEqual(output_js["pixels"], output_js["images"])
+
+        band = np.arange(12, dtype='<u2').reshape(2, 2, 3)
+        self.assertEqual(Checksum._canonical(band).tobytes(), Checksum._canonical(band.astype('>u2')).tobytes())
+        self.assertEqual(Checksum._canonical(band).tobytes(), band.tobytes())
+
 if __name__ == '__main__':
     unittest.main()
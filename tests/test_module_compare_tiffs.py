@@ -10,7 +10,8 @@ class TestModuleCompareTiffs(unittest.TestCase):
 
      Tests:
      * Check for error with only 1 file supplied
-     * Compare pixel hash of two identical files"""
+     * Compare pixel hash of two identical files
+     * Compare canonical pixel digests of the same image stored with different strips and compression"""
 
     def test_one_file_supplied(self):
         """ Tests that if only a single file is supplied, an appropriate error is returned """
@@ -49,5 +50,20 @@ class TestModuleCompareTiffs(unittest.TestCase):
         self.assertEqual(json.dumps({'Files Identical': False,
                                     'Images Identical': {0: [False]}}), output)
 
+    def test_pixels_layout_independent(self):
+        """ Tests that the same image in one strip, two strips and LZW compressed is identical by the
+            checksum-pixels metric, read without loading the images """
+        orig_file = os.path.join("./resources", "t_one_strip", "t_one_strip.tiff")
+        for comp_res_path in ("t_two_strips_seq", "t_one_strip_compressed_lzw"):
+            comp_file = os.path.join("./resources", comp_res_path, comp_res_path + ".tiff")
+
+            args = Namespace(tiff1=orig_file, tiff2=comp_file, metric="checksum-pixels", json=True)
+            self.assertEqual(json.dumps({'Images Identical': {0: [True]}}), compare_tiffs.module.process_cli(args))
+
+        # a different image (strips referenced in reverse order)
+        comp_file = os.path.join("./resources", "t_two_strips_seq_reverse", "t_two_strips_seq_reverse.tiff")
+        args = Namespace(tiff1=orig_file, tiff2=comp_file, metric="checksum-pixels", json=True)
+        self.assertEqual(json.dumps({'Images Identical': {0: [False]}}), compare_tiffs.module.process_cli(args))
+
 if __name__ == '__main__':
     unittest.main()
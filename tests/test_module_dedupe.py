@@ -0,0 +1,99 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from argparse import Namespace
+
+from tifinity.actions.dedupe import BKTree, HashIndex, file_hashes, hamming, index_collection
+from tifinity.modules import dedupe
+
+
+class TestModuleDedupe(unittest.TestCase):
+    """ Tests relating to the dedupe module
+
+    Tests:
+    * The same image stored differently has the same hash, and different images different hashes
+    * BK-tree searches find the same hashes as comparing every pair
+    * Hashes are kept in the index, and files only hashed again when changed
+    * Near-duplicates are reported across a folder
+    """
+
+    one_strip = './resources/t_one_strip/t_one_strip.tiff'
+    lzw = './resources/t_one_strip_compressed_lzw/t_one_strip_compressed_lzw.tiff'
+    reverse = './resources/t_two_strips_seq_reverse/t_two_strips_seq_reverse.tiff'
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_hashes(self):
+        """ Tests the hashes of an image stored uncompressed and LZW compressed are identical, and differ from the
+            hash of the image with its halves swapped """
+        one_strip = file_hashes(self.one_strip)
+        self.assertEqual(len(one_strip), 1)
+        self.assertEqual(one_strip[0][0], file_hashes(self.lzw)[0][0])
+        self.assertGreater(hamming(one_strip[0][0], file_hashes(self.reverse)[0][0]), 8)
+
+    def test_bk_tree(self):
+        """ Tests searching a BK-tree finds exactly the hashes within the distance """
+        rng = random.Random(4)
+        hashes = [rng.getrandbits(16) for i in range(500)]
+        tree = BKTree()
+        for i, value in enumerate(hashes):
+            tree.add(value, i)
+        for query in hashes[:20]:
+            expected = sorted((hamming(query, value), i) for i, value in enumerate(hashes)
+                              if hamming(query, value) <= 3)
+            self.assertEqual(sorted(tree.search(query, 3)), expected)
+
+    def test_index(self):
+        """ Tests hashes are written to the index, and only changed files are hashed again """
+        folder = os.path.join(self.test_dir, "images")
+        os.mkdir(folder)
+        for filename in (self.one_strip, self.reverse):
+            shutil.copy(filename, folder)
+        index_file = os.path.join(self.test_dir, "index.tsv")
+
+        index = HashIndex(index_file)
+        self.assertEqual(index_collection([folder], index, workers=1), [])
+        self.assertEqual(len(index), 2)
+
+        index = HashIndex(index_file)
+        self.assertEqual(len(index), 2)
+        self.assertTrue(all(index.is_current(entry[4]) for entry in index))
+
+        changed = os.path.join(folder, os.path.basename(self.reverse))
+        shutil.copy(self.lzw, changed)
+        os.utime(changed, (0, 0))
+        self.assertFalse(index.is_current(changed))
+        index_collection([folder], index, workers=1)
+        index.compact()
+        with open(index_file) as f:
+            self.assertEqual(len(f.readlines()), 2)
+        self.assertEqual(len({entry[0] for entry in HashIndex(index_file)}), 1)
+
+        # a change within the same second is still seen
+        stat = os.stat(changed)
+        os.utime(changed, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+        self.assertFalse(HashIndex(index_file).is_current(changed))
+
+    def test_module(self):
+        """ Tests near-duplicates are reported for a folder """
+        folder = os.path.join(self.test_dir, "images")
+        os.mkdir(folder)
+        for filename in (self.one_strip, self.lzw, self.reverse):
+            shutil.copy(filename, folder)
+
+        args = Namespace(files=[folder], distance=4, workers=1)
+        records = list(dedupe.module.run(args).records)
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["distance"], 0)
+        self.assertEqual({os.path.basename(records[0]["file1"]), os.path.basename(records[0]["file2"])},
+                         {"t_one_strip.tiff", "t_one_strip_compressed_lzw.tiff"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+from argparse import Namespace
+
+import numpy as np
+
+from tifinity.actions.checksum import Checksum
+from tifinity.actions.defrag import defrag_file, layout_score
+from tifinity.actions.pyramid import Pyramid
+from tifinity.actions.validate import validate_file
+from tifinity.modules import defrag
+from tifinity.parser.tiff import Tiff
+
+
+class TestModuleDefrag(unittest.TestCase):
+    """ Tests relating to the defrag module
+
+    Tests:
+    * Layout score of out of order strips
+    * IFDs after the image data cost a single seek, whatever the number of strips
+    * Rewritten files have IFDs first and contiguous strips, with unchanged images
+    * Tiled SubIFDs are relocated
+    * Files scoring above the threshold, or with structural errors, are not rewritten
+    """
+
+    reverse_file = './resources/t_two_strips_seq_reverse/t_two_strips_seq_reverse.tiff'
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.output = os.path.join(self.test_dir, "defrag.tif")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def assertSameImages(self, file1, file2):
+        self.assertEqual(Checksum.checksum(Tiff(file1))["images"], Checksum.checksum(Tiff(file2))["images"])
+
+    def test_reverse_strips(self):
+        """ Tests scoring and rewriting a file with strips in reverse order """
+        before = layout_score(self.reverse_file)
+        self.assertEqual((before["strips"], before["contiguous"], before["backward"]), (2, 0, 1))
+        self.assertFalse(before["ifds_first"])
+        self.assertAlmostEqual(before["score"], 1 / 3)         # the IFD and both strips need seeks
+
+        record = defrag_file(self.reverse_file, self.output)
+        self.assertEqual(record["output"], self.output)
+        self.assertEqual(record["new_score"], 1.0)
+        self.assertEqual(validate_file(self.output), [])
+        self.assertSameImages(self.reverse_file, self.output)
+
+    def test_ifds_last(self):
+        """ Tests an IFD after the image data costs a single seek: a one strip file scores 0.5, and many contiguous
+            strips score close to 1 """
+        single = layout_score('./resources/t_one_strip/t_one_strip.tiff')
+        self.assertFalse(single["ifds_first"])
+        self.assertEqual(single["score"], 0.5)
+
+        image = np.arange(64 * 16, dtype='uint8').reshape(64, 16)
+        source = Tiff()
+        source.add_image(image)
+        many_file = os.path.join(self.test_dir, "many.tif")
+        source.save_tiff(many_file, strip_size=16)                    # 64 contiguous strips
+        many = layout_score(many_file)
+        self.assertEqual(many["contiguous"], 63)
+        self.assertGreater(many["score"], 0.95)
+        self.assertGreater(many["score"], single["score"])
+
+    def test_sub_ifds(self):
+        """ Tests rewriting a tiled pyramid with reduced resolution images as SubIFDs """
+        image = np.random.randint(0, 256, size=(100, 90, 3), dtype='uint8')
+        source = Tiff()
+        source.add_image(image)
+        pyramid_file = os.path.join(self.test_dir, "pyramid.tif")
+        Pyramid.create(source, tile_size=32).save_tiff(pyramid_file)
+        self.assertLess(layout_score(pyramid_file)["score"], 1.0)
+
+        record = defrag_file(pyramid_file, self.output)
+        self.assertEqual(record["new_score"], 1.0)
+        self.assertEqual(validate_file(self.output), [])
+        main = Tiff(self.output).ifds[0]
+        self.assertEqual(len(main.sub_ifds), 2)
+        self.assertTrue(np.array_equal(main.pixels(), image))
+        expected = Tiff(pyramid_file).ifds[0]
+        for sub_ifd, expected_ifd in zip(main.sub_ifds, expected.sub_ifds):
+            self.assertTrue(np.array_equal(sub_ifd.pixels(), expected_ifd.pixels()))
+
+    def test_not_rewritten(self):
+        """ Tests that files above the threshold, or with structural errors, are only scored """
+        record = defrag.module.run(Namespace(file=self.reverse_file, threshold=0.0, output=self.output)).records
+        record = list(record)[0]
+        self.assertIsNone(record["output"])
+        self.assertFalse(os.path.exists(self.output))
+
+        record = defrag_file('./resources/t_one_strip_big_endian/t_one_strip_big_endian.tiff', self.output)
+        self.assertIsNone(record["output"])
+        self.assertTrue(record["error"].startswith("1 structural errors"))
+
+
+if __name__ == '__main__':
+    unittest.main()
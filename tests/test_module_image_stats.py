@@ -0,0 +1,71 @@
+import json
+import os
+import unittest
+from argparse import Namespace
+
+import numpy as np
+
+from tifinity.actions.stats import ImageStatistics
+from tifinity.modules import image_stats
+from tifinity.parser.tiff import Tiff
+
+
+class TestModuleImageStats(unittest.TestCase):
+    """ Tests relating to the image_stats module
+
+    Tests:
+    * Statistics match those calculated over the whole image
+    * Statistics of strips read from the file match those of the loaded image
+    * Histograms count every sample
+    * Subsampled statistics only use the sampled pixels
+    """
+
+    @staticmethod
+    def _resource(res_path):
+        return os.path.join("./resources", res_path, res_path + ".tiff")
+
+    def _stats(self, res_path, bins=256, subsample=1):
+        args = Namespace(file=self._resource(res_path), bins=bins, subsample=subsample, histogram=True, json=True)
+        return json.loads(image_stats.module.process_cli(args))["images"]
+
+    def test_statistics(self):
+        """ Tests that strip-wise statistics equal those of the whole image """
+        res_path = "t_two_strips_seq"
+        rgb = Tiff(self._resource(res_path)).ifds[0].pixels().reshape(-1, 3)
+        channels = self._stats(res_path)[0]["channels"]
+
+        for c in range(3):
+            self.assertEqual(channels[c]["min"], rgb[:, c].min())
+            self.assertEqual(channels[c]["max"], rgb[:, c].max())
+            self.assertAlmostEqual(channels[c]["mean"], rgb[:, c].mean())
+            self.assertAlmostEqual(channels[c]["std"], rgb[:, c].std())
+            self.assertAlmostEqual(channels[c]["clipped_high"], np.mean(rgb[:, c] == 255))
+
+    def test_strip_views(self):
+        """ Tests statistics of a header-only Tiff, from strips read from the file, match the loaded image's """
+        res_path = "t_two_strips_non_seq_reverse"
+        loaded = ImageStatistics.calculate(Tiff(self._resource(res_path)).ifds[0], bins=16)
+        tiff = Tiff(self._resource(res_path), images=False)
+        viewed = ImageStatistics.calculate(tiff.ifds[0], bins=16, strips=tiff.strip_views(tiff.ifds[0]))
+        self.assertIsNone(tiff.ifds[0].img_data)
+        self.assertEqual(viewed.channels(histogram=True), loaded.channels(histogram=True))
+
+    def test_histogram(self):
+        """ Tests that histograms are folded into the requested number of bins and count every sample """
+        channels = self._stats("t_one_strip", bins=16)[0]["channels"]
+        for channel in channels:
+            self.assertEqual(len(channel["histogram"]), 16)
+            self.assertEqual(sum(channel["histogram"]), 100)
+
+    def test_subsample(self):
+        """ Tests that subsampling uses one pixel per block """
+        res_path = "t_two_strips_non_seq_reverse"
+        rgb = Tiff(self._resource(res_path)).ifds[0].pixels()[::3, ::3].reshape(-1, 3)
+        channels = self._stats(res_path, subsample=3)[0]["channels"]
+
+        self.assertEqual(channels[0]["count"], 16)
+        self.assertAlmostEqual(channels[1]["mean"], rgb[:, 1].mean())
+
+
+if __name__ == '__main__':
+    unittest.main()
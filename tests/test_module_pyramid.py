@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+from argparse import Namespace
+
+import numpy as np
+
+from tifinity.actions.pyramid import Pyramid
+from tifinity.modules import pyramid
+from tifinity.parser.tiff import Tiff
+
+
+class TestModulePyramid(unittest.TestCase):
+    """ Tests relating to the pyramid module
+
+    Tests:
+    * Each level is the 2x2 box average of the previous level, including odd edges
+    * Tiled SubIFD and chained layouts are written and read back
+    * Pyramid TIFF is written by the module
+    """
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _create_tiff(self, image):
+        tiff = Tiff()
+        tiff.add_image(image)
+        path = os.path.join(self.test_dir, "source.tif")
+        tiff.save_tiff(path, strip_size=(image.nbytes // image.shape[0]) * 5)   # 5 rows per strip
+        return path
+
+    def test_levels(self):
+        """ Tests the size and content of each level, built from odd sized strips of a header-only Tiff """
+        image = np.random.randint(0, 256, size=(101, 77, 3), dtype='uint8')
+        source = Tiff(self._create_tiff(image), images=False)
+        levels = Pyramid.create(source, tile_size=32, threads=2)
+        main = levels.ifds[0]
+        self.assertIsNone(source.ifds[0].img_data)                  # read strip by strip from the file
+
+        self.assertEqual(Pyramid.level_sizes(77, 101, 32), [(77, 101), (39, 51), (20, 26)])
+        self.assertTrue(np.array_equal(main.pixels(), image))
+        self.assertEqual([ifd.get_tag_value(254)[0] for ifd in [main] + main.sub_ifds], [0, 1, 1])
+
+        # odd final rows and columns are averaged with themselves
+        edged = np.concatenate([image, image[-1:]]).astype('float64')
+        edged = np.concatenate([edged, edged[:, -1:]], axis=1)
+        expected = np.rint(edged.reshape(51, 2, 39, 2, 3).mean(axis=(1, 3))).astype('uint8')
+        self.assertTrue(np.array_equal(main.sub_ifds[0].pixels(), expected))
+
+    def test_layouts(self):
+        """ Tests that tiled SubIFD and chained pyramids are saved and read back """
+        image = np.random.randint(0, 65536, size=(70, 50), dtype='uint16')
+        source = self._create_tiff(image)
+
+        for layout in ("subifd", "chained"):
+            path = os.path.join(self.test_dir, layout + ".tif")
+            Pyramid.create(Tiff(source), tile_size=16, layout=layout, compression_type="lzw", predictor=2) \
+                .save_tiff(path)
+
+            tiff = Tiff(path)
+            main = tiff.ifds[0]
+            reduced = main.sub_ifds if layout == "subifd" else tiff.ifds[1:]
+            self.assertTrue(main.is_tiled())
+            self.assertEqual(main.get_tile_size(), (16, 16))
+            self.assertTrue(np.array_equal(main.pixels()[:, :, 0], image))
+            self.assertEqual([(ifd.get_image_width(), ifd.get_image_height()) for ifd in reduced],
+                             [(25, 35), (13, 18), (7, 9)])
+
+    def test_module_output(self):
+        """ Tests that the module writes a pyramid TIFF """
+        res_path = "t_two_strips_seq"
+        args = Namespace(file=os.path.join("./resources", res_path, res_path + ".tiff"), tile_size=16,
+                         layout="chained", compression="deflate", output=self.test_dir)
+        pyramid.module.process_cli(args)
+
+        tiff = Tiff(os.path.join(self.test_dir, res_path + ".tiff.pyramid.tif"))
+        self.assertTrue(all(ifd.is_tiled() for ifd in tiff.ifds))
+        self.assertEqual(tiff.ifds[0].get_compression(), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
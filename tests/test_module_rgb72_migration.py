@@ -6,6 +6,8 @@ import tempfile
 import unittest
 from argparse import Namespace
 
+import numpy as np
+
 from tifinity.modules import rgb72_migration
 from tifinity.parser.tiff import Tiff
 
@@ -72,6 +74,30 @@ class TestModuleRgb72Migration(unittest.TestCase):
         # check the checksums are correct
         self.assertEqual(to_js["md5"]["images"][0], migratedTiff_img_cs)
 
+    def test_planar_separate(self):
+        """Tests the conversion of a TIFF with each channel in its own plane gives the same pixels, chunky"""
+        from_res_path = "stripes_one_strip_rgb72"
+        from_file = os.path.join("./resources", from_res_path, from_res_path + ".tif")
+
+        # rewrite the image with separate planes: one strip per channel
+        tiff = Tiff(from_file)
+        ifd = tiff.ifds[0]
+        height, width = ifd.get_image_height(), ifd.get_image_width()
+        planes = ifd.img_data[:height * width * 9].reshape(height, width, 3, 3).transpose(2, 0, 1, 3)
+        ifd.set_tag("PlanarConfiguration", 3, [2])
+        ifd.set_strips([np.ascontiguousarray(plane).reshape(-1) for plane in planes], height)
+        planar_file = os.path.join(self.test_dir, "planar.tif")
+        tiff.save_tiff(planar_file)
+
+        args = Namespace(path=[from_file, planar_file], output=self.test_dir)
+        rgb72_migration.module.process_cli(args)
+
+        expected = Tiff(os.path.join(self.test_dir, from_res_path + ".tif.conv.tif")).ifds[0]
+        migrated = Tiff(os.path.join(self.test_dir, "planar.tif.conv.tif")).ifds[0]
+        self.assertEqual(migrated.get_planar_configuration(), 1)
+        self.assertEqual(len(migrated.get_strips()), 1)
+        self.assertTrue(np.array_equal(migrated.pixels(), expected.pixels()))
+
 
 if __name__ == '__main__':
     unittest.main()
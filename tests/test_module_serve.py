@@ -0,0 +1,65 @@
+import io
+import json
+import os
+import unittest
+
+from tifinity.__main__ import remove_option
+from tifinity.actions.server import TifinityServer, run_job
+
+
+class TestModuleServe(unittest.TestCase):
+    """ Tests relating to the serve module
+
+    Tests:
+    * Jobs run with the same semantics as the command line, capturing output and exit status
+    * Streams of JSON line jobs are run in the worker pool, with results returned by id
+    * The --server option is removed from command lines sent to the server
+    """
+
+    def setUp(self):
+        res_path = "t_one_strip"
+        self.file = os.path.join("./resources", res_path, res_path + ".tiff")
+
+    def test_run_job(self):
+        """ Tests that a job produces the same output as the module, and reports usage errors """
+        result = run_job({"id": "a", "module": "checksum", "args": ["--json", "-a", "md5", self.file]})
+        self.assertEqual(result["id"], "a")
+        self.assertEqual(result["status"], 0)
+        self.assertEqual(json.loads(result["output"]), json.loads(result["result"]))
+
+        result = run_job({"argv": ["checksum"]})
+        self.assertEqual(result["status"], 2)
+        self.assertIn("required", result["errors"])
+
+        result = run_job({"argv": ["checksum", "missing.tif"]})
+        self.assertEqual(result["status"], 1)
+
+        result = run_job({"argv": ["checksum", os.path.basename(self.file)], "cwd": os.path.dirname(self.file)})
+        self.assertEqual(result["status"], 0)
+
+    def test_serve_stream(self):
+        """ Tests that each job read from a stream has its result written """
+        jobs = [{"id": i, "argv": ["checksum", "--json", self.file]} for i in range(4)]
+        in_stream = io.StringIO("\n".join(json.dumps(job) for job in jobs) + "\nnot json\n")
+        out_stream = io.StringIO()
+
+        server = TifinityServer(workers=2)
+        try:
+            self.assertEqual(server.serve_stream(in_stream, out_stream), 5)
+        finally:
+            server.shutdown()
+
+        results = [json.loads(line) for line in out_stream.getvalue().splitlines()]
+        self.assertEqual(sorted(r["id"] for r in results if r["status"] == 0), [0, 1, 2, 3])
+        self.assertEqual(len(set(r["output"] for r in results if r["status"] == 0)), 1)
+        self.assertEqual([r["status"] for r in results if r["id"] is None], [2])
+
+    def test_remove_option(self):
+        """ Tests removal of the --server option and its value """
+        self.assertEqual(remove_option(["--server", "s", "checksum", "f"], "--server"), ["checksum", "f"])
+        self.assertEqual(remove_option(["--server=s", "--threads", "2", "stats"], "--server"),
+                         ["--threads", "2", "stats"])
+
+
+if __name__ == '__main__':
+    unittest.main()
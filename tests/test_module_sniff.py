@@ -0,0 +1,92 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from argparse import Namespace
+
+from tifinity.actions.sniff import BIGTIFF, NOT_TIFF, TIFF, sniff_file
+from tifinity.modules import sniff
+from tifinity.parser.tiff import Tiff
+
+
+class TestModuleSniff(unittest.TestCase):
+    """ Tests relating to the sniff module
+
+    Tests:
+    * TIFF properties read from the header and first IFD match those parsed
+    * Non-TIFFs, BigTIFFs and truncated files are classified
+    * Corrupt value counts are reported as errors without being read
+    * Every file in a folder is classified, or only TIFFs
+    """
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _write(self, name, data):
+        path = os.path.join(self.test_dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_tiff_properties(self):
+        """ Tests the sniffed properties of TIFFs match those of the parsed files """
+        for res_path in ("t_two_subfiles_one_strip", "t_one_strip_compressed_lzw", "t_one_strip_bilevel"):
+            filename = os.path.join("./resources", res_path, res_path + ".tiff")
+            record = sniff_file(filename)
+            tiff = Tiff(filename)
+            ifd = tiff.ifds[0]
+            self.assertEqual(record["kind"], TIFF)
+            self.assertEqual(record["byte_order"], tiff.byteOrder)
+            self.assertEqual(record["pages"], len(tiff.ifds))
+            self.assertEqual((record["width"], record["height"]), (ifd.get_image_width(), ifd.get_image_height()))
+            self.assertEqual(record["bits_per_sample"], ifd.get_bits_per_sample())
+            self.assertEqual(record["compression"], ifd.get_compression())
+            self.assertEqual(record["layout"], "striped")
+
+    def test_other_files(self):
+        """ Tests files which are not TIFFs, BigTIFFs and truncated TIFFs are classified """
+        self.assertEqual(sniff_file(self._write("a.txt", b"not a tiff at all"))["kind"], NOT_TIFF)
+        self.assertEqual(sniff_file(self._write("empty.tif", b""))["kind"], NOT_TIFF)
+        self.assertEqual(sniff_file(self._write("big.tif", b"II+\x00\x08\x00\x00\x00"))["kind"], BIGTIFF)
+        truncated = sniff_file(self._write("truncated.tif", b"II*\x00\x08\x00\x00\x00\x05\x00"))
+        self.assertEqual(truncated["kind"], "error")
+        self.assertIsNotNone(truncated["error"])
+
+    def test_huge_count(self):
+        """ Tests a corrupt (huge) value count is an error, rather than allocating or reading the values """
+        entries = [(256, 3, 1, 8), (257, 3, 1, 8), (258, 3, 3, 8), (277, 3, 0xFFFFFFF0, 8)]
+        data = b"II*\x00\x08\x00\x00\x00" + struct.pack("<H", len(entries)) + \
+            b"".join(struct.pack("<HHII", *entry) for entry in entries) + b"\x00" * 4
+        record = sniff_file(self._write("huge.tif", data))
+        self.assertEqual(record["kind"], "error")
+        self.assertIn("past the end of the file", record["error"])
+
+        # BitsPerSample is only read for the number of samples
+        entries = [(256, 3, 1, 8), (257, 3, 1, 8), (258, 3, 1000, 62), (277, 3, 1, 3)]
+        data = b"II*\x00\x08\x00\x00\x00" + struct.pack("<H", len(entries)) + \
+            b"".join(struct.pack("<HHII", *entry) for entry in entries) + b"\x00" * 4 + b"\x08\x00" * 1000
+        record = sniff_file(self._write("bits.tif", data))
+        self.assertEqual(record["kind"], "tiff")
+        self.assertEqual((record["samples"], record["bits_per_sample"]), (3, [8, 8, 8]))
+
+    def test_module(self):
+        """ Tests every file of a folder is classified, or only the TIFFs """
+        shutil.copy('./resources/t_one_strip/t_one_strip.tiff', os.path.join(self.test_dir, "image.dat"))
+        self._write("notes.tif", b"text")
+
+        records = list(sniff.module.run(Namespace(paths=[self.test_dir], workers=1)).records)
+        self.assertEqual([(os.path.basename(r["file"]), r["kind"]) for r in records],
+                         [("image.dat", TIFF), ("notes.tif", NOT_TIFF)])
+
+        records = list(sniff.module.run(Namespace(paths=[self.test_dir], workers=1, tiffs_only=True)).records)
+        self.assertEqual(len(records), 1)
+        records = list(sniff.module.run(Namespace(paths=[self.test_dir], workers=1, by_extension=True)).records)
+        self.assertEqual([os.path.basename(r["file"]) for r in records], ["notes.tif"])
+
+
+if __name__ == '__main__':
+    unittest.main()
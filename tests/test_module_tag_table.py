@@ -0,0 +1,85 @@
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+from argparse import Namespace
+
+import numpy as np
+
+from tifinity.actions.collection import TagTable, find_tiffs
+from tifinity.modules import tiff_details
+from tifinity.parser.tiff import Directory, Tiff
+
+
+class TestModuleTagTable(unittest.TestCase):
+    """ Tests relating to the show_tags collection (table) mode
+
+    Tests:
+    * Header-only parsing reads IFDs but no image data
+    * Table has one row per IFD of each TIFF in a folder, with typed values
+    * Files which cannot be parsed give a row with the error
+    * Text tags are decoded from byte values, and text tags with other values are not given their column
+    """
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        shutil.copy("./resources/t_one_strip/t_one_strip.tiff", self.test_dir)
+        shutil.copy("./resources/t_two_subfiles_one_strip/t_two_subfiles_one_strip.tiff",
+                    os.path.join(self.test_dir, "two.tif"))
+        os.mkdir(os.path.join(self.test_dir, "sub"))
+        with open(os.path.join(self.test_dir, "sub", "broken.tif"), "w") as f:
+            f.write("not a tiff")
+        with open(os.path.join(self.test_dir, "notes.txt"), "w") as f:
+            f.write("not a tiff either")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_header_only(self):
+        """ Tests that header-only parsing reads the tags but not the image data """
+        tiff = Tiff("./resources/t_one_strip/t_one_strip.tiff", images=False)
+        self.assertEqual(tiff.ifds[0].get_image_width(), 10)
+        self.assertIsNone(tiff.ifds[0].img_data)
+
+    def test_table(self):
+        """ Tests the rows and typed values of a table of a folder """
+        output = os.path.join(self.test_dir, "tags.csv")
+        args = Namespace(file=self.test_dir, tags=None, table=output, workers=2)
+        tiff_details.module.process_cli(args)
+
+        self.assertEqual(len(list(find_tiffs([self.test_dir]))), 3)
+        with open(output, newline="") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual([os.path.basename(row["file"]) for row in rows],
+                         ["t_one_strip.tiff", "two.tif", "two.tif", "broken.tif"])
+        self.assertEqual([row["ifd"] for row in rows], ["0", "0", "1", ""])
+        self.assertEqual(rows[0]["ImageWidth"], "10")
+        self.assertEqual(rows[0]["BitsPerSample"], "[8, 8, 8]")
+        self.assertEqual(rows[0]["XResolution"], "72.0")
+        self.assertEqual(rows[0]["ImageDescription"], "Created with GIMP")
+        self.assertTrue(rows[3]["error"].startswith("InvalidTiffError"))
+        self.assertNotIn("StripOffsets", rows[0])
+
+    def test_selected_tags(self):
+        """ Tests that unselected tags are written to the other_tags column """
+        table = TagTable([256, 257])
+        rows = table.rows("./resources/t_one_strip/t_one_strip.tiff")
+        self.assertEqual(table.columns, ["file", "ifd", "offset", "error", "ImageWidth", "ImageLength", "other_tags"])
+        self.assertEqual(rows[0]["ImageLength"], 10)
+        self.assertIn('"270": "Created with GIMP"', rows[0]["other_tags"])
+
+    def test_text_tags(self):
+        """ Tests that text tags stored as bytes are decoded, and those with numeric values are not column values """
+        xmp = Directory(700, 1, 6, np.frombuffer(b"<x:x/>", dtype=np.uint8), True)
+        self.assertEqual(TagTable.typed_value(xmp), "<x:x/>")
+        software = Directory(305, 3, 2, np.array([1, 2], dtype=np.int64), True)
+        value = TagTable.typed_value(software)
+        self.assertEqual(value, [1, 2])
+        self.assertFalse(TagTable._fits(305, value))
+        self.assertTrue(TagTable._fits(305, "GIMP"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+from argparse import Namespace
+
+import numpy as np
+
+from tifinity.actions.thumbnail import Thumbnail
+from tifinity.modules import thumbnail
+from tifinity.parser.tiff import Tiff
+
+
+class TestModuleThumbnail(unittest.TestCase):
+    """ Tests relating to the thumbnail module
+
+    Tests:
+    * Thumbnail of a multi-strip image equals the block means of the full image
+    * Reduced-resolution images are used as the source when large enough
+    * Thumbnail TIFF is written by the module
+    """
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _create_tiff(self, image, reduced=None):
+        tiff = Tiff()
+        tiff.add_image(image)
+        if reduced is not None:
+            tiff.add_image(reduced, subfile_type=1)
+        path = os.path.join(self.test_dir, "source.tif")
+        tiff.save_tiff(path, strip_size=image.shape[1] * image.shape[2] * 3)   # 3 rows per strip
+        return path
+
+    def test_box_filter(self):
+        """ Tests that the strip-wise thumbnail equals the block means of the whole image, whether or not the image
+            was read """
+        image = np.random.randint(0, 256, size=(40, 24, 3), dtype='uint8')
+        expected = np.rint(image.reshape(10, 4, 6, 4, 3).mean(axis=(1, 3))).astype('uint8')
+        for images in (True, False):
+            thumb = Thumbnail.create(Tiff(self._create_tiff(image), images=images), size=10, threads=2)
+            self.assertTrue(np.array_equal(thumb.ifds[0].pixels(), expected))
+
+    def test_reduced_resolution_source(self):
+        """ Tests that a large enough reduced-resolution image is used in preference to the main image """
+        image = np.zeros((40, 24, 3), dtype='uint8')
+        reduced = np.full((20, 12, 3), 200, dtype='uint8')
+        tiff = Tiff(self._create_tiff(image, reduced))
+
+        self.assertEqual(Thumbnail.select_ifd(tiff, 20).get_image_width(), 12)
+        self.assertEqual(Thumbnail.select_ifd(tiff, 30).get_image_width(), 24)
+        self.assertTrue(np.all(Thumbnail.create(tiff, size=10).ifds[0].pixels() == 200))
+
+        # header-only parsing: the reduced image's strips are read from the file, and the main image is not read
+        tiff = Tiff(self._create_tiff(image, reduced), images=False)
+        self.assertTrue(np.all(Thumbnail.create(tiff, size=10).ifds[0].pixels() == 200))
+        self.assertTrue(all(ifd.img_data is None for ifd in tiff.ifds))
+
+    def test_module_output(self):
+        """ Tests that the module writes a thumbnail TIFF """
+        res_path = "t_two_strips_seq"
+        args = Namespace(file=os.path.join("./resources", res_path, res_path + ".tiff"), size=5,
+                         compression="lzw", output=self.test_dir)
+        thumbnail.module.process_cli(args)
+
+        thumb = Tiff(os.path.join(self.test_dir, res_path + ".tiff.thumb.tif")).ifds[0]
+        self.assertEqual((thumb.get_image_width(), thumb.get_image_height()), (5, 5))
+        self.assertEqual(thumb.get_compression(), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from argparse import Namespace
+
+import numpy as np
+
+from tifinity.actions.validate import check_extents, Extent, validate_file
+from tifinity.modules import validate
+from tifinity.parser.tiff import Tiff
+
+
+class TestModuleValidate(unittest.TestCase):
+    """ Tests relating to the structural validation of TIFFs
+
+    Tests:
+    * Well formed files are valid
+    * Strips past the end of the file, overlapping strips and IFD loops are reported as errors
+    * Offset tags with non-integer types are reported as errors
+    * Gaps are found by sweeping the sorted extents
+    * Folders are validated file by file
+    """
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.file = os.path.join(self.test_dir, "strips.tif")
+        tiff = Tiff()
+        tiff.add_image(np.arange(64 * 16, dtype='uint8').reshape(64, 16))
+        tiff.save_tiff(self.file, strip_size=256)          # 4 strips of 16 rows
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def patch(self, tag, values):
+        """Overwrites the (long) values of a tag of the first IFD of the test file"""
+        directory = Tiff(self.file, images=False).ifds[0].directories[tag]
+        with open(self.file, "r+b") as f:
+            f.seek(directory.value_offset)
+            f.write(struct.pack("<{0}I".format(len(values)), *values))
+
+    def issues(self, **kwargs):
+        return [(i["severity"], i["issue"]) for i in validate_file(self.file, **kwargs)]
+
+    def test_valid(self):
+        """ Tests that saved and well formed files have no issues """
+        self.assertEqual(self.issues(), [])
+        records = list(validate.module.run(Namespace(file="./resources/t_one_strip/t_one_strip.tiff")).records)
+        self.assertEqual([r["issue"] for r in records], ["valid"])
+
+    def test_errors(self):
+        """ Tests that strips past the end of the file and overlapping strips are reported """
+        offsets = Tiff(self.file, images=False).ifds[0].get_strip_offsets().tolist()
+        self.patch(273, [offsets[0], offsets[0] + 100, offsets[2], os.path.getsize(self.file) - 10])
+        self.assertEqual(self.issues(), [("error", "overlap"), ("warning", "gap"), ("warning", "gap"),
+                                         ("error", "out_of_bounds")])      # strips 1 and 3 moved, leaving gaps
+
+        self.patch(273, [offsets[0]] * 4)
+        self.assertEqual(self.issues(), [("warning", "shared")] * 3 + [("warning", "gap")])
+        self.assertEqual(self.issues(min_gap=10 ** 6), [("warning", "shared")] * 3)
+
+    def test_ifd_loop(self):
+        """ Tests that an IFD pointing back to itself is reported, rather than followed """
+        ifd = Tiff(self.file, images=False).ifds[0]
+        with open(self.file, "r+b") as f:
+            f.seek(ifd.offset + 2 + ifd.numtags * 12)
+            f.write(struct.pack("<I", ifd.offset))
+        issues = validate_file(self.file)
+        self.assertEqual([i["issue"] for i in issues], ["ifd_loop"])
+        self.assertEqual(issues[0]["description"], "IFD 0 points to IFD 0 at offset {0}".format(ifd.offset))
+
+    def test_invalid_type(self):
+        """ Tests that a StripOffsets tag of RATIONAL type is reported, rather than failing validation """
+        ifd = Tiff(self.file, images=False).ifds[0]
+        with open(self.file, "r+b") as f:
+            for i in range(ifd.numtags):
+                f.seek(ifd.offset + 2 + i * 12)
+                if struct.unpack("<H", f.read(2))[0] == 273:
+                    f.write(struct.pack("<H", 5))
+        issues = validate_file(self.file)
+        self.assertIn(("error", "invalid_type"), [(i["severity"], i["issue"]) for i in issues])
+        self.assertIn("StripOffsets has type 5", [i for i in issues if i["issue"] == "invalid_type"][0]["description"])
+
+    def test_check_extents(self):
+        """ Tests the sweep over sorted extents """
+        extents = [Extent(50, 60, "value", "c"), Extent(0, 10, "header", "a"), Extent(5, 20, "ifd", "b"),
+                   Extent(8, 12, "strip", "d")]
+        issues = check_extents(extents, 70)
+        self.assertEqual([(i["issue"], i["start"], i["end"]) for i in issues],
+                         [("overlap", 5, 10), ("overlap", 8, 12), ("gap", 20, 50), ("gap", 60, 70)])
+        self.assertEqual(issues[1]["description"], "d overlaps b")
+
+    def test_folder(self):
+        """ Tests validating a folder, including a file which is not a TIFF """
+        with open(os.path.join(self.test_dir, "broken.tif"), "w") as f:
+            f.write("not a tiff")
+        args = Namespace(file=self.test_dir, workers=2, errors_only=True, min_gap=2)
+        records = list(validate.module.run(args).records)
+        self.assertEqual([(os.path.basename(r["file"]), r["issue"]) for r in records],
+                         [("broken.tif", "invalid_header"), ("strips.tif", "valid")])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from tifinity.actions.checksum import Checksum
+from tifinity.actions.pyramid import Pyramid
+from tifinity.parser import parse_index
+from tifinity.parser.tiff import Tiff
+
+
+class TestParseIndex(unittest.TestCase):
+    """ Tests relating to sidecar parse indexes
+
+    Tests:
+    * Indexed files load with the same tags, IFD bytes and images as parsed files
+    * Stale indexes (the file changed) are ignored and rewritten
+    * Truncated and incomplete indexes are ignored and rewritten
+    * SubIFDs are restored from the index
+    """
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _copy(self, filename):
+        path = os.path.join(self.test_dir, os.path.basename(filename))
+        shutil.copy(filename, path)
+        return path
+
+    def assertSameIfds(self, expected, actual):
+        self.assertEqual(len(expected), len(actual))
+        for ifd, indexed in zip(expected, actual):
+            self.assertEqual((ifd.offset, ifd.numtags, ifd.nextifd), (indexed.offset, indexed.numtags, indexed.nextifd))
+            self.assertEqual(bytes(ifd.ifd_data), bytes(indexed.ifd_data))
+            self.assertEqual(list(ifd.directories), list(indexed.directories))
+            for tag, directory in ifd.directories.items():
+                other = indexed.directories[tag]
+                self.assertEqual((directory.type, directory.count, directory.value_offset, directory.type_valid),
+                                 (other.type, other.count, other.value_offset, other.type_valid))
+                self.assertEqual(np.asarray(directory.value).dtype, other.value.dtype)
+                self.assertTrue(np.array_equal(directory.value, other.value))
+            self.assertSameIfds(ifd.sub_ifds, indexed.sub_ifds)
+
+    def test_round_trip(self):
+        """ Tests files loaded from their index match the parsed files """
+        for res_path in ("t_two_subfiles_one_strip", "t_one_strip_with_exif", "t_one_strip_big_endian"):
+            filename = self._copy(os.path.join("./resources", res_path, res_path + ".tiff"))
+            parsed = Tiff(filename, index=True)
+            self.assertTrue(os.path.exists(parse_index.sidecar_name(filename)))
+            indexed = Tiff(filename, index=True)
+            self.assertIsNotNone(parse_index.read_index(filename))
+            self.assertEqual(indexed.byteOrder, parsed.byteOrder)
+            self.assertSameIfds(parsed.ifds, indexed.ifds)
+            self.assertEqual(Checksum.checksum(indexed), Checksum.checksum(parsed))
+
+    def test_stale_index(self):
+        """ Tests an index is not used once the file has changed, and is rewritten """
+        filename = self._copy('./resources/t_one_strip/t_one_strip.tiff')
+        index_file = os.path.join(self.test_dir, "t_one_strip.idx")
+        Tiff(filename, index=index_file)
+        self.assertIsNotNone(parse_index.read_index(filename, index_file))
+
+        shutil.copy('./resources/t_two_subfiles_one_strip/t_two_subfiles_one_strip.tiff', filename)
+        self.assertIsNone(parse_index.read_index(filename, index_file))
+        tiff = Tiff(filename, index=index_file)
+        self.assertEqual(len(tiff.ifds), 2)
+        self.assertEqual(len(parse_index.read_index(filename, index_file)[1]), 2)
+
+    def test_corrupt_index(self):
+        """ Tests a truncated index, and an index missing an array, are ignored in favour of parsing the file """
+        filename = self._copy('./resources/t_two_subfiles_one_strip/t_two_subfiles_one_strip.tiff')
+        index_file = parse_index.sidecar_name(filename)
+        expected = Checksum.checksum(Tiff(filename, index=True))
+        with open(index_file, 'rb') as f:
+            data = f.read()
+
+        with open(index_file, 'wb') as f:
+            f.write(data[:len(data) // 2])
+        self.assertIsNone(parse_index.read_index(filename))
+        self.assertEqual(Checksum.checksum(Tiff(filename, index=True)), expected)
+        self.assertIsNotNone(parse_index.read_index(filename))          # rewritten
+
+        with np.load(index_file) as npz:
+            arrays = {name: npz[name] for name in npz.files if name != "dirs"}
+        with open(index_file, 'wb') as f:
+            np.savez(f, **arrays)
+        self.assertIsNone(parse_index.read_index(filename))
+        self.assertEqual(Checksum.checksum(Tiff(filename, index=True)), expected)
+
+    def test_sub_ifds(self):
+        """ Tests SubIFDs of a pyramid are restored from the index, with their images """
+        image = np.arange(100 * 80 * 3, dtype='uint8').reshape(100, 80, 3)
+        source = Tiff()
+        source.add_image(image)
+        filename = os.path.join(self.test_dir, "pyramid.tif")
+        Pyramid.create(source, tile_size=32).save_tiff(filename)
+
+        parsed = Tiff(filename, index=True)
+        indexed = Tiff(filename, index=True)
+        self.assertEqual(len(indexed.ifds[0].sub_ifds), 2)
+        self.assertSameIfds(parsed.ifds, indexed.ifds)
+        self.assertTrue(np.array_equal(indexed.ifds[0].pixels(), image))
+        self.assertEqual(Checksum.checksum(indexed), Checksum.checksum(parsed))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import unittest
+
+import numpy as np
+
+from tifinity.parser import pixels
+from tifinity.parser.tiff import Tiff
+
+
+class TestPixels(unittest.TestCase):
+    """ Tests relating to typed pixel views of image data.
+
+    Tests:
+    * Uncompressed 8 bit RGB image is a zero-copy view
+    * Strips reference in reverse order give the same pixels as sequential strips
+    * Compressed images are decoded to the same pixels
+    * Bilevel images are unpacked
+    * 24 bit floating point samples are converted to float32
+    * 12 bit and big-endian 16 bit samples
+    """
+
+    @staticmethod
+    def _resource(res_path, ext=".tiff"):
+        return os.path.join("./resources", res_path, res_path + ext)
+
+    def test_zero_copy_view(self):
+        """ Tests that an uncompressed 8 bit image is viewed, not copied """
+        ifd = Tiff(self._resource("t_one_strip")).ifds[0]
+        rgb = ifd.pixels()
+
+        self.assertEqual(rgb.shape, (10, 10, 3))
+        self.assertEqual(rgb.dtype, np.uint8)
+        self.assertTrue(np.shares_memory(rgb, ifd.img_data))
+
+    def test_strip_order(self):
+        """ Tests that the pixels of a strip are the corresponding rows of the full image """
+        ifd = Tiff(self._resource("t_two_strips_seq_reverse")).ifds[0]
+        rgb = ifd.pixels()
+
+        self.assertTrue(np.array_equal(ifd.strip_pixels(0), rgb[:5]))
+        self.assertTrue(np.array_equal(ifd.strip_pixels(1), rgb[5:]))
+
+    def test_compressed(self):
+        """ Tests that a compressed image gives the same pixels as an uncompressed one """
+        compressed = Tiff(self._resource("t_one_strip_compressed_lzw")).ifds[0].pixels()
+        uncompressed = Tiff(self._resource("t_one_strip")).ifds[0].pixels()
+        self.assertTrue(np.array_equal(compressed, uncompressed))
+
+    def test_bilevel(self):
+        """ Tests that a bilevel image is unpacked to one sample per pixel """
+        rgb = Tiff(self._resource("t_one_strip_bilevel")).ifds[0].pixels()
+        self.assertEqual(rgb.shape, (10, 10, 1))
+        self.assertTrue(set(np.unique(rgb)) <= {0, 1})
+
+    def test_float24(self):
+        """ Tests that 24 bit floating point samples equal the 32 bit migrated values """
+        rgb72 = Tiff(self._resource("stripes_one_strip_rgb72", ".tif")).ifds[0].pixels()
+        rgb96 = Tiff(self._resource("stripes_one_strip_rgb96", ".tif")).ifds[0].pixels()
+
+        self.assertEqual(rgb72.dtype, np.float32)
+        self.assertTrue(np.array_equal(rgb72, rgb96))
+
+    def test_unpack_12_and_16_bit(self):
+        """ Tests 12 bit unpacking and big-endian 16 bit views """
+        values = np.array([0xabc, 0x123, 0xfff, 0x000], dtype='uint16')
+        packed = np.array([0xab, 0xc1, 0x23, 0xff, 0xf0, 0x00], dtype='uint8')
+        unpacked = pixels.to_pixels(packed, 1, 2, 2, 12)
+        self.assertTrue(np.array_equal(unpacked.reshape(-1), values))
+
+        big = pixels.to_pixels(values.astype('>u2').view('uint8'), 2, 2, 1, 16, byteorder='big')
+        self.assertEqual(big.dtype, np.dtype('>u2'))
+        self.assertTrue(np.array_equal(big.reshape(-1), values))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import threading
+import unittest
+from functools import partial
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+
+from tifinity.actions.checksum import Checksum
+from tifinity.parser import sources
+from tifinity.parser.sources import BlockCache, FileSource, HttpSource, MemorySource
+from tifinity.parser.tiff import Tiff
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Serves files from a folder, supporting single Range requests"""
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if "Range" not in self.headers or not os.path.isfile(path):
+            return super().send_head()
+        start, end = self.headers["Range"].split("=")[1].split("-")
+        size = os.path.getsize(path)
+        start, end = int(start), min(int(end), size - 1)
+        f = open(path, 'rb')
+        f.seek(start)
+        self.send_response(206)
+        self.send_header("Content-Type", "image/tiff")
+        self.send_header("Content-Range", "bytes {0}-{1}/{2}".format(start, end, size))
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        self.range_length = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        if hasattr(self, "range_length"):
+            outputfile.write(source.read(self.range_length))
+        else:
+            super().copyfile(source, outputfile)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestSources(unittest.TestCase):
+    """ Tests relating to byte sources
+
+    Tests:
+    * Block cache reads match the source, fetching runs of missing blocks once
+    * Files are read with or without positioned reads (pread)
+    * TIFFs read over HTTP with Range requests match the local file
+    * Header-only parsing over HTTP fetches only the header area
+    """
+
+    res_path = "./resources/t_two_subfiles_one_strip"
+    file = "t_two_subfiles_one_strip.tiff"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(("127.0.0.1", 0), partial(RangeRequestHandler, directory=cls.res_path))
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = "http://127.0.0.1:{0}/{1}".format(cls.server.server_port, cls.file)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_block_cache(self):
+        """ Tests cached reads return the same bytes as the source, reading each block once """
+        data = bytes(range(256)) * 40
+        cache = BlockCache(MemorySource(data), block_size=100, max_blocks=8)
+        for offset, size in [(0, 8), (4, 4), (95, 10), (150, 200), (10000, 500), (5000, 900), (10230, 100)]:
+            self.assertEqual(cache.read(offset, size), data[offset:offset + size])
+        self.assertEqual(cache.hits, 4)
+        self.assertEqual(cache.misses, 7)
+
+    def test_file_source(self):
+        """ Tests file reads with pread, and with the seek and read used where it is not available """
+        filename = os.path.join(self.res_path, self.file)
+        with open(filename, 'rb') as f:
+            data = f.read()
+        for have_pread in (True, False):
+            sources.HAVE_PREAD = have_pread
+            try:
+                source = FileSource(filename)
+                for offset, size in [(0, 8), (100, 50), (len(data) - 10, 100), (8, 4)]:
+                    self.assertEqual(source.read(offset, size), data[offset:offset + size])
+                self.assertEqual(Checksum.checksum(Tiff(source)), Checksum.checksum(Tiff(filename)))
+            finally:
+                sources.HAVE_PREAD = hasattr(os, "pread")
+
+    def test_http_tiff(self):
+        """ Tests a TIFF read over HTTP has the same IFDs and checksums as the local file """
+        local = Tiff(os.path.join(self.res_path, self.file))
+        remote = Tiff(self.url)
+        self.assertEqual(len(remote.ifds), 2)
+        self.assertEqual([ifd.ifd_data.tobytes() for ifd in remote.ifds],
+                         [ifd.ifd_data.tobytes() for ifd in local.ifds])
+        self.assertEqual(Checksum.checksum(remote), Checksum.checksum(local))
+
+    def test_http_header_only(self):
+        """ Tests parsing a remote TIFF's IFDs fetches only the header area, in one request """
+        source = HttpSource(self.url)
+        cache = BlockCache(source, block_size=4096)
+        tiff = Tiff(cache, images=False)
+        self.assertEqual(len(tiff.ifds), 2)
+        self.assertEqual(source.requests, 2)                # the HEAD request and a single block
+        self.assertEqual(Checksum.pixel_digests(tiff), Checksum.pixel_digests(Tiff(self.url)))
+
+
+if __name__ == '__main__':
+    unittest.main()
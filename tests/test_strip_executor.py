@@ -0,0 +1,51 @@
+import json
+import os
+import unittest
+
+from tifinity.actions.checksum import Checksum
+from tifinity.parser.tiff import Tiff
+from tifinity.scripts.executor import StripExecutor, get_executor
+
+
+class TestStripExecutor(unittest.TestCase):
+    """ Tests relating to the multi-threaded strip executor.
+
+    Tests:
+    * Results are returned in the original order
+    * Image data read with multiple threads matches the single threaded checksums
+    * Checksums calculated with multiple threads match the single threaded checksums
+    """
+
+    def test_map_preserves_order(self):
+        """ Tests that results are returned in the order of the supplied items """
+        executor = StripExecutor(4)
+        self.assertEqual(executor.map(lambda x: x * 2, range(100)), [x * 2 for x in range(100)])
+        executor.shutdown()
+
+    def test_shared_executor(self):
+        """ Tests that executors are shared between callers requesting the same number of threads """
+        self.assertIs(get_executor(3), get_executor(3))
+
+    def _evaluate_checksums(self, res_path):
+        path = os.path.join("./resources", res_path)
+        tiff = Tiff(os.path.join(path, res_path + ".tiff"), threads=4)
+        hashes = Checksum.checksum(tiff, "md5", threads=4)
+
+        with open(os.path.join(path, "checksums.json"), 'r') as cs_file:
+            gt_js = json.load(cs_file)
+
+        self.assertEqual(hashes["full"], gt_js["md5"]["full"])
+        self.assertEqual(hashes["images"], gt_js["md5"]["images"])
+        self.assertEqual(hashes["ifds"], gt_js["md5"]["ifds"])
+
+    def test_two_strips_reverse_seq_threaded(self):
+        """ Tests the threaded read and checksum of an image whose strips are referenced in reverse order """
+        self._evaluate_checksums("t_two_strips_seq_reverse")
+
+    def test_two_subfiles_threaded(self):
+        """ Tests the threaded read and checksum of a TIFF containing two images """
+        self._evaluate_checksums("t_two_subfiles_one_strip")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from tifinity.parser.tiff import Tiff
+
+
+class TestTagValues(unittest.TestCase):
+    """ Tests relating to the representation of tag values
+
+    Tests:
+    * Values are read as numpy arrays, with byte values as views of the file data
+    * Float, double, rational and signed values are saved and read back unchanged
+    * Directories and IFDs use slots rather than per-object dictionaries
+    """
+
+    file = './resources/t_one_strip_with_exif/t_one_strip_with_exif.tiff'
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_value_arrays(self):
+        """ Tests the types of values read from a file """
+        tiff = Tiff(self.file)
+        ifd = tiff.ifds[0]
+        description = ifd.directories[270].value
+        self.assertEqual(description.dtype, np.uint8)
+        self.assertTrue(np.shares_memory(description, tiff.raw_data()))
+        self.assertEqual(ifd.directories[256].value.dtype, np.int64)
+        self.assertEqual(ifd.directories[282].value.shape, (1, 2))
+        self.assertIsInstance(ifd.get_image_width(), int)
+        self.assertEqual(ifd.directories[282].to_list(), [tuple(ifd.directories[282].value[0])])
+
+        header_only = Tiff(self.file, images=False).ifds[0]
+        self.assertFalse(np.shares_memory(header_only.directories[270].value, tiff.raw_data()))
+        self.assertTrue(np.array_equal(header_only.directories[270].value, description))
+
+    def test_save_values(self):
+        """ Tests that values of each numeric type survive saving and reading """
+        tiff = Tiff()
+        ifd = tiff.add_image(np.zeros((4, 4), dtype='uint8'))
+        ifd.set_tag(65000, 11, [1.5, -2.25])             # float
+        ifd.set_tag(65001, 12, [np.pi])                  # double
+        ifd.set_tag(65002, 5, [(72, 1), (300, 2)])       # rational
+        ifd.set_tag(65003, 9, [-5, 7])                   # signed long
+        path = os.path.join(self.temp_dir, "values.tif")
+        tiff.save_tiff(path)
+
+        ifd = Tiff(path).ifds[0]
+        self.assertEqual(ifd.directories[65000].to_list(), [1.5, -2.25])
+        self.assertEqual(ifd.directories[65001].to_list(), [np.pi])
+        self.assertEqual(ifd.directories[65002].to_list(), [(72, 1), (300, 2)])
+        self.assertEqual(ifd.directories[65003].to_list(), [2 ** 32 - 5, 7])    # signed types are read unsigned
+
+    def test_slots(self):
+        """ Tests that parsed directories and IFDs have no instance dictionaries """
+        ifd = Tiff(self.file, images=False).ifds[0]
+        self.assertFalse(hasattr(ifd, "__dict__"))
+        self.assertFalse(hasattr(ifd.directories[256], "__dict__"))
+
+
+if __name__ == '__main__':
+    unittest.main()
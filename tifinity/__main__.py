@@ -1,9 +1,11 @@
 import argparse
 import importlib
+import os
 import pkgutil
 import sys
 
 from tifinity import __version__
+from tifinity.modules import manifest
 
 
 def load_modules(package):
@@ -29,36 +31,108 @@ def load_modules(package):
         try:
             yield importlib.import_module(name)
         except ImportError as msg:
-            print("Could not load module " + name + ":" + msg)
+            print("Could not load module " + name + ":" + str(msg))
 
 
-def main(args=None):
-    if args is None:
-        args = sys.argv[1:]
-
-    # Process CLI arguments #
+def create_parser():
+    """ Creates the main argument parser, with the global options and a sub-parser collection for the modules """
     ap = argparse.ArgumentParser(prog="Tifinity",
                                  description="Helpful TIFF analysis and action tools")
 
     moduleparsers = ap.add_subparsers(title='Available Modules', dest='module')
 
-    # Set up each module
-    for module in load_modules("tifinity.modules"):
-        m = module.module               # initiate the module
-        m.add_subparser(moduleparsers)  # add sub-parser to this argparse handler
-
     # ap.add_argument("-s", "--silent", dest="silent", action="store_true",
     #                help="turn off command line output")
     ap.add_argument("-v", "--version", action="version", version='%(prog)s v' + __version__,
                     help="display program version")
-    arguments = ap.parse_args()
+    ap.add_argument("--threads", dest="threads", type=int, default=1,
+                    help="number of threads to use for per-strip work (0 = all cores)")
+    ap.add_argument("--index", dest="index", action="store_true",
+                    help="load each file's parsed IFDs from a sidecar parse index (FILE.tifidx.npz) if it is up to "
+                         "date, writing it otherwise, to skip parsing files which are opened repeatedly")
+    ap.add_argument("--server", dest="server", metavar="SOCKET", default=os.environ.get("TIFINITY_SERVER"),
+                    help="run the command in the tifinity server listening on the specified Unix socket (default "
+                         "$TIFINITY_SERVER)")
+    ap.add_argument("--profile", dest="profile", metavar="FILE",
+                    help="write a profile of the command to FILE: cProfile statistics if FILE ends with .prof, "
+                         "otherwise a JSON report of time spent in each phase and bytes read, hashed and written")
+    ap.add_argument("--profile-memory", dest="profile_memory", action="store_true",
+                    help="include peak memory (traced with tracemalloc) in the JSON profile report")
+    return ap, moduleparsers
+
+
+def load_module(name):
+    """ Imports the module for the specified subcommand from the manifest, returning its module instance """
+    return importlib.import_module(manifest[name][0]).module
+
+
+def parse_arguments(args, select_only=False):
+    """ Parses the command line arguments, importing only the selected module. Returns the parser and the parsed
+        arguments (whose module attribute is None if no module was selected). If select_only is True, only the
+        global options and the selected module's name are parsed, and no module is imported. """
+    # First pass: placeholder sub-parsers (from the manifest) identify the selected module without importing any
+    ap, moduleparsers = create_parser()
+    for name, (path, help_text) in sorted(manifest.items()):
+        moduleparsers.add_parser(name, help=help_text, add_help=False)
+    arguments = ap.parse_known_args(args)[0]
+
+    if arguments.module is None or select_only:
+        return ap, arguments
+
+    # Second pass: import just the selected module and parse its arguments properly
+    ap, moduleparsers = create_parser()
+    m = load_module(arguments.module)   # initiate the module
+    m.add_subparser(moduleparsers)      # add sub-parser to this argparse handler
+    return ap, ap.parse_args(args)
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+
+    # Process CLI arguments #
+    ap, arguments = parse_arguments(args, select_only=True)
+
+    if arguments.module is None:
+        ap.print_help()
+        return
+
+    # hand the command to a running tifinity server, if requested, without importing the module locally
+    if arguments.server is not None and arguments.module != "serve":
+        from tifinity.scripts.client import run_remote
+        sys.exit(run_remote(arguments.server, remove_option(args, "--server")))
+
+    ap, arguments = parse_arguments(args)
+
+    from tifinity.parser.parse_index import set_default_index
+    from tifinity.scripts.executor import set_default_threads
+    set_default_threads(arguments.threads)
+    set_default_index(arguments.index)
 
     # Now try to call the appropriate sub-parser handling function, or print the help if not
     try:
-        arguments.func(arguments)
+        if arguments.profile is None:
+            arguments.func(arguments)
+        else:
+            from tifinity.scripts.instrument import run_profiled
+            run_profiled(arguments.func, arguments, arguments.profile, arguments.profile_memory)
     except AttributeError:
         ap.print_help()
 
 
+def remove_option(args, option):
+    """ Returns a copy of the argument list without the specified (single valued) option and its value """
+    out = []
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg == option:
+            skip = True
+        elif not arg.startswith(option + "="):
+            out.append(arg)
+    return out
+
+
 if __name__ == '__main__':
     main()
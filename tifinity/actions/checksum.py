@@ -1,33 +1,88 @@
 import hashlib
 
+import numpy as np
+
+from tifinity.parser.sources import SourceArray
+from tifinity.scripts.executor import get_executor
+from tifinity.scripts.instrument import add_count, phase
+
+
 class Checksum():
 
     @staticmethod
-    def checksum(tiff, alg="md5", justimage=False):
+    def checksum(tiff, alg="md5", justimage=False, threads=None):
+        """Calculates hashes of the full file, each image's data and each IFD. Each hash is independent, so
+           they are calculated concurrently using the strip executor."""
         hashes = { 'full': 'Unknown',
                    'images': 'Unknown',
                    'ifds': 'Unknown' }
 
+        # gather all the data to hash, then hash each in parallel
+        data = [ifd.img_data for ifd in tiff.ifds]
         if not justimage:
-            hashes["full"] = Checksum._hash_data(tiff.raw_data(), alg)
+            data += [ifd.ifd_data for ifd in tiff.ifds]
+            data.append(tiff.raw_data())
 
-        image_hashes = []
-        ifd_hashes = []
-        for ifd in tiff.ifds:
-            image_hashes.append(Checksum._hash_data(ifd.img_data, alg))
-            if not justimage:
-                ifd_hashes.append(Checksum._hash_data(ifd.ifd_data, alg))
+        executor = get_executor(threads)
+        digests = executor.map(lambda d: Checksum._hash_data(d, alg), data)
 
-        hashes["images"] = image_hashes
+        num_ifds = len(tiff.ifds)
+        hashes["images"] = digests[:num_ifds]
 
         if not justimage:
-            hashes["ifds"] = ifd_hashes
+            hashes["ifds"] = digests[num_ifds:2 * num_ifds]
+            hashes["full"] = digests[-1]
 
         return hashes
 
     @staticmethod
-    def _hash_data(data, alg="sha256"):
-        """Returns the hash value of the specified data using the specified hashing algorithm"""
+    def pixel_digests(tiff, alg="sha256", threads=None):
+        """Returns the canonical pixel digest (see pixel_digest) of each image in the Tiff"""
+        return [Checksum.pixel_digest(tiff, ifd, alg, threads) for ifd in tiff.ifds]
+
+    @staticmethod
+    def pixel_digest(tiff, ifd, alg="sha256", threads=None):
+        """Returns a digest of the IFD's decoded pixels which is independent of how they are stored: the pixels are
+           hashed in a normalised form (row-major, chunky, little-endian samples), after the image's dimensions,
+           bits per sample, sample format and photometric interpretation. Re-stripping, re-tiling, lossless
+           re-compression or a byte order swap does not change the digest.
+
+           Strips are decoded a window at a time (in parallel) and hashed in order, so the image is never held in
+           memory; if the image has not been read (e.g. a Tiff opened with images=False), strips are read from the
+           memory mapped file."""
+        strips = tiff.strip_views(ifd) if ifd.img_data is None else None
+
         m = hashlib.new(alg)
-        m.update(data)
-        return m.hexdigest()
\ No newline at end of file
+        m.update("{0}x{1}x{2}:{3}:{4}:{5}\n".format(ifd.get_image_width(), ifd.get_image_height(),
+                                                   ifd.get_samples_per_pixel(), ifd.get_bits_per_sample(),
+                                                   ifd.get_sample_format(),
+                                                   ifd._get_single_value("PhotometricInterpretation", None))
+                 .encode())
+
+        executor = get_executor(threads)
+        window = max(1, executor.threads * 2)
+        bands = ifd.get_number_strips()
+        for start in range(0, bands, window):
+            for band in executor.map(lambda i: Checksum._canonical(ifd.strip_pixels(i, strips)),
+                                     range(start, min(start + window, bands))):
+                with phase("hash"):
+                    m.update(band)
+                add_count("bytes_hashed", len(band))
+        return m.hexdigest()
+
+    @staticmethod
+    def _canonical(band):
+        """Returns a band of pixels as contiguous little-endian bytes"""
+        return np.ascontiguousarray(band, dtype=band.dtype.newbyteorder('<')).reshape(-1).view('uint8')
+
+    @staticmethod
+    def _hash_data(data, alg="sha256"):
+        """Returns the hash value of the specified data using the specified hashing algorithm. Files read from a
+           ByteSource are hashed a chunk at a time."""
+        with phase("hash"):
+            m = hashlib.new(alg)
+            for chunk in (data.chunks() if isinstance(data, SourceArray) else [data]):
+                m.update(chunk)
+            digest = m.hexdigest()
+        add_count("bytes_hashed", len(data))
+        return digest
@@ -0,0 +1,219 @@
+"""
+Bulk metadata extraction across collections of TIFFs.
+
+Directories are walked and files parsed header-only (IFDs, no image data) in parallel worker processes, producing a
+table with one row per IFD and one column per tag, with typed values. Rows are produced in a stable order as batches
+of files complete, so tables can be written as a stream (CSV, or Parquet if pyarrow is installed) with bounded memory.
+"""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from tifinity.actions.icc_parser import profile_cache
+from tifinity.parser.sources import TIFF_EXTENSIONS, archive_members, archive_sources, is_archive, source_name
+from tifinity.parser.tiff import Tiff, ifdtag, inv_ifdtag
+
+# single valued integer tags, rational tags (written as floats) and text tags (decoded from ASCII, BYTE or UNDEFINED
+# values)
+INT_TAGS = {254, 255, 256, 257, 259, 262, 263, 264, 265, 266, 274, 277, 278, 280, 281, 284, 290, 296, 317, 322, 323}
+FLOAT_TAGS = {282, 283}
+TEXT_TAGS = {269, 270, 271, 272, 285, 305, 306, 315, 316, 700, 33432}
+
+# large binary tags, written as their length in bytes
+BLOB_TAGS = {33723, 34377, 34675}
+
+# per strip/tile and palette tags, not included in tables by default
+EXCLUDED_TAGS = {273, 279, 320, 324, 325}
+
+STANDARD_COLUMNS = ["file", "ifd", "offset", "error"]
+OTHER_TAGS_COLUMN = "other_tags"
+
+
+def find_tiffs(paths, extensions=TIFF_EXTENSIONS, sources=False):
+    """Yields the TIFF files (by extension, or every file if extensions is None) in the specified files and folders,
+       walking folders recursively in sorted order. ZIP and tar archives given as paths yield their TIFF members (as
+       archive::member), or with sources, the members of compressed tar archives as MemorySources read in a single
+       pass (see archive_sources)."""
+    for path in paths:
+        if is_archive(path):
+            yield from (archive_sources if sources else archive_members)(path, extensions)
+            continue
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if extensions is None or name.lower().endswith(extensions):
+                    yield os.path.join(root, name)
+
+
+def ordered_map(func, items, workers=None, window=None):
+    """Like map, but calling func in a pool of worker processes, yielding results in order. At most window items
+       are in flight at once, so items may be a (long) generator."""
+    workers = workers or os.cpu_count() or 1
+    window = window or workers * 4
+    items = iter(items)
+    with ProcessPoolExecutor(workers) as pool:
+        pending = [pool.submit(func, item) for item in islice(items, window)]
+        while pending:
+            result = pending.pop(0).result()
+            for item in islice(items, 1):
+                pending.append(pool.submit(func, item))
+            yield result
+
+
+def batches(iterable, size):
+    """Yields lists of up to size items from the iterable"""
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+class TagTable():
+    """The columns of a metadata table, and conversion of a TIFF's IFDs to rows of it. Tags without their own
+       column (or with unexpected values) are written to the other_tags column as JSON."""
+
+    def __init__(self, tags=None):
+        if tags is None:
+            tags = [tag for tag in sorted(ifdtag) if tag >= 0 and tag not in EXCLUDED_TAGS]
+        self.tags = list(tags)
+        self.names = [ifdtag.get(tag, str(tag)) for tag in self.tags]
+        self.columns = STANDARD_COLUMNS + self.names + [OTHER_TAGS_COLUMN]
+
+    def column_type(self, column):
+        """Returns the type of the values of the specified column: 'int', 'float' or 'str'"""
+        if column in ("ifd", "offset"):
+            return "int"
+        tag = inv_ifdtag.get(column)
+        if tag in INT_TAGS or tag in BLOB_TAGS:
+            return "int"
+        if tag in FLOAT_TAGS:
+            return "float"
+        return "str"
+
+    def rows(self, filename):
+        """Returns the rows for each IFD of the specified file (or ByteSource), parsing only its header and IFDs.
+           Files which cannot be parsed give a single row with the error."""
+        try:
+            tiff = Tiff(filename, threads=1, images=False)
+        except Exception as e:
+            return [dict({column: None for column in self.columns}, file=source_name(filename),
+                         error=TagTable._error(e))]
+
+        rows = []
+        for i, ifd in enumerate(tiff.ifds):
+            row = {"file": source_name(filename), "ifd": i, "offset": ifd.offset, "error": None}
+            other = {}
+            for tag, directory in ifd.directories.items():
+                value = TagTable.typed_value(directory)
+                if tag in self.tags and TagTable._fits(tag, value):
+                    row[ifdtag.get(tag, str(tag))] = value
+                elif tag not in EXCLUDED_TAGS:
+                    other[str(tag)] = value
+            for name in self.names:
+                row.setdefault(name, None)
+            row[OTHER_TAGS_COLUMN] = json.dumps(other) if other else None
+            rows.append(row)
+        return rows
+
+    @staticmethod
+    def typed_value(directory):
+        """Returns the directory's value as a python value: a single number for single valued integer and rational
+           tags, text for ASCII values (and byte values of text tags, such as XMP), the length of binary blobs,
+           otherwise a list"""
+        tag = directory.tag
+        values = directory.value
+        if tag in BLOB_TAGS:
+            return int(directory.count)
+        if directory.type == 2 or (tag in TEXT_TAGS and directory.type in (1, 7)):
+            return bytes(values).decode('utf-8', errors='replace').rstrip('\x00')
+        if directory.type in (5, 10):
+            values = [(n / d) if d else None for (n, d) in values]
+        elif directory.type_valid:
+            values = directory.to_list()
+        if (tag in INT_TAGS or tag in FLOAT_TAGS) and len(values) == 1:
+            return values[0]
+        return values
+
+    @staticmethod
+    def _fits(tag, value):
+        if tag in INT_TAGS or tag in BLOB_TAGS:
+            return isinstance(value, int)
+        if tag in FLOAT_TAGS:
+            return isinstance(value, float)
+        if tag in TEXT_TAGS:
+            return isinstance(value, str)
+        return True
+
+    @staticmethod
+    def _error(e):
+        return "{0}: {1}".format(type(e).__name__, getattr(e, "message", e))
+
+    def format_row(self, row):
+        """Returns the row with list values (of string columns) as JSON text"""
+        return {column: (json.dumps(value) if isinstance(value, list) else value) for column, value in row.items()}
+
+
+def _table_rows(job):
+    """Worker function: returns the (formatted) rows for a batch of files"""
+    table, filenames = job
+    return [table.format_row(row) for filename in filenames for row in table.rows(filename)]
+
+
+def collection_rows(paths, table, workers=None, batch_size=64):
+    """Yields the rows of the table for every TIFF in the specified files and folders, parsing batches of files in
+       parallel worker processes"""
+    jobs = ((table, batch) for batch in batches(find_tiffs(paths, sources=True), batch_size))
+    for rows in ordered_map(_table_rows, jobs, workers):
+        for row in rows:
+            yield row
+
+
+def _profile_summaries(filenames):
+    """Worker function: returns the summaries of the distinct ICC profiles in a batch of files, with the number of
+       IFDs each is embedded in"""
+    summaries = {}
+    for filename in filenames:
+        try:
+            tiff = Tiff(filename, threads=1, images=False)
+        except Exception:
+            continue
+        for ifd in tiff.ifds:
+            data = ifd.get_tag_value(34675)
+            if data is not None:
+                summary = profile_cache.summary(data)
+                summaries.setdefault(summary["digest"], dict(summary, count=0))["count"] += 1
+    return list(summaries.values())
+
+
+def profile_inventory(paths, workers=None, batch_size=64):
+    """Returns summaries of the distinct ICC profiles embedded in the TIFFs in the specified files and folders, with
+       the number of IFDs each is embedded in, most common first. Each worker process parses each profile once."""
+    inventory = {}
+    for summaries in ordered_map(_profile_summaries, batches(find_tiffs(paths, sources=True), batch_size), workers):
+        for summary in summaries:
+            inventory.setdefault(summary["digest"], dict(summary, count=0))["count"] += summary["count"]
+    return sorted(inventory.values(), key=lambda s: (-s["count"], s["digest"]))
+
+
+def write_parquet(rows, table, filename, row_group_size=65536):
+    """Writes the rows to a Parquet file, a row group at a time. Requires pyarrow. Returns the number of rows."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet output requires pyarrow (pip install pyarrow)")
+
+    arrow_types = {"int": pyarrow.int64(), "float": pyarrow.float64(), "str": pyarrow.string()}
+    schema = pyarrow.schema([(column, arrow_types[table.column_type(column)]) for column in table.columns])
+
+    count = 0
+    with pyarrow.parquet.ParquetWriter(filename, schema) as writer:
+        for group in batches(rows, row_group_size):
+            writer.write_table(pyarrow.Table.from_pylist(group, schema=schema))
+            count += len(group)
+    return count
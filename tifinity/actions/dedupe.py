@@ -0,0 +1,215 @@
+"""
+Near-duplicate detection across collections of TIFFs.
+
+Each full resolution image is reduced to a 64 bit difference hash (dHash): the image is box-filtered strip by strip
+(from the smallest reduced-resolution image large enough, if present) to a 9x8 grayscale, and each bit records whether
+a pixel is brighter than its right-hand neighbour. Images which differ only in compression, layout, bit depth or small
+edits have hashes a small Hamming distance apart.
+
+Hashes are stored in an on-disk index (a tab separated text file, one line per image) so that files are only hashed
+again when their size or modification time changes. Near-duplicates are found with a BK-tree, a metric tree over the
+Hamming distance in which a search for hashes within distance d only visits the subtrees whose edge distance is within
+d of the query's distance to their parent, rather than comparing every pair of images.
+"""
+import os
+
+import numpy as np
+
+from tifinity.actions.collection import batches, find_tiffs, ordered_map
+from tifinity.actions.thumbnail import BoxDownsampler, ImageSource, Thumbnail
+from tifinity.parser.tiff import Tiff
+from tifinity.scripts.executor import get_executor
+
+HASH_SIZE = 8                   # hashes are HASH_SIZE x HASH_SIZE bits
+DEFAULT_DISTANCE = 8            # the largest Hamming distance between near-duplicate hashes
+
+LUMA = np.array([0.299, 0.587, 0.114])
+
+
+def hamming(a, b):
+    """Returns the number of bits which differ between two (integer) hashes"""
+    return bin(a ^ b).count("1")
+
+
+def gray(pixels, photometric):
+    """Returns (float) pixel values as a (height, width) grayscale: the luma of RGB images, otherwise the first
+       sample, inverted for WhiteIsZero images"""
+    if photometric == 2 and pixels.shape[2] >= 3:
+        return pixels[:, :, :3] @ LUMA
+    if photometric == 0:
+        return -pixels[:, :, 0]
+    return pixels[:, :, 0]
+
+
+def dhash(tiff, ifd, size=HASH_SIZE, threads=None):
+    """Returns the difference hash of the specified (full resolution) IFD's image, as an integer of size*size bits.
+       The image (or a reduced-resolution version of it) is downsampled strip by strip, from the memory mapped file
+       if it has not been read."""
+    source_ifd = ifd
+    if ifd is Thumbnail.main_ifd(tiff):
+        source_ifd = Thumbnail.select_ifd(tiff, size + 1)
+    source = ImageSource(source_ifd, tiff.strip_views(source_ifd) if source_ifd.img_data is None else None)
+    rows_per_strip = source_ifd.get_rows_per_strip()
+    downsampler = BoxDownsampler(source_ifd.get_image_width(), source_ifd.get_image_height(), size + 1, size,
+                                 source.samples)
+
+    def bin_strip(index):
+        return downsampler.bin_rows(index * rows_per_strip, source.strip_pixels(index))
+
+    for first_out_row, summed in get_executor(threads).map(bin_strip, range(source_ifd.get_number_strips())):
+        downsampler.add(first_out_row, summed)
+
+    luma = gray(downsampler.result(), source.photometric)
+    bits = (luma[:, 1:] > luma[:, :-1]).reshape(-1)
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def file_hashes(filename, size=HASH_SIZE):
+    """Returns the index entries for each full resolution image in the file: (hash, ifd, file size, mtime (ns), file)"""
+    stat = os.stat(filename)
+    tiff = Tiff(filename, threads=1, images=False)
+    return [(dhash(tiff, ifd, size, threads=1), i, stat.st_size, stat.st_mtime_ns, filename)
+            for i, ifd in enumerate(tiff.ifds) if not Thumbnail._is_reduced(ifd)]
+
+
+class HashIndex():
+    """An on-disk index of image hashes: a tab separated text file of hash (hex), IFD, file size, modification time
+       (in nanoseconds) and file name, one line per image. New entries are appended, so the index is built
+       incrementally."""
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.entries = {}               # file name: [(hash, ifd, size, mtime, file)]
+        self.superseded = 0             # lines of the index file replaced by later lines
+        if filename is not None and os.path.exists(filename):
+            self.load()
+
+    def load(self):
+        with open(self.filename, 'r', encoding='utf-8') as index_file:
+            for line in index_file:
+                fields = line.rstrip("\n").split("\t", 4)
+                if len(fields) != 5:
+                    continue
+                entry = (int(fields[0], 16), int(fields[1]), int(fields[2]), int(fields[3]), fields[4])
+                entries = self.entries.setdefault(entry[4], [])
+                if entries and entries[0][2:4] != entry[2:4]:
+                    self.superseded += len(entries)
+                    entries.clear()
+                entries.append(entry)
+
+    def is_current(self, filename):
+        """Returns whether the file's entries are up to date (its size and modification time are unchanged)"""
+        entries = self.entries.get(filename)
+        if not entries:
+            return False
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return False
+        return entries[0][2] == stat.st_size and entries[0][3] == stat.st_mtime_ns
+
+    def update(self, entries):
+        """Replaces the entries of the files hashed (appending them to the index file)"""
+        for filename in {entry[4] for entry in entries}:
+            self.superseded += len(self.entries.get(filename, []))
+            self.entries[filename] = []
+        for entry in entries:
+            self.entries[entry[4]].append(entry)
+        if self.filename is not None and entries:
+            with open(self.filename, 'a', encoding='utf-8') as index_file:
+                for entry in entries:
+                    index_file.write("{0:016x}\t{1}\t{2}\t{3}\t{4}\n".format(*entry))
+
+    def compact(self):
+        """Rewrites the index file without superseded entries, or entries of files which no longer exist"""
+        for filename in [f for f in self.entries if not os.path.exists(f)]:
+            self.superseded += len(self.entries.pop(filename))
+        if self.filename is None or self.superseded == 0:
+            return
+        with open(self.filename + ".tmp", 'w', encoding='utf-8') as index_file:
+            for entry in self:
+                index_file.write("{0:016x}\t{1}\t{2}\t{3}\t{4}\n".format(*entry))
+        os.replace(self.filename + ".tmp", self.filename)
+        self.superseded = 0
+
+    def __iter__(self):
+        for filename in sorted(self.entries):
+            yield from self.entries[filename]
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.entries.values())
+
+
+class BKTree():
+    """A Burkhard-Keller tree of integer hashes under the Hamming distance. Each node holds a hash, the items with
+       that hash, and its children keyed by their distance from it."""
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = (value, [item], {})
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, [item], {})
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """Returns (distance, item) for each item whose hash is within max_distance of the value"""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= max_distance:
+                found.extend((distance, item) for item in items)
+            # by the triangle inequality, matches can only be under children within max_distance of distance
+            for edge, child in children.items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        return found
+
+
+def near_duplicates(entries, max_distance=DEFAULT_DISTANCE):
+    """Yields (entry, other, distance) for each pair of index entries whose hashes are within max_distance, each
+       entry being compared (through a BK-tree) only with those before it"""
+    tree = BKTree()
+    for entry in entries:
+        for distance, other in sorted(tree.search(entry[0], max_distance), key=lambda match: match[0]):
+            yield other, entry, distance
+        tree.add(entry[0], entry)
+
+
+def _hash_files(job):
+    """Worker function: returns the index entries, and (file, error) for files which cannot be hashed, of a batch"""
+    filenames, size = job
+    entries, errors = [], []
+    for filename in filenames:
+        try:
+            entries += file_hashes(filename, size)
+        except Exception as e:
+            errors.append((filename, "{0}: {1}".format(type(e).__name__, getattr(e, "message", e))))
+    return entries, errors
+
+
+def index_collection(paths, index, size=HASH_SIZE, workers=None, batch_size=64):
+    """Hashes every TIFF in the specified files and folders which is not current in the index, in parallel worker
+       processes, adding the hashes to the index. Returns the files which could not be hashed, as (file, error)."""
+    files = (f for f in find_tiffs(paths) if not index.is_current(f))
+    all_errors = []
+    for entries, errors in ordered_map(_hash_files, ((batch, size) for batch in batches(files, batch_size)),
+                                       workers):
+        index.update(entries)
+        all_errors += errors
+    return all_errors
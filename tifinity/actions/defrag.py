@@ -0,0 +1,206 @@
+"""
+Layout scoring and defragmentation of TIFFs.
+
+Reading a TIFF's images in order is a single sequential pass only if the IFDs come first and each image's strips (or
+tiles) follow one another contiguously in logical order. Files with strips out of order, reversed or interleaved with
+metadata turn every read into random I/O.
+
+layout_score measures how close a file is to that layout, from its IFDs alone. rewrite produces the layout: the header
+and every IFD (main chain, SubIFDs and EXIF, GPS and Interoperability IFDs) with its values, followed by each image's
+strips in logical order. The metadata is built in memory (it is small); image data is streamed from the memory mapped
+source to the output, strip by strip, so the image is never held in memory.
+"""
+import os
+
+from tifinity.actions.collection import batches, find_tiffs, ordered_map
+from tifinity.actions.validate import ERROR, validate_file
+from tifinity.parser.errors import InvalidTiffError
+from tifinity.parser.tiff import Tiff, inv_ifdtag
+from tifinity.scripts.instrument import add_count, phase
+
+# tags pointing to a single IFD outside the main chain, rewritten after the IFD containing them
+IFD_POINTER_TAGS = (34665, 34853, 40965)        # EXIF, GPS and Interoperability IFDs
+
+# tags locating data other than strips or tiles: (offsets tag, byte counts tag)
+DATA_TAGS = [(513, 514)]                        # JPEGInterchangeFormat (thumbnail) and its length
+
+
+def image_ifds(tiff):
+    """Returns the IFDs of the Tiff containing image data, in reading order: each IFD of the main chain followed by
+       its SubIFDs"""
+    def walk(ifd):
+        yield ifd
+        for sub_ifd in ifd.sub_ifds:
+            yield from walk(sub_ifd)
+    return [image_ifd for ifd in tiff.ifds for image_ifd in walk(ifd)]
+
+
+def layout_score(filename):
+    """Returns a dictionary describing the layout of the file's image data (read from its IFDs alone): the number of
+       strips (or tiles), how many follow the previous strip contiguously or are before it in the file, the total
+       seek distance (bytes) reading them in order, whether every IFD precedes the image data, and a score from 0 to
+       1 (1 being a single sequential pass): the fraction of the reads of a pass over the file (the IFDs, then each
+       strip in order) which follow on from the previous read without a seek. IFDs after the image data cost a single
+       seek, however many strips there are, so a file with one strip and its IFD at the end scores 0.5, while a file
+       with many strips in reverse order scores close to 0."""
+    tiff = Tiff(filename, threads=1, images=False)
+    ifds = image_ifds(tiff)
+    extents = [strip for ifd in ifds if ifd.get_tag_value(ifd.get_offsets_tags()[0]) is not None
+               for strip in ifd.get_strips() if strip[1] > 0]
+
+    contiguous = backward = seek_bytes = 0
+    for (offset, count), (next_offset, next_count) in zip(extents, extents[1:]):
+        end = offset + count
+        contiguous += 0 <= next_offset - end <= 1          # allowing word alignment padding
+        backward += next_offset < offset
+        seek_bytes += abs(next_offset - end)
+    ifds_first = not extents or max(ifd.offset for ifd in ifds) < min(offset for offset, count in extents)
+
+    return {"ifds": len(ifds), "strips": len(extents), "contiguous": int(contiguous), "backward": int(backward),
+            "seek_bytes": int(seek_bytes), "ifds_first": bool(ifds_first),
+            "score": float(contiguous + ifds_first + 1) / (len(extents) + 1) if extents else 1.0}
+
+
+class LayoutWriter():
+    """Writes a TIFF's metadata to a new (in memory) Tiff, recording the data (strips, tiles and thumbnails) to be
+       copied after it"""
+
+    def __init__(self, source):
+        self.source = source
+        self.file_size = len(source.raw_data())
+        self.writer = Tiff()
+        self.writer.byteOrder = source.byteOrder
+        self.writer.save_header()
+        self.data = []                      # (ifd, offsets tag, [(offset, count)]) in output order
+
+    def save_metadata(self):
+        """Saves every IFD, linking the main chain"""
+        previous = None
+        for ifd in self.source.ifds:
+            offset = self.save_ifd(ifd)
+            if previous is not None:
+                self.writer.tif_file.insert_int(offset, size=4, location=previous.pointerlocation, overwrite=True)
+            previous = ifd
+
+    def save_ifd(self, ifd):
+        """Saves the IFD and its values, then the IFDs it points to, returning the IFD's offset"""
+        for offsets_tag, counts_tag in [ifd.get_offsets_tags()] + DATA_TAGS:
+            offsets = ifd.get_tag_value(offsets_tag)
+            counts = ifd.get_tag_value(counts_tag)
+            if offsets is None or counts is None:
+                continue
+            extents = list(zip(offsets.tolist(), counts.tolist()))
+            if any(offset + count > self.file_size for offset, count in extents):
+                raise InvalidTiffError(self.source.tif_file._filename, "Image data past the end of the file")
+            ifd.set_tag(offsets_tag, 4, [0] * len(extents))     # long offsets, set when the data is placed
+            self.data.append((ifd, offsets_tag, extents))
+
+        tif_file = self.writer.tif_file
+        if tif_file.tell() % 2 == 1:
+            tif_file.insert_bytes([0])
+        offset = tif_file.tell()
+        tif_file.seek(self.writer.save_ifd(ifd))
+
+        if ifd.sub_ifds:
+            self.writer._patch_tag_value(ifd, inv_ifdtag["SubIFDs"],
+                                         [self.save_ifd(sub_ifd) for sub_ifd in ifd.sub_ifds])
+        for tag in IFD_POINTER_TAGS:
+            pointer = ifd.get_tag_value(tag)
+            if pointer is not None:
+                linked = self.source.read_ifd(int(pointer[0]))
+                self.writer._patch_tag_value(ifd, tag, [self.save_ifd(linked)])
+        return offset
+
+    def place_data(self):
+        """Sets the offsets of the data, placed contiguously after the metadata in output order, returning the
+           offset of the first byte of data"""
+        tif_file = self.writer.tif_file
+        if len(tif_file.raw_data()) % 2 == 1:
+            tif_file.seek(len(tif_file.raw_data()))
+            tif_file.insert_bytes([0])
+        start = position = len(tif_file.raw_data())
+        for ifd, tag, extents in self.data:
+            offsets = []
+            for offset, count in extents:
+                offsets.append(position)
+                position += count
+            if position >= 2 ** 32:
+                raise InvalidTiffError(self.source.tif_file._filename, "Rewritten file would exceed 4 GB")
+            self.writer._patch_tag_value(ifd, tag, offsets)
+        return start
+
+    def write(self, to_file):
+        """Writes the metadata, then streams the data from the source file"""
+        source = self.source.raw_data()
+        with phase("write"), open(to_file, 'wb') as out:
+            out.write(self.writer.raw_data().tobytes())
+            for ifd, tag, extents in self.data:
+                for offset, count in extents:
+                    out.write(source[offset:offset + count])
+                    add_count("bytes_written", count)
+
+
+def rewrite(filename, to_file):
+    """Rewrites the TIFF to the specified file with every IFD first, followed by each image's strips (or tiles) in
+       logical order"""
+    source = Tiff(filename, threads=1, images=False)
+    layout = LayoutWriter(source)
+    layout.save_metadata()
+    layout.place_data()
+    layout.write(to_file)
+
+
+def defrag_file(filename, to_file, threshold=None, score_only=False):
+    """Scores the file's layout and, unless score_only, rewrites it to to_file if its score is below the threshold
+       (or always, if no threshold is given). Files with structural errors (see validate) are not rewritten.
+       Returns a record of the layout before (and score after) rewriting."""
+    record = {"file": filename, "output": None, "new_score": None, "error": None}
+    try:
+        record.update(layout_score(filename))
+    except Exception as e:
+        record["error"] = "{0}: {1}".format(type(e).__name__, getattr(e, "message", str(e)))
+        return record
+
+    if score_only or (threshold is not None and record["score"] >= threshold):
+        return record
+    errors = [i for i in validate_file(filename) if i["severity"] == ERROR]
+    if errors:
+        record["error"] = "{0} structural errors, e.g. {1}".format(len(errors), errors[0]["description"])
+        return record
+
+    rewrite(filename, to_file)
+    record["output"] = to_file
+    record["new_score"] = layout_score(to_file)["score"]
+    return record
+
+
+def output_file(filename, root=None, output=None):
+    """Returns the rewritten file name: <file>.defrag.tif, or the file's path (relative to the root folder) within
+       the output folder"""
+    if output is None:
+        return os.path.splitext(filename)[0] + ".defrag.tif"
+    if root is None:
+        return output
+    return os.path.join(output, os.path.relpath(filename, root))
+
+
+def _defrag_files(job):
+    """Worker function: defragments a batch of files, returning their records"""
+    filenames, root, output, threshold, score_only = job
+    records = []
+    for filename in filenames:
+        to_file = output_file(filename, root, output)
+        if not score_only and output is not None:
+            os.makedirs(os.path.dirname(to_file) or ".", exist_ok=True)
+        records.append(defrag_file(filename, to_file, threshold, score_only))
+    return records
+
+
+def defrag_collection(folder, output=None, threshold=None, score_only=False, workers=None, batch_size=16):
+    """Yields the record of defragmenting every TIFF in the folder (see defrag_file), in parallel worker processes.
+       Rewritten files are written to the same relative path in the output folder, or alongside the originals (in
+       which case previously rewritten files are skipped)."""
+    files = (f for f in find_tiffs([folder]) if output is not None or not f.endswith(".defrag.tif"))
+    jobs = ((batch, folder, output, threshold, score_only) for batch in batches(files, batch_size))
+    for records in ordered_map(_defrag_files, jobs, workers):
+        yield from records
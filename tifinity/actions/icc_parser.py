@@ -1,15 +1,117 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+
+# arrays longer than this are summarised by their first and last few values
+SUMMARY_THRESHOLD = 1000
+SUMMARY_ITEMS = 3
+
+
+def format_values(values):
+    """Returns values as a single line of text: (n, 3) XYZ arrays as X=, Y=, Z= numbers, (n, 2) chromaticity arrays
+       as x=, y= coordinates, and other arrays as comma separated numbers (long arrays are summarised)"""
+    if not isinstance(values, np.ndarray):
+        return str(values)
+    if values.ndim == 2 and values.shape[1] in (2, 3) and values.dtype.kind == 'f':
+        names = 'XYZ' if values.shape[1] == 3 else 'xy'
+        return '; '.join(', '.join('{0}={1:g}'.format(name, v) for name, v in zip(names, row))
+                         for row in values.tolist())
+    values = values.ravel()
+    fmt = '{:g}' if values.dtype.kind == 'f' else '{}'
+    if len(values) > SUMMARY_THRESHOLD:
+        return ', '.join([fmt.format(v) for v in values[:SUMMARY_ITEMS].tolist()] + ['...'] +
+                         [fmt.format(v) for v in values[-SUMMARY_ITEMS:].tolist()])
+    return ', '.join(fmt.format(v) for v in values.tolist())
+
+
+class IccCurve():
+    """A tone reproduction curve: a 'curv' table of samples (no entries for identity, or a single u8Fixed8 gamma) or
+       the parameters of a 'para' parametric function of the given type (0-4)"""
+
+    # number of parameters of each parametric curve function type
+    PARAMETERS = {0: 1, 1: 3, 2: 4, 3: 5, 4: 7}
+
+    def __init__(self, sig, values, function_type=None):
+        self.sig = sig
+        self.values = values
+        self.function_type = function_type
+
+    def __len__(self):
+        return len(self.values)
+
+    def evaluate(self, x):
+        """Returns the curve's output values (0-1) for the input values x (0-1), as a float64 array"""
+        x = np.clip(np.asarray(x, dtype='float64'), 0, 1)
+        if self.sig == 'curv':
+            if len(self.values) == 0:
+                return x
+            if len(self.values) == 1:
+                return x ** (float(self.values[0]) / 256)       # u8Fixed8 gamma
+            return np.interp(x, np.linspace(0, 1, len(self.values)), self.values / 65535)
+
+        g, a, b, c, d, e, f = list(self.values) + [0.0] * (7 - len(self.values))
+        if self.function_type in (1, 2):
+            d = -b / a if a != 0 else 0.0
+        power = np.maximum(a * x + b, 0) ** g
+        if self.function_type == 0:
+            return x ** g
+        if self.function_type == 1:
+            return np.where(x >= d, power, 0.0)
+        if self.function_type == 2:
+            return np.where(x >= d, power + c, c)
+        if self.function_type == 3:
+            return np.where(x >= d, power, c * x)
+        return np.where(x >= d, power + e, c * x + f)
+
+    def __str__(self):
+        if self.sig == 'para':
+            return "{0} : function {1} : {2}".format(self.sig, self.function_type, format_values(self.values))
+        return "{0} : count {1} : {2}".format(self.sig, len(self.values), format_values(self.values))
+
+
+class IccLut():
+    """A lut8Type ('mft1') or lut16Type ('mft2') transform: a 3x3 matrix, per input channel tables, a colour lookup
+       table (grid points per input channel x output channels) and per output channel tables"""
+
+    def __init__(self, sig, matrix, input_tables, clut, output_tables):
+        self.sig = sig
+        self.matrix = matrix
+        self.input_tables = input_tables
+        self.clut = clut
+        self.output_tables = output_tables
+
+    def __len__(self):
+        return self.clut.size
+
+    def __str__(self):
+        return "{0} : {1} in : {2} out : grid {3} : {4}/{5} table entries".format(
+            self.sig, self.input_tables.shape[0], self.output_tables.shape[0], self.clut.shape[0],
+            self.input_tables.shape[1], self.output_tables.shape[1])
+
+
 class IccProfile():
     """Parses an ICC Colour Profile.
        According to spec: all Profile data shall be encoded as big-endian"""
 
     def __init__(self, bytes):
         self.header = {}
+        self.tag_count = 0
+        self.tags = {}
         self.parse_icc(bytes)
 
     def get_colour_space(self):
         """Returns the data colour space type, or None if not defined"""
         return self.header.get('data_colour_space')
 
+    def get_description(self):
+        """Returns the profile's description text, or None if not present"""
+        tag = self.tags.get('desc')
+        if tag is None or not isinstance(tag[2], str):
+            return None
+        return tag[2]
+
     def tostring(self, limit_value=False):
         out = "\nHEADER\n"
         for k, v in self.header.items():
@@ -17,6 +119,7 @@ class IccProfile():
 
         out += "\nTAGS ({0})\n".format(self.tag_count)
         for tag, (offset, size, value) in self.tags.items():
+            value = format_values(value)
             if len(value)>100 and limit_value:
                 out += "  [{0}]\t{1}\t{2}\t{3}...\n".format(tag, offset, size, value[:100])
             else:
@@ -32,6 +135,10 @@ class IccProfile():
         #  - profile tag table:
         #  - profile tagged element data (referenced from tag table)
         if bytes is not None:
+            if isinstance(bytes, (type(b''), bytearray, memoryview)):
+                bytes = np.frombuffer(bytes, dtype='uint8')
+            else:
+                bytes = np.asarray(bytes, dtype='uint8')
             self.read_header(bytes)
             self.read_tags(bytes)
 
@@ -52,8 +159,8 @@ class IccProfile():
         self.header['rendering_intent'] = IccProfile.read_int(bytes, 64)
         self.header['nciexyz_values'] = IccProfile.read_xyznumber(bytes, 68)
         self.header['profile_creator_signature'] = IccProfile.read_string(bytes, 80, 4)
-        self.header['profile_id'] = str(bytes[84:99])
-        self.header['reserved'] = str(bytes[100:128])
+        self.header['profile_id'] = bytes[84:100].tobytes().hex()
+        self.header['reserved'] = bytes[100:128].tobytes().hex()
 
     def read_tags(self, bytes):
         # 4 bytes tag count
@@ -61,26 +168,26 @@ class IccProfile():
         self.tag_count = IccProfile.read_int(bytes, 128)
         self.tags = {}
 
-        for t in range(self.tag_count):
-            type = IccProfile.read_string(bytes, 132+(t*12), 4)
-            offset = IccProfile.read_int(bytes, 136+(t*12))
-            size = IccProfile.read_int(bytes, 140+(t*12))
-
-            read_func = tagtypes.get(type)
+        table = np.frombuffer(bytes, dtype='>u4', count=self.tag_count * 3, offset=132).reshape(-1, 3)
+        sigs = table[:, 0].astype('>u4').tobytes().decode('latin-1')
+        for t, (offset, size) in enumerate(table[:, 1:].tolist()):
+            # element data is read according to its type signature (the element's first 4 bytes)
+            read_func = datatypes.get(IccProfile.read_string(bytes, offset, 4))
+            value = bytes[offset: offset+size]
             if read_func is not None:
-                #read_func = getattr(IccProfile, tag_tuple[0])
-                value = read_func(bytes, offset, size)
-            else:
-                value = bytes[offset: offset+size]
-            self.tags[type] = (offset, size, value)
+                try:
+                    value = read_func(bytes, offset, size)
+                except (ValueError, IndexError):
+                    pass        # truncated or malformed element: keep its bytes
+            self.tags[sigs[t*4:t*4+4]] = (offset, size, value)
 
     @staticmethod
     def read_int(bytes, offset, count=1, size=4, byteorder='big'):
-        return int.from_bytes(bytes[offset:offset+size], byteorder=byteorder)
+        return int.from_bytes(bytes[offset:offset+size].tobytes(), byteorder=byteorder)
 
     @staticmethod
     def read_string(bytes, offset, count, byteorder='big'):
-        return ''.join(map(chr, bytes[offset:offset+count]))
+        return bytes[offset:offset+count].tobytes().decode('latin-1')
 
     @staticmethod
     def read_binary_coded_decimal(bytes, start):
@@ -91,81 +198,172 @@ class IccProfile():
 
     @staticmethod
     def read_datetime(bytes, offset, byteorder='big'):
-        out = "{0}-{1}-{2} {3}:{4}:{5}".format(str(int.from_bytes(bytes[offset:offset + 2], byteorder=byteorder)),
-                                               str(int.from_bytes(bytes[offset + 2:offset + 4], byteorder=byteorder)),
-                                               str(int.from_bytes(bytes[offset + 4:offset + 6], byteorder=byteorder)),
-                                               str(int.from_bytes(bytes[offset + 6:offset + 8], byteorder=byteorder)),
-                                               str(int.from_bytes(bytes[offset + 8:offset + 10], byteorder=byteorder)),
-                                               str(int.from_bytes(bytes[offset + 10:offset + 12], byteorder=byteorder)))
-        return out
+        return "{0}-{1}-{2} {3}:{4}:{5}".format(*np.frombuffer(bytes, dtype='>u2', count=6, offset=offset).tolist())
 
     @staticmethod
     def read_signature_type(bytes, offset, count):
-        assert (IccProfile.read_string(bytes, offset, 4) == 'sig ')
-        assert (IccProfile.read_int(bytes, offset + 4) == 0)
         return IccProfile.read_string(bytes, offset+8, 4)
 
     @staticmethod
-    def read_xyztype(bytes, offset, count):
-        sig = IccProfile.read_string(bytes, offset, 4)
-        assert(IccProfile.read_int(bytes, offset+4) == 0)
-        # todo: repeat xyz for remainder of xyztype bytes
-        xyz = IccProfile.read_xyznumber(bytes, offset+8)
+    def read_text_type(bytes, offset, count):
+        return IccProfile.read_string(bytes, offset+8, count-8).rstrip('\x00')
+
+    @staticmethod
+    def read_text_description_type(bytes, offset, count):
+        n = IccProfile.read_int(bytes, offset+8)
+        return IccProfile.read_string(bytes, offset+12, n).rstrip('\x00')
+
+    @staticmethod
+    def read_multi_localized_unicode_type(bytes, offset, count):
+        """Returns the text of the first record (language and country) of a multiLocalizedUnicodeType"""
+        if IccProfile.read_int(bytes, offset+8) == 0:
+            return ''
+        # records: language, country, length and offset (from the start of the element) of UTF-16BE text
+        length = IccProfile.read_int(bytes, offset+20)
+        start = offset + IccProfile.read_int(bytes, offset+24)
+        return bytes[start:start+length].tobytes().decode('utf-16-be', errors='replace').rstrip('\x00')
 
-        return "{0}: {1}".format(sig, xyz)
+    @staticmethod
+    def read_xyztype(bytes, offset, count):
+        """Returns the XYZ numbers of an XYZType as an (n, 3) array"""
+        return IccProfile.read_s15Fixed16Numbers(bytes, offset+8, (count-8)//4).reshape(-1, 3)
 
     @staticmethod
     def read_xyznumber(bytes, offset, byteorder='big'):
-        x_i = IccProfile.read_s15Fixed16Number(bytes, offset)
-        y_i = IccProfile.read_s15Fixed16Number(bytes, offset+4)
-        z_i = IccProfile.read_s15Fixed16Number(bytes, offset+8)
+        return format_values(IccProfile.read_s15Fixed16Numbers(bytes, offset, 3).reshape(1, 3))
 
-        return "X={0}, Y={1}, Z={2}".format(x_i, y_i, z_i)
+    @staticmethod
+    def read_chromaticity_type(bytes, offset, count):
+        """Returns the (x, y) chromaticity coordinates of each channel of a chromaticityType as an (n, 2) array"""
+        n = IccProfile.read_int(bytes, offset+8, size=2)
+        return (np.frombuffer(bytes, dtype='>u4', count=n * 2, offset=offset+12) / 65536).reshape(-1, 2)
 
     @staticmethod
     def read_trctype(bytes, offset, count):
-        # check first 4 bytes, either 'curv' or 'para'
-        sig = IccProfile.read_string(bytes, offset, 4)
-        if sig=='curv':
-            # next 4 bytes 0
-            assert (IccProfile.read_int(bytes, offset + 4) == 0)
-            n = IccProfile.read_int(bytes, offset+8)
-            vals = [IccProfile.read_int(bytes, offset+12+(2*i), size=2) for i in range(n)]
-        # todo: para
+        """Returns a 'curv' curveType's uint16 samples (or u8Fixed8 gamma) as an IccCurve"""
+        n = IccProfile.read_int(bytes, offset+8)
+        return IccCurve('curv', np.frombuffer(bytes, dtype='>u2', count=n, offset=offset+12).astype('uint16'))
 
-        return "{0} : count {1} : {2}".format(sig, n, vals)
+    @staticmethod
+    def read_parametric_curve_type(bytes, offset, count):
+        """Returns a 'para' parametricCurveType's function type and parameters as an IccCurve"""
+        function_type = IccProfile.read_int(bytes, offset+8, size=2)
+        n = IccCurve.PARAMETERS[function_type] if function_type in IccCurve.PARAMETERS else (count-12)//4
+        return IccCurve('para', IccProfile.read_s15Fixed16Numbers(bytes, offset+12, n), function_type)
 
     @staticmethod
     def read_s15Fixed16Number(bytes, offset):
-        conv = lambda x: ((x & 0xffff0000) >> 16) + ((x & 0x0000ffff) / 65536)
-        return conv(int.from_bytes(bytes[offset:offset + 4], byteorder='big'))
+        return float(IccProfile.read_s15Fixed16Numbers(bytes, offset, 1)[0])
+
+    @staticmethod
+    def read_s15Fixed16Numbers(bytes, offset, n):
+        """Returns n (signed) s15Fixed16Numbers as a float64 array"""
+        return np.frombuffer(bytes, dtype='>i4', count=n, offset=offset) / 65536
 
     @staticmethod
     def read_s15Fixed16ArrayType(bytes, offset, count):
-        assert(IccProfile.read_string(bytes, offset, 4) == 'sf32')
-        assert(IccProfile.read_int(bytes, offset+4) == 0)
-        n = int((count-8)/4)
-        return [IccProfile.read_s15Fixed16Number(bytes, offset+8+(i*4)) for i in range(n)]
-
-tagtypes = {
-    'chad': (IccProfile.read_s15Fixed16ArrayType),
-    'cprt': (IccProfile.read_string),
-    'desc': (IccProfile.read_string),
-    'dmdd': (IccProfile.read_string),
-    'tech': (IccProfile.read_signature_type),
-    'vued': (IccProfile.read_string),
-    'wtpt': (IccProfile.read_xyztype),
-    'bkpt': (IccProfile.read_xyztype),      # private type?
-    'rTRC': (IccProfile.read_trctype),
-    'gTRC': (IccProfile.read_trctype),
-    'bTRC': (IccProfile.read_trctype),
-    'rXYZ': (IccProfile.read_xyztype),
-    'gXYZ': (IccProfile.read_xyztype),
-    'bXYZ': (IccProfile.read_xyztype),
+        return IccProfile.read_s15Fixed16Numbers(bytes, offset+8, (count-8)//4)
+
+    @staticmethod
+    def read_lut_type(bytes, offset, count):
+        """Returns a lut8Type ('mft1') or lut16Type ('mft2') as an IccLut, with tables as uint8 or uint16 arrays"""
+        sig = IccProfile.read_string(bytes, offset, 4)
+        inputs, outputs, grid = (int(b) for b in bytes[offset+8:offset+11])
+        matrix = IccProfile.read_s15Fixed16Numbers(bytes, offset+12, 9).reshape(3, 3)
+        if sig == 'mft1':
+            dtype, input_entries, output_entries, start = np.dtype('uint8'), 256, 256, offset+48
+        else:
+            dtype, start = np.dtype('>u2'), offset+52
+            input_entries = IccProfile.read_int(bytes, offset+48, size=2)
+            output_entries = IccProfile.read_int(bytes, offset+50, size=2)
+
+        def read_table(n, shape):
+            nonlocal start
+            table = np.frombuffer(bytes, dtype=dtype, count=n, offset=start)
+            start += n * dtype.itemsize
+            return table.astype(dtype.newbyteorder('=')).reshape(shape)
+
+        input_tables = read_table(inputs * input_entries, (inputs, input_entries))
+        clut = read_table(grid ** inputs * outputs, (grid,) * inputs + (outputs,))
+        output_tables = read_table(outputs * output_entries, (outputs, output_entries))
+        return IccLut(sig, matrix, input_tables, clut, output_tables)
+
+
+class IccProfileCache():
+    """A bounded, least recently used, cache of parsed ICC profiles keyed by a digest of the profile bytes, so that
+       a profile embedded in many files (or IFDs) is only parsed once"""
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._profiles = OrderedDict()
+
+    @staticmethod
+    def digest(data):
+        """Returns the (128 bit BLAKE2b) hex digest of the profile bytes"""
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = np.asarray(data, dtype='uint8').tobytes()
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    def lookup(self, data):
+        """Returns the digest of the profile bytes and the parsed IccProfile, parsing the bytes only if not cached"""
+        key = IccProfileCache.digest(data)
+        profile = self._profiles.get(key)
+        if profile is not None:
+            self._profiles.move_to_end(key)
+            self.hits += 1
+        else:
+            profile = IccProfile(data)
+            self.misses += 1
+            self._profiles[key] = profile
+            if len(self._profiles) > self.maxsize:
+                self._profiles.popitem(last=False)
+        return key, profile
+
+    def get(self, data):
+        """Returns the parsed IccProfile of the profile bytes"""
+        return self.lookup(data)[1]
+
+    def summary(self, data):
+        """Returns a summary of the profile: its digest, size, version, device class, colour space and description"""
+        key, profile = self.lookup(data)
+        return {"digest": key,
+                "size": len(data),
+                "version": profile.header.get('profile_version_number'),
+                "device_class": profile.header.get('profile_device_class'),
+                "colour_space": profile.get_colour_space(),
+                "description": profile.get_description()}
+
+    def clear(self):
+        self._profiles.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._profiles)
+
+
+# parsed profiles shared by all files processed in this process
+profile_cache = IccProfileCache()
+
+
+# element data types, by type signature
+datatypes = {
+    'chrm': IccProfile.read_chromaticity_type,
+    'curv': IccProfile.read_trctype,
+    'desc': IccProfile.read_text_description_type,
+    'mft1': IccProfile.read_lut_type,
+    'mft2': IccProfile.read_lut_type,
+    'mluc': IccProfile.read_multi_localized_unicode_type,
+    'para': IccProfile.read_parametric_curve_type,
+    'sf32': IccProfile.read_s15Fixed16ArrayType,
+    'sig ': IccProfile.read_signature_type,
+    'text': IccProfile.read_text_type,
+    'XYZ ': IccProfile.read_xyztype,
 }
 
 if __name__=='__main__':
-    import numpy as np
     import sys
     with open(sys.argv[1], 'rb') as file:
         data = np.fromfile(file, dtype="uint8")
@@ -0,0 +1,166 @@
+"""
+Colour transforms of pixel data using ICC matrix/TRC profiles.
+
+A transform converts pixels, a strip at a time, to linear light (the profile's tone reproduction curves undone), to
+the CIE XYZ (D50) profile connection space, or to sRGB. Integer pixels are linearised with per-channel lookup tables
+computed once from the curves, followed by a single 3x3 matrix multiply and, for sRGB, an encoding lookup table,
+so the conversion runs at close to memory speed. Compiled transforms are cached per profile, target and bit depth.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+from tifinity.actions.icc_parser import profile_cache
+from tifinity.parser.errors import UnsupportedProfileError
+
+TARGETS = ("linear", "xyz", "srgb")
+
+# linear sRGB to CIE XYZ, chromatically adapted to D50 (the profile connection space)
+SRGB_TO_XYZ_D50 = np.array([[0.4360747, 0.3850649, 0.1430804],
+                            [0.2225045, 0.7168786, 0.0606169],
+                            [0.0139322, 0.0971045, 0.7141733]])
+XYZ_D50_TO_SRGB = np.linalg.inv(SRGB_TO_XYZ_D50)
+
+# D50 white point, used for grayscale profiles without a media white point
+D50 = np.array([0.9642, 1.0, 0.8249])
+
+
+def srgb_encode(linear):
+    """Returns the sRGB encoded values (0-1) of linear values"""
+    linear = np.clip(linear, 0, 1)
+    return np.where(linear <= 0.0031308, linear * 12.92, 1.055 * np.power(linear, 1 / 2.4) - 0.055)
+
+
+class IccTransform():
+    """A compiled transform of the pixels of images with the specified RGB (matrix/TRC) or grayscale (TRC) ICC
+       profile to the target: 'linear', 'xyz' or 'srgb'.
+
+       Linear and XYZ output is float32. sRGB output has the same type as the input pixels (float32 for floating
+       point input). Extra samples (e.g. alpha) are not included in the output."""
+
+    def __init__(self, profile, target="xyz", bits=8):
+        if target not in TARGETS:
+            raise ValueError("Unknown colour transform target: {0}".format(target))
+        self.target = target
+        self.bits = bits
+
+        colour_space = profile.get_colour_space()
+        if colour_space == 'RGB ':
+            self.curves = [IccTransform._tag(profile, sig) for sig in ('rTRC', 'gTRC', 'bTRC')]
+            matrix = np.column_stack([IccTransform._tag(profile, sig)[0] for sig in ('rXYZ', 'gXYZ', 'bXYZ')])
+        elif colour_space == 'GRAY':
+            self.curves = [IccTransform._tag(profile, 'kTRC')]
+            white = profile.tags.get('wtpt')
+            white = white[2][0] if white is not None and isinstance(white[2], np.ndarray) else D50
+            matrix = white.reshape(3, 1)                        # gray is the luminance of the white point
+        else:
+            raise UnsupportedProfileError("Unsupported ICC profile colour space: {0!r}".format(colour_space))
+
+        self.channels = len(self.curves)
+        if target == "linear":
+            self.matrix = None
+        elif target == "xyz":
+            self.matrix = matrix
+        else:
+            self.matrix = XYZ_D50_TO_SRGB @ matrix if colour_space == 'RGB ' else None
+        self.output_samples = self.channels if self.matrix is None else self.matrix.shape[0]
+
+        self._input_luts = {}
+        self._output_luts = {}
+
+    @staticmethod
+    def _tag(profile, sig):
+        tag = profile.tags.get(sig)
+        if tag is None or isinstance(tag[2], np.ndarray) and tag[2].dtype == np.uint8:
+            raise UnsupportedProfileError("ICC profile has no (readable) {0} tag; only matrix/TRC profiles are "
+                                          "supported".format(sig))
+        return tag[2]
+
+    def output_dtype(self, dtype):
+        """Returns the type of the output for pixels of the specified type"""
+        dtype = np.dtype(dtype)
+        if self.target == "srgb" and dtype.kind == 'u' and dtype.itemsize <= 2:
+            return dtype
+        return np.dtype('float32')
+
+    def input_lut(self, dtype):
+        """Returns the (channels, 2^bits) float32 tables of the linear values of each channel's integer samples"""
+        lut = self._input_luts.get(dtype)
+        if lut is None:
+            bits = min(self.bits, dtype.itemsize * 8)
+            x = np.arange(2 ** bits) / ((2 ** bits) - 1)
+            lut = np.stack([curve.evaluate(x) for curve in self.curves]).astype('float32')
+            self._input_luts[dtype] = lut
+        return lut
+
+    def output_lut(self, dtype):
+        """Returns the table of sRGB encoded output values, indexed by the square root of the linear value quantised
+           to the table size (so shadows, where encoding is steepest, are finely sampled)"""
+        lut = self._output_luts.get(dtype)
+        if lut is None:
+            maximum = np.iinfo(dtype).max
+            size = 4096 if dtype.itemsize == 1 else 65536
+            lut = np.rint(srgb_encode(np.linspace(0, 1, size) ** 2) * maximum).astype(dtype)
+            self._output_luts[dtype] = lut
+        return lut
+
+    def linearise(self, pixels):
+        """Returns the (rows, width, channels) float32 linear values of the colour channels of the pixels"""
+        if pixels.ndim == 2:
+            pixels = pixels[:, :, np.newaxis]
+        colour = pixels[:, :, :self.channels]
+        if pixels.dtype.kind == 'u' and pixels.dtype.itemsize <= 2:
+            lut = self.input_lut(pixels.dtype)
+            linear = np.empty(colour.shape, dtype='float32')
+            for c in range(self.channels):
+                np.take(lut[c], colour[:, :, c], out=linear[:, :, c], mode='clip')
+            return linear
+        return np.stack([curve.evaluate(colour[:, :, c]) for c, curve in enumerate(self.curves)],
+                        axis=2).astype('float32')
+
+    def apply(self, pixels):
+        """Returns the transformed (rows, width, output samples) pixels"""
+        values = self.linearise(pixels)
+        if self.matrix is not None:
+            values = values @ self.matrix.T.astype('float32')
+        if self.target != "srgb":
+            return values
+
+        dtype = self.output_dtype(pixels.dtype)
+        if dtype.kind == 'f':
+            return srgb_encode(values).astype('float32')
+        lut = self.output_lut(dtype)
+        index = np.sqrt(np.clip(values, 0, 1), out=values) * (len(lut) - 1) + 0.5
+        index = index.astype(np.intp)
+        return lut[index]
+
+
+# compiled transforms, by profile digest, target and bits per sample
+_transforms = OrderedDict()
+TRANSFORM_CACHE_SIZE = 32
+
+
+def get_transform(profile_data, target="xyz", bits=8):
+    """Returns the compiled IccTransform for the profile bytes, target and bits per sample, compiling it only if
+       not already cached"""
+    digest, profile = profile_cache.lookup(profile_data)
+    key = (digest, target, bits)
+    transform = _transforms.get(key)
+    if transform is not None:
+        _transforms.move_to_end(key)
+        return transform
+
+    transform = IccTransform(profile, target, bits)
+    _transforms[key] = transform
+    if len(_transforms) > TRANSFORM_CACHE_SIZE:
+        _transforms.popitem(last=False)
+    return transform
+
+
+def ifd_transform(ifd, target="xyz"):
+    """Returns the compiled transform for the IFD's embedded ICC profile, or raises UnsupportedProfileError if the
+       IFD has no profile"""
+    data = ifd.get_tag_value(34675)
+    if data is None:
+        raise UnsupportedProfileError("Image has no embedded ICC profile")
+    return get_transform(data, target, ifd.get_bits_per_sample()[0])
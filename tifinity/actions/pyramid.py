@@ -0,0 +1,150 @@
+import numpy as np
+
+from tifinity.actions.thumbnail import ImageSource, Thumbnail
+from tifinity.parser import compression
+from tifinity.parser.tiff import Tiff
+from tifinity.scripts.executor import get_executor
+
+
+class PyramidLevel():
+    """One level of an image pyramid, built from bands of rows supplied in order. Rows are buffered until a full
+       row of tiles is available, which is then cut into (zero padded) tiles and encoded in parallel, so only up to
+       one row of tiles per level is held uncompressed.
+
+       Each band is also halved (2x2 box average) for the next level; a trailing odd row is carried over to the
+       next band, and odd final rows or columns are averaged with themselves."""
+
+    def __init__(self, width, height, samples, dtype, tile_size, encode_tile, executor):
+        self.width = width
+        self.height = height
+        self.samples = samples
+        self.dtype = np.dtype(dtype)
+        self.tile_size = tile_size
+        self.encode_tile = encode_tile
+        self.executor = executor
+        self.tiles_across = (width + tile_size - 1) // tile_size
+
+        self.tiles = []             # encoded tiles, in TileOffsets order
+        self.received = 0           # number of rows added so far
+        self._buffer = []           # bands of rows not yet written as tiles
+        self._buffered = 0
+        self._carry = None          # odd row awaiting its pair for halving
+
+    def add_rows(self, rows, halve=True):
+        """Adds a band of rows to this level, encoding any completed rows of tiles, and returns the band halved
+           for the next level (possibly with no rows), or None if halve is False."""
+        self.received += len(rows)
+        self._buffer.append(rows)
+        self._buffered += len(rows)
+        while self._buffered >= self.tile_size or (self.received >= self.height and self._buffered > 0):
+            self._write_tile_row()
+        return self._halve(rows) if halve else None
+
+    def _write_tile_row(self):
+        band = np.concatenate(self._buffer) if len(self._buffer) > 1 else self._buffer[0]
+        rows, rest = band[:self.tile_size], band[self.tile_size:]
+        self._buffer = [rest] if len(rest) > 0 else []
+        self._buffered = len(rest)
+
+        padded = np.zeros((self.tile_size, self.tiles_across * self.tile_size, self.samples), dtype=self.dtype)
+        padded[:len(rows), :self.width] = rows
+        tiles = [padded[:, x * self.tile_size:(x + 1) * self.tile_size] for x in range(self.tiles_across)]
+        self.tiles.extend(self.executor.map(self.encode_tile, tiles))
+
+    def _halve(self, rows):
+        if self._carry is not None:
+            rows = np.concatenate([self._carry, rows])
+            self._carry = None
+        if len(rows) % 2 == 1:
+            if self.received < self.height:
+                self._carry = rows[-1:]
+                rows = rows[:-1]
+            else:
+                rows = np.concatenate([rows, rows[-1:]])
+        if self.width % 2 == 1:
+            rows = np.concatenate([rows, rows[:, -1:]], axis=1)
+
+        summed = rows[0::2].astype('float64') + rows[1::2]
+        summed = summed[:, 0::2] + summed[:, 1::2]
+        halved = summed / 4
+        if self.dtype.kind in 'ui':
+            halved = np.rint(halved)
+        return halved.astype(self.dtype)
+
+
+class Pyramid():
+
+    @staticmethod
+    def level_sizes(width, height, tile_size):
+        """Returns the (width, height) of each level of a pyramid, halving (rounding up) until a level fits in a
+           single tile"""
+        sizes = [(width, height)]
+        while sizes[-1][0] > tile_size or sizes[-1][1] > tile_size:
+            width, height = sizes[-1]
+            sizes.append(((width + 1) // 2, (height + 1) // 2))
+        return sizes
+
+    @staticmethod
+    def create(tiff, tile_size=256, layout="subifd", compression_type="deflate", level=None, predictor=None,
+               threads=None):
+        """Creates a new tiled Tiff containing the specified Tiff's main image and successively halved reduced
+           resolution images, down to a single tile.
+
+           With the 'subifd' layout the reduced images are SubIFDs of the main image, otherwise ('chained') they
+           follow it in the main IFD chain. The source is read one strip at a time, in a single pass, with each
+           band of rows cascading down through the levels. If the Tiff was parsed header-only (images=False), the
+           strips are read from the memory mapped file as they are needed."""
+        if tile_size <= 0 or tile_size % 16 != 0:
+            raise ValueError("Tile size must be a positive multiple of 16")
+        if layout not in ("subifd", "chained"):
+            raise ValueError("Unknown pyramid layout: {0}".format(layout))
+
+        ifd = Thumbnail.main_ifd(tiff)
+        source = ImageSource(ifd, tiff.strip_views(ifd) if ifd.img_data is None else None)
+        executor = get_executor(threads)
+        out = Tiff()
+        dtype = out.file_dtype(source.dtype)
+
+        compression_type = compression.get_compression_code(compression_type)
+        if predictor is None or compression_type == compression.NONE:
+            predictor = compression.PREDICTOR_NONE
+        bits = dtype.itemsize * 8
+        compression.check_predictor(predictor, bits, {'u': 1, 'i': 2, 'f': 3}[dtype.kind])
+        row_bytes = tile_size * source.samples * dtype.itemsize
+
+        def encode_tile(tile):
+            data = np.ascontiguousarray(tile, dtype=dtype).reshape(-1).view('uint8')
+            data = compression.apply_predictor(data, predictor, tile_size, source.samples, bits, out.byteOrder)
+            return compression.encode(data, compression_type, level, row_bytes)
+
+        levels = [PyramidLevel(width, height, source.samples, source.dtype, tile_size, encode_tile, executor)
+                  for (width, height) in Pyramid.level_sizes(ifd.get_image_width(), ifd.get_image_height(),
+                                                             tile_size)]
+
+        # decode a batch of strips in parallel, then feed them through the levels in order
+        num_strips = ifd.get_number_strips()
+        for first in range(0, num_strips, executor.threads):
+            strips = executor.map(lambda index: source.convert(source.strip_pixels(index)),
+                                  range(first, min(num_strips, first + executor.threads)))
+            for rows in strips:
+                for i, pyramid_level in enumerate(levels):
+                    rows = pyramid_level.add_rows(rows, halve=i < len(levels) - 1)
+                    if rows is None or len(rows) == 0:
+                        break
+
+        ifds = []
+        for i, pyramid_level in enumerate(levels):
+            level_ifd = out.create_ifd(pyramid_level.width, pyramid_level.height, source.samples, dtype,
+                                       source.photometric, subfile_type=0 if i == 0 else 1)
+            level_ifd.set_tiles(pyramid_level.tiles, tile_size, tile_size)
+            if predictor != compression.PREDICTOR_NONE:
+                level_ifd.set_tag("Predictor", 3, [predictor])
+            level_ifd.set_tag("Compression", 3, [compression_type])
+            ifds.append(level_ifd)
+
+        out.ifds.append(ifds[0])
+        if layout == "subifd":
+            ifds[0].sub_ifds = ifds[1:]
+        else:
+            out.ifds.extend(ifds[1:])
+        return out
@@ -1,21 +1,18 @@
 import numpy as np
-from numpy.lib.stride_tricks import as_strided
 
-class rgb72_to_rgb96():
+from tifinity.parser.pixels import float24_to_float32
+from tifinity.scripts.executor import get_executor
+
 
-    def __init__(self):
-        self._vconv = np.vectorize(self._convert)
+class rgb72_to_rgb96():
 
-    @staticmethod
-    def _convert(x):
-        """Helper conversion function: if rgb[0]>0 then (0x80 * rgb[0])+0x20000000 else 0x00"""
-        if x > 0x00:
-            x = (0x80 * x) + 0x20000000
-        return x
+    def __init__(self, threads=None):
+        self.threads = threads
 
     def migrate(self, tiff):
         """Converts a 24 bit per channel pixel to a 32 bit per channel floating point value."""
         migrated = False
+        executor = get_executor(self.threads)
 
         for ifd in tiff.ifds:
             # Check that the file is an RGB one
@@ -26,28 +23,31 @@ class rgb72_to_rgb96():
 
             # Check that the file is encoded as 24 bits per colour channel
             bps = ifd.get_bits_per_sample()
-            if bps != [24, 24, 24]:
+            if list(bps) != [24, 24, 24]:
                 # not 3x 24bit RGB channels
                 continue
 
-            # need to limit striding to complete pixel ranges during conversion.
-            completerange = ifd.img_data.shape[0] - ifd.img_data.shape[0]%12
-            raw = ifd.img_data[:completerange]
+            # convert each strip's 24 bit values to their 32 bit float equivalents, in the TIFF's byte order
+            rgb32 = np.empty((ifd.get_image_height(), ifd.get_image_width(), 3),
+                             dtype=('<' if ifd.byteorder == 'little' else '>') + 'f4')
+            rows_per_strip = ifd.get_rows_per_strip()
 
-            # Read in each pixel's channel (every 3 bytes) in 4 byte chunks
-            rgbpixels = as_strided(raw.view(np.int32), strides=(9, 3,), shape=(1, int(raw.shape[0] / 3)))
-            # Now take the 3bytes LSB of each 4 byte chunk to get the 24 bit (per channel) value
-            rgb = rgbpixels & 0x00ffffff
+            def convert_strip(index):
+                rgb = ifd.strip_pixels(index)
+                if rgb.dtype.kind != 'f':
+                    rgb = float24_to_float32(rgb)   # 24 bit values are always treated as floating point
+                rgb32[index * rows_per_strip:(index * rows_per_strip) + len(rgb)] = rgb
 
-            # convert each 24 bit value to the 32 bit equivalent based on the helper function.
-            rgb32 = self._vconv(rgb[0])
-            ifd.img_data = rgb32.view(dtype='uint8')
+            executor.map(convert_strip, range(ifd.get_number_strips()))
 
             # now set IFD tag values:
-            # bitsPerSample, rowsPerStrip, stripByteCount
+            # bitsPerSample, sampleFormat, and a single uncompressed, chunky strip (replacing any tiles or planes)
             ifd.set_bits_per_sample([32, 32, 32])
-            ifd.set_strip_byte_counts([len(ifd.img_data)])
-            # tiff.ifds[0].setRowsPerStrip([])
+            ifd.set_tag("SampleFormat", 3, [3, 3, 3])
+            ifd.set_tag("PlanarConfiguration", 3, [1])
+            ifd.set_tag("Compression", 3, [1])
+            ifd.remove_tag("Predictor")
+            ifd.set_strips([rgb32.reshape(-1).view(dtype='uint8')], ifd.get_image_height())
 
             migrated = True
         return migrated
@@ -0,0 +1,144 @@
+"""
+Long running tifinity server, amortising interpreter start up and imports over many commands.
+
+Jobs are JSON objects, one per line, read from a stream (stdin, or a Unix socket connection). A job is either a full
+command line, {"argv": ["checksum", "file.tif"]}, or a module name and its arguments,
+{"module": "checksum", "args": ["file.tif"]}, parsed exactly as on the command line and passed to the module's
+process_cli. An optional "id" is returned with the result, and an optional "cwd" sets the working directory that
+relative paths are resolved against.
+
+Jobs run in a pool of warm worker processes (with every module pre-imported), and a result is written, as a JSON
+line, as soon as its job completes: {"id": ..., "status": 0, "output": "...", "errors": "...", "result": ...}, where
+output and errors are the printed output of the command and result is the return value of process_cli.
+"""
+import contextlib
+import io
+import json
+import os
+import socketserver
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+STATUS_USAGE = 2
+
+
+def _warm_worker():
+    """Worker process initialiser, importing every module (and so the parser and numpy) up front"""
+    from tifinity.__main__ import load_module
+    from tifinity.modules import manifest
+    for name in manifest:
+        load_module(name)
+
+
+def job_argv(job):
+    """Returns the command line (without the program name) for the specified job"""
+    if "argv" in job:
+        return [str(arg) for arg in job["argv"]]
+    return [str(job["module"])] + [str(arg) for arg in job.get("args", [])]
+
+
+def run_job(job):
+    """Runs a single job in the current process, returning its result dictionary"""
+    from tifinity.__main__ import parse_arguments
+    from tifinity.parser.parse_index import set_default_index
+    from tifinity.scripts.executor import set_default_threads
+
+    output = io.StringIO()
+    errors = io.StringIO()
+    result = {"id": job.get("id"), "status": STATUS_OK, "result": None}
+
+    cwd = os.getcwd()
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(errors):
+        try:
+            if job.get("cwd") is not None:
+                os.chdir(job["cwd"])
+            ap, arguments = parse_arguments(job_argv(job))
+            if arguments.module is None or not hasattr(arguments, "func"):
+                ap.print_usage()
+                result["status"] = STATUS_USAGE
+            else:
+                set_default_threads(arguments.threads)
+                set_default_index(arguments.index)
+                value = arguments.func(arguments)
+                result["result"] = json.loads(json.dumps(value, default=str))
+        except SystemExit as e:             # argparse usage errors and --help
+            result["status"] = e.code if isinstance(e.code, int) else STATUS_ERROR
+        except Exception as e:
+            result["status"] = STATUS_ERROR
+            print("{0}: {1}".format(type(e).__name__, e), file=errors)
+        finally:
+            os.chdir(cwd)
+
+    result["output"] = output.getvalue()
+    result["errors"] = errors.getvalue()
+    return result
+
+
+class TifinityServer():
+    """Runs jobs read from JSON line streams in a pool of warm worker processes"""
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(self.workers, initializer=_warm_worker)
+
+    def serve_stream(self, in_stream, out_stream):
+        """Submits each job read from in_stream to the pool, writing results to out_stream as they complete.
+           Returns the number of jobs run once all have completed."""
+        lock = threading.Lock()
+        done = threading.Semaphore(0)
+
+        def write(result):
+            with lock:
+                out_stream.write(json.dumps(result) + "\n")
+                out_stream.flush()
+            done.release()
+
+        def completed(future, job_id):
+            try:
+                write(future.result())
+            except Exception as e:          # e.g. the worker process died
+                write({"id": job_id, "status": STATUS_ERROR, "output": "", "result": None,
+                       "errors": "{0}: {1}\n".format(type(e).__name__, e)})
+
+        count = 0
+        for line in in_stream:
+            if not line.strip():
+                continue
+            count += 1
+            try:
+                job = json.loads(line)
+                job_argv(job)
+            except (ValueError, KeyError, TypeError) as e:
+                write({"id": None, "status": STATUS_USAGE, "output": "", "result": None,
+                       "errors": "Invalid job: {0}\n".format(e)})
+                continue
+            future = self.pool.submit(run_job, job)
+            future.add_done_callback(lambda f, job_id=job.get("id"): completed(f, job_id))
+
+        for _ in range(count):
+            done.acquire()
+        return count
+
+    def serve_socket(self, socket_path):
+        """Accepts connections on the specified Unix socket until interrupted, serving the jobs sent on each
+           connection (see serve_stream)"""
+        server = self
+
+        class JobHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                in_stream = io.TextIOWrapper(self.rfile, encoding='utf-8')
+                out_stream = io.TextIOWrapper(self.wfile, encoding='utf-8', write_through=True)
+                server.serve_stream(in_stream, out_stream)
+
+        if os.path.exists(socket_path):
+            os.remove(socket_path)              # stale socket from a previous server
+        with socketserver.ThreadingUnixStreamServer(socket_path, JobHandler) as unix_server:
+            try:
+                unix_server.serve_forever()
+            finally:
+                os.remove(socket_path)
+
+    def shutdown(self):
+        self.pool.shutdown()
@@ -0,0 +1,145 @@
+"""
+Fast classification of files as TIFFs, from their header and first IFD alone.
+
+Parsing a TIFF (even header-only) reads every IFD and tag value, and loading it reads the whole file. Sniffing reads
+only the 8 byte header, the entries of IFD 0 (and BitsPerSample, if not stored in its entry) and the entry count and
+next IFD pointer of each further IFD to count the pages: a few small reads per file, so that batch operations over
+mixed folders can skip files which are not TIFFs, or don't need processing, before any heavy work.
+"""
+import struct
+
+from tifinity.actions.collection import batches, find_tiffs, ordered_map
+from tifinity.parser.sources import TIFF_EXTENSIONS, ByteSource, open_source, source_name
+
+TIFF = "tiff"
+BIGTIFF = "bigtiff"                 # recognised, but not supported by the parser
+NOT_TIFF = "not_tiff"
+ERROR = "error"
+
+MAX_PAGES = 100000                  # stop counting pages (e.g. in a corrupt IFD chain) after this many
+
+# tag type: struct format of a single value
+TYPE_FORMATS = {1: "B", 3: "H", 4: "I", 6: "b", 8: "h", 9: "i"}
+
+FIELDS = ["file", "kind", "byte_order", "pages", "width", "height", "samples", "bits_per_sample", "sample_format",
+          "compression", "photometric", "layout", "error"]
+
+
+class Sniffer():
+    """Reads the values of a TIFF's header and IFD 0 from a ByteSource"""
+
+    def __init__(self, source):
+        self.source = source
+        self.order = "<"
+
+    def read(self, offset, fmt):
+        """Returns the values of the struct format (in the file's byte order) read at the offset"""
+        size = struct.calcsize(self.order + fmt)
+        data = self.source.read(offset, size)
+        if len(data) < size:
+            raise EOFError("Read past the end of the file at offset {0}".format(offset))
+        return struct.unpack(self.order + fmt, data)
+
+    def entries(self, offset):
+        """Returns {tag: (type, count, value or value offset bytes)} for the IFD at the offset"""
+        (count,) = self.read(offset, "H")
+        data = self.source.read(offset + 2, count * 12)
+        entries = {}
+        for i in range(len(data) // 12):
+            tag, tag_type, tag_count = struct.unpack(self.order + "HHI", data[i * 12:i * 12 + 8])
+            entries[tag] = (tag_type, tag_count, data[i * 12 + 8:i * 12 + 12])
+        return entries
+
+    def values(self, entry, limit=None):
+        """Returns the list of integer values of an IFD entry, or only the first limit values. Entries whose values
+           would extend past the end of the file (e.g. a corrupt count) raise an EOFError without being read."""
+        tag_type, count, inline = entry
+        fmt = TYPE_FORMATS.get(tag_type)
+        if fmt is None:
+            return []
+        size = struct.calcsize(fmt) * count
+        if limit is not None:
+            count = min(count, limit)
+        if size <= 4:
+            return list(struct.unpack(self.order + fmt * count, inline[:struct.calcsize(fmt) * count]))
+        (offset,) = struct.unpack(self.order + "I", inline)
+        if offset + size > self.source.size:
+            raise EOFError("Value of {0} bytes at offset {1} extends past the end of the file".format(size, offset))
+        return list(self.read(offset, fmt * count))
+
+    def count_pages(self, offset):
+        """Returns the number of IFDs in the chain starting at the offset"""
+        pages = 0
+        seen = set()
+        while offset != 0 and offset not in seen and pages < MAX_PAGES:
+            seen.add(offset)
+            (count,) = self.read(offset, "H")
+            pages += 1
+            (offset,) = self.read(offset + 2 + count * 12, "I")
+        return pages
+
+
+def sniff_file(filename):
+    """Returns a record classifying the file (kind tiff, bigtiff, not_tiff or error) from its header, with the byte
+       order, number of pages and IFD 0's dimensions, samples, bits per sample, sample format, compression,
+       photometric interpretation and layout (striped or tiled) of TIFFs. The file may also be a ByteSource."""
+    record = dict.fromkeys(FIELDS)
+    record["file"] = source_name(filename)
+    source = None
+    try:
+        source = filename if isinstance(filename, ByteSource) else open_source(filename)
+        sniffer = Sniffer(source)
+        header = source.read(0, 8)
+        if len(header) < 8 or header[:2] not in (b"II", b"MM"):
+            record["kind"] = NOT_TIFF
+            return record
+        sniffer.order = "<" if header[:2] == b"II" else ">"
+        (magic,) = struct.unpack(sniffer.order + "H", header[2:4])
+        if magic not in (42, 43):
+            record["kind"] = NOT_TIFF
+            return record
+        record["byte_order"] = "little" if sniffer.order == "<" else "big"
+        if magic == 43:
+            record["kind"] = BIGTIFF
+            return record
+
+        record["kind"] = TIFF
+        (first,) = sniffer.read(4, "I")
+        record["pages"] = sniffer.count_pages(first)
+        if record["pages"] == 0:
+            return record
+
+        entries = sniffer.entries(first)
+
+        def single(tag, default=None):
+            values = sniffer.values(entries[tag], 1) if tag in entries else []
+            return values[0] if values else default
+
+        record["width"] = single(256)
+        record["height"] = single(257)
+        record["samples"] = single(277, 1)
+        record["bits_per_sample"] = sniffer.values(entries[258], record["samples"]) if 258 in entries else [1]
+        record["sample_format"] = single(339, 1)
+        record["compression"] = single(259, 1)
+        record["photometric"] = single(262)
+        record["layout"] = "tiled" if 322 in entries else "striped"
+    except Exception as e:
+        record["kind"] = ERROR
+        record["error"] = "{0}: {1}".format(type(e).__name__, getattr(e, "message", e))
+    finally:
+        if source is not None and source is not filename:
+            source.close()
+    return record
+
+
+def _sniff_files(filenames):
+    """Worker function: returns the records of a batch of files"""
+    return [sniff_file(filename) for filename in filenames]
+
+
+def sniff_collection(paths, workers=None, batch_size=256, all_files=True):
+    """Yields the record of every file (or, unless all_files, every file with a TIFF extension) in the specified
+       files, folders and archives, sniffing batches of files in parallel worker processes"""
+    files = find_tiffs(paths, extensions=None if all_files else TIFF_EXTENSIONS, sources=True)
+    for records in ordered_map(_sniff_files, batches(files, batch_size), workers):
+        yield from records
@@ -0,0 +1,135 @@
+import numpy as np
+
+from tifinity.parser import pixels
+from tifinity.scripts.executor import get_executor
+
+
+class ImageStatistics():
+    """Accumulates per-channel pixel statistics (min, max, mean, standard deviation, histogram and the fraction
+       of clipped samples) from pixel arrays supplied a chunk (typically a strip) at a time."""
+
+    def __init__(self, samples, bits=8, sample_format=1, bins=256, value_range=None):
+        self.samples = samples
+        self.bins = bins
+        self.is_float = sample_format == 3
+
+        # the range of possible sample values, used for the histogram and clipping
+        if value_range is not None:
+            self.value_range = value_range
+        elif self.is_float:
+            self.value_range = (0.0, 1.0)
+        elif sample_format == 2:
+            self.value_range = (-(2 ** (bits - 1)), (2 ** (bits - 1)) - 1)
+        else:
+            self.value_range = (0, (2 ** bits) - 1)
+
+        if not self.is_float:
+            self.bins = min(bins, int(self.value_range[1] - self.value_range[0]) + 1)
+
+        self.count = 0
+        self.min = np.full(samples, np.inf)
+        self.max = np.full(samples, -np.inf)
+        self.sum = np.zeros(samples, dtype='float64')
+        self.sum_squares = np.zeros(samples, dtype='float64')
+        self.histogram = np.zeros((samples, self.bins), dtype='int64')
+        self.clipped_low = np.zeros(samples, dtype='int64')
+        self.clipped_high = np.zeros(samples, dtype='int64')
+
+    def update(self, pixels):
+        """Adds the specified (rows, width, samples) pixel array to the statistics"""
+        flat = pixels.reshape(-1, self.samples)
+        if len(flat) == 0:
+            return self
+
+        values = flat.astype('float64')
+        self.count += len(flat)
+        self.min = np.minimum(self.min, flat.min(axis=0))
+        self.max = np.maximum(self.max, flat.max(axis=0))
+        self.sum += values.sum(axis=0)
+        self.sum_squares += np.einsum('ij,ij->j', values, values)
+
+        low, high = self.value_range
+        self.clipped_low += (flat <= low).sum(axis=0)
+        self.clipped_high += (flat >= high).sum(axis=0)
+
+        for channel in range(self.samples):
+            self.histogram[channel] += self._histogram(flat[:, channel])
+        return self
+
+    def _histogram(self, values):
+        low, high = self.value_range
+        span = (high - low) + 1
+        if not self.is_float and span <= 2 ** 16:
+            # integer samples: exact counts with bincount, then folded into the requested number of bins
+            counts = np.bincount((values.astype('int64') - low).clip(0, span - 1), minlength=span)
+            edges = (np.arange(self.bins) * span) // self.bins
+            return np.add.reduceat(counts, edges)
+        return np.histogram(values, bins=self.bins, range=(low, high))[0]
+
+    def merge(self, other):
+        """Combines the statistics accumulated by another ImageStatistics into this one"""
+        self.count += other.count
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        self.sum += other.sum
+        self.sum_squares += other.sum_squares
+        self.histogram += other.histogram
+        self.clipped_low += other.clipped_low
+        self.clipped_high += other.clipped_high
+        return self
+
+    def channels(self, histogram=True):
+        """Returns a list of per-channel statistics dictionaries"""
+        out = []
+        for c in range(self.samples):
+            if self.count == 0:
+                out.append({"count": 0})
+                continue
+            mean = self.sum[c] / self.count
+            variance = max(0.0, (self.sum_squares[c] / self.count) - (mean * mean))
+            convert = float if self.is_float else int
+            channel = {"count": self.count,
+                       "min": convert(self.min[c]),
+                       "max": convert(self.max[c]),
+                       "mean": mean,
+                       "std": variance ** 0.5,
+                       "clipped_low": self.clipped_low[c].item() / self.count,
+                       "clipped_high": self.clipped_high[c].item() / self.count}
+            if histogram:
+                channel["histogram"] = self.histogram[c].tolist()
+            out.append(channel)
+        return out
+
+    @staticmethod
+    def calculate(ifd, bins=256, subsample=1, threads=None, transform=None, strips=None):
+        """Calculates statistics for the specified IFD's image a strip at a time, in parallel.
+
+           If subsample is greater than 1, only one pixel in each subsample x subsample block is used, and strips
+           containing no sampled rows are not decoded, giving a quick estimate. If a colour transform (see
+           icc_transform) is specified, statistics are of the transformed pixels. Strips are taken from the IFD's
+           image data, or the specified list of each strip's data (see Tiff.strip_views)."""
+        bits = ifd.get_bits_per_sample()[0]
+        sample_format = ifd.get_sample_format()
+        samples = ifd.get_samples_per_pixel()
+        rows_per_strip = ifd.get_rows_per_strip()
+        if transform is not None:
+            samples = transform.output_samples
+            dtype = transform.output_dtype(pixels.unpacked_dtype(bits, sample_format))
+            sample_format = 3 if dtype.kind == 'f' else 1
+            bits = dtype.itemsize * 8
+
+        def strip_statistics(index):
+            stats = ImageStatistics(samples, bits, sample_format, bins)
+            first_row = index * rows_per_strip
+            offset = (-first_row) % subsample        # first sampled row within this strip
+            if offset < ifd.get_strip_rows(index):
+                values = ifd.strip_pixels(index, strips)[offset::subsample, ::subsample]
+                stats.update(values if transform is None else transform.apply(values))
+            return stats
+
+        partials = get_executor(threads).map(strip_statistics, range(ifd.get_number_strips()))
+
+        total = ImageStatistics(samples, bits, sample_format, bins)
+        for partial in partials:
+            total.merge(partial)
+        return total
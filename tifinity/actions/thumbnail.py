@@ -0,0 +1,153 @@
+import math
+
+import numpy as np
+
+from tifinity.parser.tiff import Tiff
+from tifinity.scripts.executor import get_executor
+
+
+class BoxDownsampler():
+    """Downsamples an image with a box filter, accumulating bands of rows (e.g. strips) into output bins so only
+       one band and the (small) output need be held in memory.
+
+       Each input pixel contributes to exactly one output pixel: input column x falls in output column
+       (x * out_width) // width, and similarly for rows."""
+
+    def __init__(self, width, height, out_width, out_height, samples):
+        self.width = width
+        self.height = height
+        self.out_width = out_width
+        self.out_height = out_height
+        self.samples = samples
+        self.sums = np.zeros((out_height, out_width, samples), dtype='float64')
+
+        # the first input column/row of each output bin, and the number of inputs in each bin
+        col_bins = (np.arange(width) * out_width) // width
+        self._col_starts = np.searchsorted(col_bins, np.arange(out_width))
+        self._col_counts = np.bincount(col_bins, minlength=out_width)
+        self._row_counts = np.bincount((np.arange(height) * out_height) // height, minlength=out_height)
+
+    def bin_rows(self, first_row, pixels):
+        """Sums a band of pixels starting at the specified image row into output bins, returning the index of the
+           first output row and the summed rows, without updating the accumulated image (so can be run in
+           parallel)."""
+        rows = len(pixels)
+        if rows == 0:
+            return 0, np.zeros((0, self.out_width, self.samples))
+        row_bins = ((np.arange(first_row, first_row + rows) * self.out_height) // self.height)
+        row_starts = np.flatnonzero(np.r_[True, row_bins[1:] != row_bins[:-1]])
+
+        summed = np.add.reduceat(pixels, self._col_starts, axis=1, dtype='float64')
+        summed = np.add.reduceat(summed, row_starts, axis=0)
+        return row_bins[0], summed
+
+    def add(self, first_out_row, summed):
+        """Adds rows summed by bin_rows to the accumulated image"""
+        self.sums[first_out_row:first_out_row + len(summed)] += summed
+
+    def result(self):
+        """Returns the downsampled image, as float64 (height, width, samples) means"""
+        counts = self._row_counts[:, np.newaxis] * self._col_counts[np.newaxis, :]
+        return self.sums / np.maximum(counts, 1)[:, :, np.newaxis]
+
+
+class ImageSource():
+    """Reads an IFD's image a strip at a time as pixels which can be written to a new image (see Tiff.add_image):
+       palette images are expanded to 16 bit RGB, and samples of less than 8 bits are scaled to 8 bits. Strips are
+       taken from the IFD's image data, or the specified list of each strip's data (see Tiff.strip_views)."""
+
+    def __init__(self, ifd, strips=None):
+        self.ifd = ifd
+        self.strips = strips
+        self.photometric = ifd.get_tag_value_by_name("PhotometricInterpretation")[0]
+        self.colour_map = ifd.get_tag_value(320)
+        self.bits = ifd.get_bits_per_sample()[0]
+        self.samples = ifd.get_samples_per_pixel()
+        self.palette = None
+
+        if self.photometric == 3 and self.colour_map is not None:
+            self.palette = np.asarray(self.colour_map, dtype='uint16').reshape(3, -1).T
+            self.samples = 3
+            self.photometric = 2
+            self.dtype = np.dtype('uint16')
+        elif ifd.get_sample_format() == 3:
+            self.dtype = np.dtype('float32') if self.bits <= 32 else np.dtype('float64')
+        elif self.bits < 8:
+            self.dtype = np.dtype('uint8')
+        else:
+            kind = 'i' if ifd.get_sample_format() == 2 else 'u'
+            self.dtype = np.dtype(kind + str(max(1, math.ceil(self.bits / 8))))
+            if self.dtype.itemsize == 3:
+                self.dtype = np.dtype(self.dtype.kind + '4')
+
+    def strip_pixels(self, index):
+        """Returns the pixels of the specified strip, looking up the RGB colour of each pixel in palette images.
+           Sample values are not otherwise converted (see convert)."""
+        strip = self.ifd.strip_pixels(index, self.strips)
+        if self.palette is not None:
+            strip = self.palette[strip[:, :, 0]]
+        return strip
+
+    def convert(self, values):
+        """Converts pixel values (e.g. from strip_pixels, or float means of them) to this source's output dtype"""
+        if self.palette is None and self.bits < 8:
+            values = values * (255.0 / ((2 ** self.bits) - 1))
+        if self.dtype.kind in 'ui' and values.dtype.kind == 'f':
+            values = np.rint(values)
+        return values.astype(self.dtype, copy=False)
+
+
+class Thumbnail():
+
+    @staticmethod
+    def thumbnail_size(width, height, size):
+        """Returns the (width, height) of a thumbnail whose longest side is at most size pixels"""
+        scale = min(1.0, size / max(width, height))
+        return max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+    @staticmethod
+    def select_ifd(tiff, size):
+        """Selects the IFD to create a thumbnail from: the smallest reduced-resolution image (NewSubfileType bit 0
+           set) that is at least as large as the thumbnail, otherwise the first full resolution image."""
+        main = Thumbnail.main_ifd(tiff)
+        out_width, out_height = Thumbnail.thumbnail_size(main.get_image_width(), main.get_image_height(), size)
+
+        candidates = [ifd for ifd in tiff.ifds + main.sub_ifds if Thumbnail._is_reduced(ifd)
+                      and ifd.get_image_width() >= out_width and ifd.get_image_height() >= out_height]
+        if candidates:
+            return min(candidates, key=lambda ifd: ifd.get_image_width() * ifd.get_image_height())
+        return main
+
+    @staticmethod
+    def main_ifd(tiff):
+        """Returns the first full resolution image of the specified Tiff"""
+        return ([ifd for ifd in tiff.ifds if not Thumbnail._is_reduced(ifd)] or tiff.ifds)[0]
+
+    @staticmethod
+    def _is_reduced(ifd):
+        subfile_type = ifd.get_tag_value(254)
+        return subfile_type is not None and (subfile_type[0] & 1) == 1
+
+    @staticmethod
+    def create(tiff, size=256, threads=None):
+        """Creates a new Tiff containing a box-filtered thumbnail (longest side at most size pixels) of the
+           specified Tiff's main image, processing the source one strip at a time. If the Tiff was parsed header-only
+           (images=False), only the strips of the source image are read, from the memory mapped file."""
+        ifd = Thumbnail.select_ifd(tiff, size)
+        main = Thumbnail.main_ifd(tiff)
+        out_width, out_height = Thumbnail.thumbnail_size(main.get_image_width(), main.get_image_height(), size)
+
+        source = ImageSource(ifd, tiff.strip_views(ifd) if ifd.img_data is None else None)
+        rows_per_strip = ifd.get_rows_per_strip()
+        downsampler = BoxDownsampler(ifd.get_image_width(), ifd.get_image_height(), out_width, out_height,
+                                     source.samples)
+
+        def bin_strip(index):
+            return downsampler.bin_rows(index * rows_per_strip, source.strip_pixels(index))
+
+        for first_out_row, summed in get_executor(threads).map(bin_strip, range(ifd.get_number_strips())):
+            downsampler.add(first_out_row, summed)
+
+        thumb = Tiff()
+        thumb.add_image(source.convert(downsampler.result()), photometric=source.photometric)
+        return thumb
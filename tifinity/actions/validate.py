@@ -0,0 +1,185 @@
+"""
+Structural validation of TIFF files, without reading image data.
+
+Every byte range a file references - the header, each IFD (including SubIFDs and EXIF, GPS and Interoperability IFDs),
+each out-of-line tag value and each strip or tile - is collected as an extent. Sorting the extents by offset gives an
+interval index in which a single sweep finds overlapping extents, unreferenced gaps and extents past the end of the
+file, in O(n log n). IFD loops, invalid headers and inconsistent strip tags are reported as they are found.
+"""
+from collections import namedtuple
+
+from tifinity.actions.collection import batches, find_tiffs, ordered_map
+from tifinity.parser.errors import InvalidTiffError
+from tifinity.parser.sources import source_name
+from tifinity.parser.tiff import Tiff, TiffFileHandler, ifdtag, ifdtype, inv_ifdtag
+
+# A referenced byte range [start, end), of a kind (header, ifd, value, strip or tile)
+Extent = namedtuple("Extent", ["start", "end", "kind", "description"])
+
+# tags pointing to IFDs which are not part of the main IFD chain
+IFD_POINTER_TAGS = {330: "SubIFD", 34665: "EXIF IFD", 34853: "GPS IFD", 40965: "Interoperability IFD"}
+
+ERROR = "error"
+WARNING = "warning"
+
+DEFAULT_MIN_GAP = 2         # gaps smaller than this are word alignment padding
+
+# types of tags holding offsets, byte counts and IFD pointers
+INTEGER_TYPES = (1, 3, 4, 6, 8, 9, 13)
+
+
+def issue(severity, kind, start=None, end=None, description=""):
+    return {"severity": severity, "issue": kind, "start": start, "end": end, "description": description}
+
+
+class ExtentCollector():
+    """Walks the IFDs of a (memory mapped) TIFF, collecting the extents they reference and any structural issues"""
+
+    def __init__(self, filename):
+        self.tiff = Tiff()
+        self.tiff.tif_file = TiffFileHandler(filename, mmap=True)
+        self.file_size = len(self.tiff.raw_data())
+        self.extents = [Extent(0, 8, "header", "Header")]
+        self.issues = []
+        self._seen = {}         # IFD offset: name
+
+    def collect(self):
+        """Collects the extents of the file, returning the list of Extents"""
+        try:
+            offset = self.tiff.read_header()
+        except InvalidTiffError as e:
+            self.issues.append(issue(ERROR, "invalid_header", 0, 8, e.message))
+            return self.extents
+
+        index = 0
+        name = "Header"
+        while offset != 0:
+            ifd = self._visit(offset, "IFD {0}".format(index), name)
+            if ifd is None:
+                break
+            offset = ifd.nextifd
+            name = "IFD {0}".format(index)
+            index += 1
+        return self.extents
+
+    def _visit(self, offset, name, parent):
+        """Reads the IFD at the offset (pointed to by parent), adding its extents and visiting any IFDs it points to.
+           Returns the IFD, or None if it cannot be read."""
+        if offset in self._seen:
+            self.issues.append(issue(ERROR, "ifd_loop", offset, None, "{0} points to {1} at offset {2}"
+                                     .format(parent, self._seen[offset], offset)))
+            return None
+        if offset + 2 > self.file_size:
+            self.issues.append(issue(ERROR, "out_of_bounds", offset, offset + 2,
+                                     "{0} (pointed to by {1}) is past the end of the file".format(name, parent)))
+            return None
+        self._seen[offset] = name
+
+        ifd = self.tiff.read_ifd(offset)
+        self.extents.append(Extent(offset, offset + 2 + (ifd.numtags * 12) + 4, "ifd", name))
+        for tag, directory in ifd.directories.items():
+            size = directory.count * ifdtype[directory.type][0] if directory.type_valid else 0
+            if size > 4:
+                self.extents.append(Extent(directory.value_offset, directory.value_offset + size, "value",
+                                           "{0} {1} value".format(name, ifdtag.get(tag, tag))))
+        self._add_image_extents(ifd, name)
+
+        for tag, kind in IFD_POINTER_TAGS.items():
+            if not self._integer_typed(ifd, tag, name):
+                continue
+            offsets = ifd.get_tag_value(tag)
+            for i, pointer in enumerate([] if offsets is None else offsets.tolist()):
+                self._visit(pointer, "{0} {1} {2}".format(name, kind, i) if len(offsets) > 1 else
+                            "{0} {1}".format(name, kind), name)
+        return ifd
+
+    def _integer_typed(self, ifd, tag, name):
+        """Returns whether the tag (if present) has an integer type, reporting an invalid_type error if not"""
+        directory = ifd.directories.get(tag)
+        if directory is None or (directory.type_valid and directory.type in INTEGER_TYPES):
+            return True
+        self.issues.append(issue(ERROR, "invalid_type", None, None, "{0} {1} has type {2}, not an integer type"
+                                 .format(name, ifdtag.get(tag, tag), directory.type)))
+        return False
+
+    def _add_image_extents(self, ifd, name):
+        kind = "tile" if ifd.is_tiled() else "strip"
+        offsets_tag, counts_tag = ifd.get_offsets_tags()
+        if not all([self._integer_typed(ifd, offsets_tag, name), self._integer_typed(ifd, counts_tag, name)]):
+            return
+        offsets, counts = ifd.get_tag_value(offsets_tag), ifd.get_tag_value(counts_tag)
+        if offsets is None and counts is None:
+            return
+        if offsets is None or counts is None:
+            missing = ifdtag[offsets_tag if offsets is None else counts_tag]
+            self.issues.append(issue(ERROR, "missing_tag", None, None, "{0} has no {1}".format(name, missing)))
+            return
+        if len(offsets) != len(counts):
+            self.issues.append(issue(ERROR, "count_mismatch", None, None, "{0} has {1} {2} but {3} {4}".format(
+                name, len(offsets), ifdtag[offsets_tag], len(counts), ifdtag[counts_tag])))
+        for i, (offset, count) in enumerate(zip(offsets.tolist(), counts.tolist())):
+            if count > 0:
+                self.extents.append(Extent(offset, offset + count, kind, "{0} {1} {2}".format(name, kind, i)))
+
+
+def check_extents(extents, file_size, min_gap=DEFAULT_MIN_GAP):
+    """Returns the issues found by sweeping the extents in offset order: extents past the end of the file, overlaps
+       (identical strip or tile extents are reported as shared, as some writers reuse blank strips) and gaps of at
+       least min_gap unreferenced bytes"""
+    issues = []
+    reach = None            # the extent reaching furthest into the file so far
+    reach_end = 0
+    for extent in sorted(extents):
+        if extent.end > file_size:
+            issues.append(issue(ERROR, "out_of_bounds", extent.start, extent.end,
+                                "{0} ends {1} bytes past the end of the file".format(extent.description,
+                                                                                     extent.end - file_size)))
+        if reach is not None and extent.start < reach_end:
+            if extent[:3] == reach[:3] and extent.kind in ("strip", "tile"):
+                issues.append(issue(WARNING, "shared", extent.start, extent.end,
+                                    "{0} is the same data as {1}".format(extent.description, reach.description)))
+            else:
+                issues.append(issue(ERROR, "overlap", extent.start, min(extent.end, reach_end),
+                                    "{0} overlaps {1}".format(extent.description, reach.description)))
+        elif extent.start - reach_end >= min_gap:
+            issues.append(issue(WARNING, "gap", reach_end, extent.start,
+                                "{0} unreferenced bytes".format(extent.start - reach_end)))
+        if extent.end > reach_end:
+            reach, reach_end = extent, extent.end
+
+    if file_size - reach_end >= min_gap:
+        issues.append(issue(WARNING, "gap", reach_end, file_size,
+                            "{0} unreferenced bytes at the end of the file".format(file_size - reach_end)))
+    return issues
+
+
+def validate_file(filename, min_gap=DEFAULT_MIN_GAP):
+    """Returns the list of structural issues in the specified file, ordered by offset. Files which cannot be read
+       (or fail to be validated) have an 'unreadable' error."""
+    try:
+        collector = ExtentCollector(filename)
+    except OSError as e:
+        return [issue(ERROR, "unreadable", description=str(e))]
+    try:
+        extents = collector.collect()
+        issues = collector.issues + check_extents(extents, collector.file_size, min_gap)
+    except Exception as e:
+        # a malformed file must not stop the validation of a collection
+        return collector.issues + [issue(ERROR, "unreadable", description="{0}: {1}".format(
+            type(e).__name__, getattr(e, "message", e)))]
+    return sorted(issues, key=lambda i: (-1 if i["start"] is None else i["start"]))
+
+
+def _validate_files(job):
+    """Worker function: returns (filename, issues) for each file in a batch"""
+    filenames, min_gap = job
+    return [(source_name(filename), validate_file(filename, min_gap)) for filename in filenames]
+
+
+def validate_collection(paths, min_gap=DEFAULT_MIN_GAP, workers=None, batch_size=64):
+    """Yields (filename, issues) for every TIFF in the specified files and folders, validating batches of files in
+       parallel worker processes"""
+    jobs = ((batch, min_gap) for batch in batches(find_tiffs(paths, sources=True), batch_size))
+    for results in ordered_map(_validate_files, jobs, workers):
+        for result in results:
+            yield result
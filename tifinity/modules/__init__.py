@@ -1,5 +1,26 @@
+import io
 from abc import ABC, abstractmethod
 
+from tifinity.scripts.formatters import formatters, write_result
+
+# Static manifest of the available modules: subcommand name -> (module path, help). Only the selected subcommand's
+# module is imported, so that numpy and the parser are not loaded for e.g. --version or --help. New modules must be
+# added here (the PyInstaller hook bundles every module in this package).
+manifest = {
+    "checksum": ("tifinity.modules.checksum_image", "calculate checksums of a TIFF's image data"),
+    "dedupe": ("tifinity.modules.dedupe", "find near-duplicate images across folders of TIFFs by perceptual hash"),
+    "defrag": ("tifinity.modules.defrag", "rewrite TIFFs with IFDs first and strips contiguous, in logical order"),
+    "compare": ("tifinity.modules.compare_tiffs", "compare two TIFFs using the specified metrics"),
+    "migrate_rgb72": ("tifinity.modules.rgb72_migration", "migrate 72 bit RGB images to 96 bit RGB"),
+    "pyramid": ("tifinity.modules.pyramid", "create a tiled, multi-resolution TIFF"),
+    "serve": ("tifinity.modules.serve", "run commands from stdin or a Unix socket in warm worker processes"),
+    "show_tags": ("tifinity.modules.tiff_details", "show the tags of each image in a TIFF"),
+    "sniff": ("tifinity.modules.sniff", "classify files as TIFFs from their header and first IFD, without parsing"),
+    "stats": ("tifinity.modules.image_stats", "calculate per-channel pixel statistics"),
+    "thumbnail": ("tifinity.modules.thumbnail", "create a small preview TIFF"),
+    "validate": ("tifinity.modules.validate", "check the byte ranges and IFD chain of TIFFs, without reading images"),
+}
+
 
 class BaseModule(ABC):
     """Defines the abstract base class for tifinity modules"""
@@ -11,3 +32,28 @@ class BaseModule(ABC):
     @abstractmethod
     def process_cli(self, args):
         pass
+
+    def run(self, args):
+        """Runs this module with the specified (parsed) arguments, returning a Result (see tifinity.scripts.formatters)
+           rather than printing output, for using the module as a library"""
+        raise NotImplementedError("The {0} module does not return results".format(self.cli_name))
+
+    @staticmethod
+    def add_format_argument(m_parser):
+        """Adds the --format option, selecting how the module's results are output"""
+        m_parser.add_argument("--format", dest="format", choices=sorted(formatters),
+                              help="the output format (default text)")
+
+    @staticmethod
+    def output_format(args):
+        """Returns the output format selected by the --format (or, for compatibility, --json) option"""
+        output_format = getattr(args, "format", None)
+        if output_format is None:
+            output_format = "json" if getattr(args, "json", False) else "text"
+        return output_format
+
+    def format_result(self, result, args):
+        """Returns the result formatted as selected by the arguments, as a string"""
+        out = io.StringIO()
+        write_result(result, out, self.output_format(args))
+        return out.getvalue()
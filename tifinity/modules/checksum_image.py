@@ -1,8 +1,8 @@
-import json
-
 from tifinity.actions.checksum import Checksum
 from tifinity.modules import BaseModule
+from tifinity.parser.sources import ARCHIVE_SEPARATOR, archive_sources, is_archive, source_name
 from tifinity.parser.tiff import Tiff
+from tifinity.scripts.formatters import Result
 from tifinity.scripts.timing import time_usage
 
 
@@ -17,30 +17,74 @@ class ImageFixity(BaseModule):
         m_parser.set_defaults(func=self.process_cli)
         m_parser.add_argument("-a", "--alg", dest="algorithm", choices=['md5', 'sha256', 'sha512', 'sha3_256', 'sha3_512'],
                               default='sha256', help="the hashing algorithm to use")
+        m_parser.add_argument("--pixels", dest="pixels", action="store_true",
+                              help="also calculate a digest of each image's decoded pixels, independent of strip "
+                                   "layout, compression and byte order")
         m_parser.add_argument("--json", dest="json", action="store_true", help="output in json format")
-        m_parser.add_argument("file", help="the TIFF file to generate checksum values for")
+        self.add_format_argument(m_parser)
+        m_parser.add_argument("file", help="the TIFF file (or archive member, archive::member) to generate checksum "
+                                            "values for, or a ZIP or tar archive of TIFFs")
 
     # @time_usage
     def process_cli(self, args):
-        tiff = Tiff(args.file)
+        output = self.format_result(self.run(args), args)
+        print(output)
+        return output
+
+    def run(self, args):
+        """Returns a Result with a record (file, part, index, algorithm, digest) for the full file, each image's data
+           and each IFD, and with the pixels option, each image's canonical pixel digest (part 'pixel'). For a ZIP or
+           tar archive, there are records for each TIFF member."""
+        files = archive_sources(args.file) if is_archive(args.file) else [args.file]
+        records = []
+        for file in files:
+            records += self._file_records(file, args)
+        return Result(records, ["file", "part", "index", "algorithm", "digest"], ImageFixity.text_lines,
+                      ImageFixity.document)
+
+    def _file_records(self, file, args):
+        tiff = Tiff(file)
+        file = source_name(file)
         alg = args.algorithm
 
         self.hashes = Checksum.checksum(tiff, alg)
 
-        output = self.format_output(args.json)
-        print(output)
-        return output
+        records = [{"file": file, "part": "full", "index": None, "algorithm": alg, "digest": self.hashes["full"]}]
+        for part in ("images", "ifds"):
+            records += [{"file": file, "part": part[:-1], "index": i, "algorithm": alg, "digest": digest}
+                        for i, digest in enumerate(self.hashes[part])]
+        if getattr(args, "pixels", False):
+            self.hashes["pixels"] = Checksum.pixel_digests(tiff, alg)
+            records += [{"file": file, "part": "pixel", "index": i, "algorithm": alg, "digest": digest}
+                        for i, digest in enumerate(self.hashes["pixels"])]
+        return records
+
+    @staticmethod
+    def text_lines(records):
+        for record in records:
+            if record["part"] == "full" and ARCHIVE_SEPARATOR in record["file"]:
+                yield "{file}:".format(file=record["file"])
+            if record["part"] == "full":
+                yield "Full File:\t{digest}".format(digest=record["digest"])
+            elif record["part"] == "image":
+                yield "Image [{id}]:\t{digest}".format(id=record["index"], digest=record["digest"])
+            elif record["part"] == "pixel":
+                yield "Pixels [{id}]:\t{digest}".format(id=record["index"], digest=record["digest"])
 
-    def format_output(self, jsonout=False):
-        if jsonout:
-            return json.dumps(self.hashes)
-        else:
-            out = "Full File:\t{digest}\n".format(digest=self.hashes["full"])
-            count = 0
-            for x in self.hashes["images"]:
-                out += "Image [{id}]:\t{digest}\n".format(id=count, digest=x)
-                count+=1
-            return out
+    @staticmethod
+    def document(records):
+        """Returns the records as the --json output: the full file digest, and lists of image and IFD digests (and
+           pixel digests, if calculated), or for an archive, these for each member keyed by member name"""
+        files = {}
+        for record in records:
+            hashes = files.setdefault(record["file"], {"full": None, "images": [], "ifds": []})
+            if record["part"] == "full":
+                hashes["full"] = record["digest"]
+            else:
+                hashes.setdefault(record["part"] + "s", []).append(record["digest"])
+        if len(files) == 1 and ARCHIVE_SEPARATOR not in next(iter(files)):
+            return next(iter(files.values()))
+        return files
 
 
 module = ImageFixity()  # initiate module class when module imported
\ No newline at end of file
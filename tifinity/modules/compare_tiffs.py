@@ -1,17 +1,17 @@
-import json
-
 from tifinity.actions.checksum import Checksum
 from tifinity.modules import BaseModule
 from tifinity.parser.tiff import Tiff
+from tifinity.scripts.formatters import Result
 from tifinity.scripts.timing import time_usage
 
 class CompareTiffs(BaseModule):
     """ Module comparing the similarity of two TIFF files according to some metric.
-        Currently only comparison via the MD5 checksums of the file & pixel data is supported."""
+        Comparison is via checksums of the file & image data, or canonical digests of the decoded pixels (identical
+        for images which differ only in strip layout, lossless compression or byte order)."""
 
     def __init__(self):
         self.cli_name = 'compare'
-        self.metric_choices = ['checksum', 'checksum-images']      # other metric choices may be added
+        self.metric_choices = ['checksum', 'checksum-images', 'checksum-pixels']      # other metric choices may be added
         # defaults
         self.json = False
 
@@ -22,58 +22,75 @@ class CompareTiffs(BaseModule):
         m_parser.add_argument("-m", "--metric", dest="metric", choices=self.metric_choices, required=True)
 
         m_parser.add_argument("--json", dest="json", action="store_true", help="output in json format")
+        self.add_format_argument(m_parser)
 
         m_parser.add_argument("tiff1", help="the original TIFF file to compare")
         m_parser.add_argument("tiff2", help="the comparison TIFF file")
 
     #@time_usage
     def process_cli(self, args):
+        output = self.format_result(self.run(args), args)
+        print(output)
+        return output
+
+    def run(self, args):
+        """Returns a Result with a record comparing each image in the original TIFF with each image in the
+           comparison TIFF (tiff1, image1, tiff2, image2, identical), and one comparing the files for the checksum
+           metric (with image1 and image2 as None)"""
         try:
-            # Load TIFFs
-            tiffs = [Tiff(args.tiff1), Tiff(args.tiff2)]
+            # Load TIFFs (pixel digests stream strips from the memory mapped files instead of loading the images)
+            images = args.metric != "checksum-pixels"
+            tiffs = [Tiff(args.tiff1, images=images), Tiff(args.tiff2, images=images)]
         except AttributeError:
             raise
 
-        self.returnValues = {}
+        records = []
 
         # calculate checksums
         if args.metric=="checksum":
             checksums = [Checksum.checksum(t) for t in tiffs]
 
             # identical files?
-            self.returnValues["Files Identical"] = False
-            if checksums[0]["full"] == checksums[1]["full"]:
-                self.returnValues["Files Identical"] = True
+            records.append({"tiff1": args.tiff1, "image1": None, "tiff2": args.tiff2, "image2": None,
+                             "identical": checksums[0]["full"] == checksums[1]["full"]})
 
         elif args.metric=="checksum-images":
             checksums = [Checksum.checksum(t, justimage=True) for t in tiffs]
 
+        elif args.metric=="checksum-pixels":
+            checksums = [{"images": Checksum.pixel_digests(t)} for t in tiffs]
+
+        for i, i_orig in enumerate(checksums[0]["images"]):            # for each image in the original TIFF
+            for j, i_other in enumerate(checksums[1]["images"]):       # compare against each image in the other
+                records.append({"tiff1": args.tiff1, "image1": i, "tiff2": args.tiff2, "image2": j,
+                                "identical": i_orig == i_other})
+
+        self.returnValues = CompareTiffs.document(records)
+        return Result(records, ["tiff1", "image1", "tiff2", "image2", "identical"], CompareTiffs.text_lines,
+                      CompareTiffs.document)
+
+    @staticmethod
+    def text_lines(records):
+        for record in records:
+            if record["image1"] is None:
+                yield "Files Identical:\t{ident}".format(ident=record["identical"])
+            else:
+                yield "Tiff[1].Image[{id}] - Tiff[2].Image[{idy}]:\t{ident}".format(id=record["image1"],
+                                                                                   idy=record["image2"],
+                                                                                   ident=record["identical"])
+
+    @staticmethod
+    def document(records):
+        """Returns the records as the --json output: whether the files are identical, and for each image in the
+           original TIFF, whether each image in the comparison TIFF is identical to it"""
+        values = {}
         image_identical = {}
-        i = 0
-        for i_orig in checksums[0]["images"]:
-            image_identical[i] = []                             # for each image in the original TIFF
-            for i_other in checksums[1]["images"]:
-                image_identical[i].append(i_orig == i_other)    # compare against each image in the comparison TIFF
-            i += 1
-        self.returnValues["Images Identical"] = image_identical
-
-        output = self.format_output(args.json)
-        print(output)
-        return output
-
-    def format_output(self, jsonout=False):
-        if jsonout:
-            return json.dumps(self.returnValues)
-        else:
-            out = ""
-            if "Files Identical" in self.returnValues:
-                out += "Files Identical:\t{ident}\n".format(ident=self.returnValues["Files Identical"])
-            for x in sorted(self.returnValues["Images Identical"].keys()):
-                count=0
-                for y in self.returnValues["Images Identical"][x]:
-                    out += "Tiff[1].Image[{id}] - Tiff[2].Image[{idy}]:\t{ident}\n".format(id=x, idy=count, ident=y)
-                    count+=1
-
-            return out
+        for record in records:
+            if record["image1"] is None:
+                values["Files Identical"] = record["identical"]
+            else:
+                image_identical.setdefault(record["image1"], []).append(record["identical"])
+        values["Images Identical"] = image_identical
+        return values
 
 module = CompareTiffs()     # initiate module class when module imported
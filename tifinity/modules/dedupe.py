@@ -0,0 +1,57 @@
+from tifinity.actions.dedupe import DEFAULT_DISTANCE, HashIndex, index_collection, near_duplicates
+from tifinity.modules import BaseModule
+from tifinity.scripts.formatters import Result
+
+
+class Dedupe(BaseModule):
+    """ Module finding near-duplicate images across collections of TIFFs, from perceptual (difference) hashes of each
+        image kept in an on-disk index, searched with a BK-tree rather than comparing every pair of images. """
+
+    def __init__(self):
+        self.cli_name = 'dedupe'
+
+    def add_subparser(self, mainparser):
+        m_parser = mainparser.add_parser(self.cli_name)
+        m_parser.set_defaults(func=self.process_cli)
+        m_parser.add_argument("-d", "--distance", dest="distance", type=int, default=DEFAULT_DISTANCE,
+                              help="the largest number of differing hash bits (of 64) between near-duplicates "
+                                   "(default {0}; 0 finds only identical hashes)".format(DEFAULT_DISTANCE))
+        m_parser.add_argument("-i", "--index", dest="index",
+                              help="the index file to keep hashes in, so unchanged files are not hashed again. "
+                                   "Duplicates are found among every file in the index.")
+        m_parser.add_argument("-w", "--workers", dest="workers", type=int,
+                              help="the number of worker processes used to hash files (default: number of cores)")
+        self.add_format_argument(m_parser)
+        m_parser.add_argument("files", nargs="+", help="the TIFF files, or folders of TIFFs, to find duplicates in")
+
+    def process_cli(self, args):
+        output = self.format_result(self.run(args), args)
+        print(output, end='' if output.endswith("\n") else "\n")
+        return output
+
+    def run(self, args):
+        """Returns a Result with a record (file1, ifd1, file2, ifd2, distance) for each pair of near-duplicate images,
+           closest first, and a record with the error for each file which could not be hashed"""
+        index = HashIndex(getattr(args, "index", None))
+        errors = index_collection(args.files, index, workers=getattr(args, "workers", None))
+        index.compact()
+
+        records = [{"file1": file1, "ifd1": ifd1, "file2": file2, "ifd2": ifd2, "distance": distance, "error": None}
+                   for (_, ifd1, _, _, file1), (_, ifd2, _, _, file2), distance
+                   in near_duplicates(index, getattr(args, "distance", DEFAULT_DISTANCE))]
+        records.sort(key=lambda r: (r["distance"], r["file1"], r["ifd1"], r["file2"], r["ifd2"]))
+        records += [{"file1": filename, "ifd1": None, "file2": None, "ifd2": None, "distance": None, "error": error}
+                    for filename, error in errors]
+        return Result(records, ["file1", "ifd1", "file2", "ifd2", "distance", "error"], Dedupe.text_lines)
+
+    @staticmethod
+    def text_lines(records):
+        for record in records:
+            if record["error"] is not None:
+                yield "{0}:\terror\t{1}".format(record["file1"], record["error"])
+            else:
+                yield "{0}[{1}]\t{2}[{3}]:\tdistance {4}".format(record["file1"], record["ifd1"], record["file2"],
+                                                                 record["ifd2"], record["distance"])
+
+
+module = Dedupe()  # initiate module class when module imported
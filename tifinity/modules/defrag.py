@@ -0,0 +1,66 @@
+import os
+
+from tifinity.actions.defrag import defrag_collection, defrag_file, output_file
+from tifinity.modules import BaseModule
+from tifinity.scripts.formatters import Result
+
+
+class Defrag(BaseModule):
+    """ Module rewriting TIFFs so that every IFD comes first, followed by each image's strips contiguously in logical
+        order, after scoring each file's layout (so only the worst files need be rewritten). """
+
+    def __init__(self):
+        self.cli_name = 'defrag'
+
+    def add_subparser(self, mainparser):
+        m_parser = mainparser.add_parser(self.cli_name)
+        m_parser.set_defaults(func=self.process_cli)
+        m_parser.add_argument("--score", dest="score_only", action="store_true",
+                              help="only report each file's layout score, without rewriting it")
+        m_parser.add_argument("-t", "--threshold", dest="threshold", type=float,
+                              help="only rewrite files scoring below the threshold (0-1; default: rewrite all)")
+        m_parser.add_argument("-o", dest="output",
+                              help="the file (or, for a folder, the folder) to write to (default <file>.defrag.tif)")
+        m_parser.add_argument("-w", "--workers", dest="workers", type=int,
+                              help="the number of worker processes used for a folder (default: number of cores)")
+        self.add_format_argument(m_parser)
+        m_parser.add_argument("file", help="the TIFF file to defragment, or a folder of TIFFs")
+
+    def process_cli(self, args):
+        output = self.format_result(self.run(args), args)
+        print(output, end='' if output.endswith("\n") else "\n")
+        return output
+
+    def run(self, args):
+        """Returns a Result with a record per file of its layout (ifds, strips, contiguous and backward strips,
+           seek_bytes, ifds_first and score), the rewritten file and its score, or the error preventing rewriting"""
+        fields = ["file", "score", "strips", "contiguous", "backward", "seek_bytes", "ifds_first", "output",
+                  "new_score", "error"]
+        return Result(self._records(args), fields, Defrag.text_lines)
+
+    def _records(self, args):
+        threshold = getattr(args, "threshold", None)
+        score_only = getattr(args, "score_only", False)
+        output = getattr(args, "output", None)
+        if os.path.isdir(args.file):
+            yield from defrag_collection(args.file, output, threshold, score_only, getattr(args, "workers", None))
+        else:
+            yield defrag_file(args.file, output_file(args.file, output=output), threshold, score_only)
+
+    @staticmethod
+    def text_lines(records):
+        for record in records:
+            if record.get("score") is None:
+                yield "{0}:\terror\t{1}".format(record["file"], record["error"])
+                continue
+            line = "{0}:\tscore {1:.3f}\t{2} strips ({3} contiguous, {4} backward)\tseek {5} bytes\t{6}".format(
+                record["file"], record["score"], record["strips"], record["contiguous"], record["backward"],
+                record["seek_bytes"], "IFDs first" if record["ifds_first"] else "IFDs interleaved")
+            if record["output"] is not None:
+                line += "\t-> {0} (score {1:.3f})".format(record["output"], record["new_score"])
+            elif record["error"] is not None:
+                line += "\tnot rewritten: {0}".format(record["error"])
+            yield line
+
+
+module = Defrag()  # initiate module class when module imported
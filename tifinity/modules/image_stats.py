@@ -0,0 +1,90 @@
+from tifinity.actions.icc_transform import TARGETS, ifd_transform
+from tifinity.actions.stats import ImageStatistics
+from tifinity.modules import BaseModule
+from tifinity.parser.tiff import Tiff
+from tifinity.scripts.formatters import Result
+
+
+class ImageStats(BaseModule):
+    """ Module calculating per-channel pixel statistics (min, max, mean, standard deviation, clipping and
+        histograms) for each image in a TIFF, processing the image a strip at a time. """
+
+    def __init__(self):
+        self.cli_name = 'stats'
+
+    def add_subparser(self, mainparser):
+        m_parser = mainparser.add_parser(self.cli_name)
+        m_parser.set_defaults(func=self.process_cli)
+        m_parser.add_argument("-b", "--bins", dest="bins", type=int, default=256,
+                              help="the number of histogram bins per channel")
+        m_parser.add_argument("-s", "--subsample", dest="subsample", type=int, default=1,
+                              help="only use one pixel in each SUBSAMPLE x SUBSAMPLE block, for a quick estimate")
+        m_parser.add_argument("--histogram", dest="histogram", action="store_true",
+                              help="include histograms in the output")
+        m_parser.add_argument("--colour", dest="colour", choices=TARGETS,
+                              help="convert pixels with the image's embedded ICC profile to linear light, CIE XYZ "
+                                   "or sRGB before calculating statistics")
+        m_parser.add_argument("--json", dest="json", action="store_true", help="output in json format")
+        self.add_format_argument(m_parser)
+        m_parser.add_argument("file", help="the TIFF file to calculate statistics for")
+
+    def process_cli(self, args):
+        output = self.format_result(self.run(args), args)
+        print(output)
+        return output
+
+    def run(self, args):
+        """Returns a Result with a record of the statistics for each channel of each image, calculated as the
+           records are consumed"""
+        fields = ["file", "image", "width", "height", "channel", "count", "min", "max", "mean", "std",
+                  "clipped_low", "clipped_high"]
+        if args.histogram:
+            fields.append("histogram")
+        return Result(self._records(args), fields, ImageStats.text_lines, ImageStats.document)
+
+    def _records(self, args):
+        # parse header-only, so each image is read a strip at a time from the memory mapped file
+        tiff = Tiff(args.file, images=False)
+        for image_id, ifd in enumerate(tiff.ifds):
+            colour = getattr(args, "colour", None)
+            transform = None if colour is None else ifd_transform(ifd, colour)
+            stats = ImageStatistics.calculate(ifd, bins=args.bins, subsample=max(1, args.subsample),
+                                              transform=transform, strips=tiff.strip_views(ifd))
+            for channel_id, channel in enumerate(stats.channels(histogram=args.histogram)):
+                record = {"file": args.file, "image": image_id, "width": ifd.get_image_width(),
+                          "height": ifd.get_image_height(), "channel": channel_id}
+                record.update(channel)
+                yield record
+
+    @staticmethod
+    def document(records):
+        """Returns the records as the --json output: a list of images, each with a list of channel statistics"""
+        images = []
+        for record in records:
+            if record["channel"] == 0:
+                images.append({"width": record["width"], "height": record["height"], "channels": []})
+            images[-1]["channels"].append({k: v for k, v in record.items()
+                                           if k not in ("file", "image", "width", "height", "channel")})
+        return {"images": images}
+
+    @staticmethod
+    def text_lines(records):
+        for record in records:
+            if record["channel"] == 0:
+                yield "Image [{id}]:\t{w}x{h}".format(id=record["image"], w=record["width"], h=record["height"])
+            if record["count"] == 0:
+                yield "  Channel [{id}]:\tno samples".format(id=record["channel"])
+                continue
+            yield ("  Channel [{id}]:\tmin {min}\tmax {max}\tmean {mean:.4f}\tstd {std:.4f}\t"
+                   "clipped low {low:.2%}\tclipped high {high:.2%}".format(id=record["channel"],
+                                                                          min=record["min"],
+                                                                          max=record["max"],
+                                                                          mean=record["mean"],
+                                                                          std=record["std"],
+                                                                          low=record["clipped_low"],
+                                                                          high=record["clipped_high"]))
+            if "histogram" in record:
+                yield "    Histogram:\t" + " ".join(str(x) for x in record["histogram"])
+
+
+module = ImageStats()  # initiate module class when module imported
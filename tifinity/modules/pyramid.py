@@ -0,0 +1,65 @@
+import os
+
+from tifinity.actions.pyramid import Pyramid
+from tifinity.modules import BaseModule
+from tifinity.parser.compression import compression_names
+from tifinity.parser.tiff import Tiff
+from tifinity.scripts.formatters import Result
+
+
+class CreatePyramid(BaseModule):
+    """ Module creating a tiled, multi-resolution (pyramid) TIFF from a TIFF's main image, with each reduced
+        resolution image half the size of the previous one. The source is read one strip at a time. """
+
+    def __init__(self):
+        self.cli_name = 'pyramid'
+
+    def add_subparser(self, mainparser):
+        m_parser = mainparser.add_parser(self.cli_name)
+        m_parser.set_defaults(func=self.process_cli)
+        m_parser.add_argument("-t", "--tile-size", dest="tile_size", type=int, default=256,
+                              help="the width and height of the tiles, a multiple of 16 (default 256)")
+        m_parser.add_argument("-l", "--layout", dest="layout", choices=["subifd", "chained"], default="subifd",
+                              help="store reduced resolution images as SubIFDs of the main image, or chained after "
+                                   "it (default subifd)")
+        m_parser.add_argument("-c", "--compression", dest="compression", choices=sorted(compression_names),
+                              default="deflate", help="the compression of the tiles (default deflate)")
+        m_parser.add_argument("--level", dest="level", type=int, help="the deflate compression level (0-9)")
+        m_parser.add_argument("--predictor", dest="predictor", type=int, choices=[1, 2, 3],
+                              help="the predictor to apply before compression")
+        m_parser.add_argument("-o", dest="output", help="the pyramid file to write (default <file>.pyramid.tif)")
+        self.add_format_argument(m_parser)
+        m_parser.add_argument("file", help="the TIFF file to create a pyramid of")
+
+    def process_cli(self, args):
+        output = self.format_result(self.run(args), args).rstrip("\n")
+        print(output)
+        return output
+
+    def run(self, args):
+        """Creates the pyramid, returning a Result with a record (file, output, level, width, height) per level"""
+        to_file = args.output
+        if to_file is None:
+            to_file = args.file + ".pyramid.tif"
+        elif os.path.isdir(to_file):
+            to_file = os.path.join(to_file, os.path.basename(args.file) + ".pyramid.tif")
+
+        # parse header-only, so the master image is read strip by strip rather than loaded whole
+        pyramid = Pyramid.create(Tiff(args.file, images=False), args.tile_size, args.layout, args.compression,
+                                 getattr(args, "level", None), getattr(args, "predictor", None))
+        pyramid.save_tiff(to_file)
+
+        main = pyramid.ifds[0]
+        levels = [main] + (main.sub_ifds if args.layout == "subifd" else pyramid.ifds[1:])
+        records = [{"file": args.file, "output": to_file, "level": i, "width": ifd.get_image_width(),
+                    "height": ifd.get_image_height()} for i, ifd in enumerate(levels)]
+        return Result(records, ["file", "output", "level", "width", "height"], CreatePyramid.text_lines)
+
+    @staticmethod
+    def text_lines(records):
+        records = list(records)
+        sizes = ", ".join("{0}x{1}".format(record["width"], record["height"]) for record in records)
+        yield "Pyramid ({sizes}):\t{file}".format(sizes=sizes, file=records[0]["output"])
+
+
+module = CreatePyramid()  # initiate module class when module imported
@@ -3,12 +3,17 @@ Module to perform a migration on a TIFF encoded to 24 bits per channel (i.e. 72
 Such TIFFs typically occur through being saved as 24 bit TIFFs in Photoshop.
 """
 import os
+import sys
 
 from tifinity.modules import BaseModule
 
+from tifinity.parser.sources import archive_sources, is_archive, source_name, split_member
 from tifinity.parser.tiff import Tiff
 from tifinity.parser.errors import InvalidTiffError
 from tifinity.actions.rgb72_to_rgb96 import rgb72_to_rgb96
+from tifinity.actions.sniff import BIGTIFF, NOT_TIFF, TIFF, sniff_file
+from tifinity.parser.compression import compression_names
+from tifinity.scripts.formatters import Result, write_result
 
 # Module version
 __version__ = '0.1.0'
@@ -22,26 +27,71 @@ class MigrateRGB72(BaseModule):
     def add_subparser(self, mainparser):
         m_parser = mainparser.add_parser(self.cli_name)
         m_parser.set_defaults(func=self.process_cli)
-        m_parser.add_argument("path", nargs="+", help="the TIFF file or folder(s) containing TIFFs to migrate.")
+        m_parser.add_argument("path", nargs="+",
+                              help="the TIFF file(s) (or archive members, archive::member), or folder(s) or ZIP or "
+                                   "tar archive(s) containing TIFFs to migrate.")
         m_parser.add_argument("-o", dest="output", help="the output folder to output the converted TIFF(s) to.")
+        m_parser.add_argument("-c", "--compression", dest="compression", choices=sorted(compression_names),
+                              help="compress the converted image data (default: keep the original compression)")
+        m_parser.add_argument("--level", dest="level", type=int, help="the Deflate compression level (1-9)")
+        m_parser.add_argument("--predictor", dest="predictor", type=int, choices=[1, 2, 3],
+                              help="the predictor to apply before compression (3 = floating point)")
+        m_parser.add_argument("--strip-size", dest="strip_size", type=int,
+                              help="the target number of uncompressed bytes per strip")
+        self.add_format_argument(m_parser)
 
     def process_cli(self, args):
+        # stream the results, so progress is shown as each file is migrated
+        write_result(self.run(args), sys.stdout, self.output_format(args))
+        sys.stdout.flush()
+
+    def run(self, args):
+        """Returns a Result with a record (file, output, status) for each file, migrating each file as the records
+           are consumed. The status is one of 'migrated', 'not required' or 'invalid'."""
+        return Result(self._records(args), ["file", "output", "status"], MigrateRGB72.text_lines)
+
+    def _records(self, args):
         for path in args.path:
             files = [path]                          # assume path=file to start with
 
             if os.path.isdir(path):
                 files = [x.path for x in os.scandir(path) if x.is_file()]
+            elif is_archive(path):
+                files = archive_sources(path)
 
-            for file in files:
+            for source in files:
+                file = source_name(source)
                 (out_path, filename) = os.path.split(file)
+                member = split_member(file)
+                if member is not None:              # archive members are written alongside the archive
+                    out_path, filename = os.path.dirname(member[0]), os.path.basename(member[1])
 
                 if args.output:
                     out_path = args.output
 
-                self.__migrate_tiff(file, os.path.join(out_path, filename + ".conv.tif"))
-
-    def __migrate_tiff(self, fromfile, to_file):
-        print("Migrating " + fromfile, end='', flush=True)
+                to_file = os.path.join(out_path, filename + ".conv.tif")
+                status = self.__migrate_tiff(source, to_file, args)
+                yield {"file": file, "output": to_file if status == "migrated" else None, "status": status}
+
+    @staticmethod
+    def is_rgb72(sniffed):
+        """Returns whether the first image of a sniffed TIFF (see sniff_file) is 72 bit RGB"""
+        return sniffed["photometric"] == 2 and sniffed["bits_per_sample"] == [24, 24, 24]
+
+    @staticmethod
+    def text_lines(records):
+        messages = {"migrated": "Done", "not required": "Not migrated (No need)",
+                    "invalid": "Not migrated (Invalid TIFF/Not a TIFF)"}
+        for record in records:
+            yield "Migrating {0}\t\t{1}".format(record["file"], messages[record["status"]])
+
+    def __migrate_tiff(self, fromfile, to_file, args):
+        # sniff the header and first IFD, so non-TIFFs and single page images which aren't RGB72 aren't read
+        sniffed = sniff_file(fromfile)
+        if sniffed["kind"] in (NOT_TIFF, BIGTIFF):
+            return "invalid"
+        if sniffed["kind"] == TIFF and sniffed["pages"] == 1 and not MigrateRGB72.is_rgb72(sniffed):
+            return "not required"
 
         try:
             tiff = Tiff(fromfile)
@@ -51,12 +101,15 @@ class MigrateRGB72(BaseModule):
 
             # Write new TIFF if at least one sub-image has been migrated
             if migrated:
-                print("\t\tDone")
-                tiff.save_tiff(to_file)
-            else:
-                print("\t\tNot migrated (No need)")
+                tiff.save_tiff(to_file,
+                               compression=getattr(args, "compression", None),
+                               level=getattr(args, "level", None),
+                               predictor=getattr(args, "predictor", None),
+                               strip_size=getattr(args, "strip_size", None))
+                return "migrated"
+            return "not required"
         except InvalidTiffError:
-            print("\t\tNot migrated (Invalid TIFF/Not a TIFF)")
+            return "invalid"
 
 
 module = MigrateRGB72()  # initiate module class when module imported
@@ -0,0 +1,41 @@
+import signal
+import sys
+
+from tifinity.actions.server import TifinityServer
+from tifinity.modules import BaseModule
+
+
+class Serve(BaseModule):
+    """ Module running tifinity as a long running server, so that many commands can be run without the start up
+        cost of each. Jobs (JSON lines) are read from stdin, or from connections to a Unix socket, and run in a pool
+        of warm worker processes. Use the global --server option (or $TIFINITY_SERVER) to send commands to it. """
+
+    def __init__(self):
+        self.cli_name = 'serve'
+
+    def add_subparser(self, mainparser):
+        m_parser = mainparser.add_parser(self.cli_name)
+        m_parser.set_defaults(func=self.process_cli)
+        m_parser.add_argument("-s", "--socket", dest="socket",
+                              help="the Unix socket to listen on (default: read jobs from stdin)")
+        m_parser.add_argument("-w", "--workers", dest="workers", type=int,
+                              help="the number of worker processes (default: number of cores)")
+
+    @staticmethod
+    def _terminate(signum, frame):
+        sys.exit(0)
+
+    def process_cli(self, args):
+        server = TifinityServer(args.workers)
+        signal.signal(signal.SIGTERM, Serve._terminate)     # clean up (e.g. the socket) when terminated
+        try:
+            if args.socket is None:
+                return server.serve_stream(sys.stdin, sys.stdout)
+            server.serve_socket(args.socket)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
+
+
+module = Serve()  # initiate module class when module imported
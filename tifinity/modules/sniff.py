@@ -0,0 +1,53 @@
+from tifinity.actions.sniff import FIELDS, TIFF, sniff_collection
+from tifinity.modules import BaseModule
+from tifinity.scripts.formatters import Result
+
+
+class Sniff(BaseModule):
+    """ Module classifying files as TIFFs (or not) from their header and first IFD alone, reporting each TIFF's byte
+        order, page count, dimensions, samples, bits per sample, compression, photometric interpretation and layout,
+        for surveying mixed folders quickly. """
+
+    def __init__(self):
+        self.cli_name = 'sniff'
+
+    def add_subparser(self, mainparser):
+        m_parser = mainparser.add_parser(self.cli_name)
+        m_parser.set_defaults(func=self.process_cli)
+        m_parser.add_argument("--tiffs-only", dest="tiffs_only", action="store_true",
+                              help="only report files which are TIFFs")
+        m_parser.add_argument("--by-extension", dest="by_extension", action="store_true",
+                              help="only sniff files with a TIFF extension (default: every file)")
+        m_parser.add_argument("-w", "--workers", dest="workers", type=int,
+                              help="the number of worker processes used for folders (default: number of cores)")
+        self.add_format_argument(m_parser)
+        m_parser.add_argument("paths", nargs="+", help="the files, folders or ZIP or tar archives to classify")
+
+    def process_cli(self, args):
+        output = self.format_result(self.run(args), args)
+        print(output, end='' if output.endswith("\n") else "\n")
+        return output
+
+    def run(self, args):
+        """Returns a Result with a record per file: its kind (tiff, bigtiff, not_tiff or error) and, for TIFFs, the
+           byte order, number of pages and the first image's properties"""
+        records = sniff_collection(args.paths, getattr(args, "workers", None),
+                                   all_files=not getattr(args, "by_extension", False))
+        if getattr(args, "tiffs_only", False):
+            records = (r for r in records if r["kind"] == TIFF)
+        return Result(records, FIELDS, Sniff.text_lines)
+
+    @staticmethod
+    def text_lines(records):
+        for record in records:
+            if record["kind"] != TIFF or record["pages"] == 0:
+                yield "{0}:\t{1}{2}".format(record["file"], record["kind"],
+                                            "\t" + record["error"] if record["error"] else "")
+                continue
+            yield "{0}:\ttiff\t{1} page(s)\t{2}x{3}\t{4} x {5} bits\tcompression {6}\tphotometric {7}\t{8}\t{9} " \
+                  "endian".format(record["file"], record["pages"], record["width"], record["height"],
+                                  record["samples"], record["bits_per_sample"], record["compression"],
+                                  record["photometric"], record["layout"], record["byte_order"])
+
+
+module = Sniff()  # initiate module class when module imported
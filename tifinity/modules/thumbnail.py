@@ -0,0 +1,56 @@
+import os
+
+from tifinity.actions.thumbnail import Thumbnail
+from tifinity.modules import BaseModule
+from tifinity.parser.compression import compression_names
+from tifinity.parser.tiff import Tiff
+from tifinity.scripts.formatters import Result
+
+
+class CreateThumbnail(BaseModule):
+    """ Module creating a small preview TIFF from a TIFF's main image, using a box filter applied one strip at a
+        time. An existing reduced-resolution image in the TIFF is used as the source when large enough. """
+
+    def __init__(self):
+        self.cli_name = 'thumbnail'
+
+    def add_subparser(self, mainparser):
+        m_parser = mainparser.add_parser(self.cli_name)
+        m_parser.set_defaults(func=self.process_cli)
+        m_parser.add_argument("-s", "--size", dest="size", type=int, default=256,
+                              help="the maximum width or height of the thumbnail (default 256)")
+        m_parser.add_argument("-c", "--compression", dest="compression", choices=sorted(compression_names),
+                              default="deflate", help="the compression of the thumbnail (default deflate)")
+        m_parser.add_argument("-o", dest="output", help="the thumbnail file to write (default <file>.thumb.tif)")
+        self.add_format_argument(m_parser)
+        m_parser.add_argument("file", help="the TIFF file to create a thumbnail of")
+
+    def process_cli(self, args):
+        output = self.format_result(self.run(args), args).rstrip("\n")
+        print(output)
+        return output
+
+    def run(self, args):
+        """Creates the thumbnail, returning a Result with a record (file, output, width, height)"""
+        to_file = args.output
+        if to_file is None:
+            to_file = args.file + ".thumb.tif"
+        elif os.path.isdir(to_file):
+            to_file = os.path.join(to_file, os.path.basename(args.file) + ".thumb.tif")
+
+        # parse header-only, so only the strips of the image the thumbnail is made from are read
+        thumb = Thumbnail.create(Tiff(args.file, images=False), args.size)
+        thumb.save_tiff(to_file, compression=args.compression)
+
+        ifd = thumb.ifds[0]
+        record = {"file": args.file, "output": to_file, "width": ifd.get_image_width(),
+                  "height": ifd.get_image_height()}
+        return Result([record], ["file", "output", "width", "height"], CreateThumbnail.text_lines)
+
+    @staticmethod
+    def text_lines(records):
+        for record in records:
+            yield "Thumbnail ({w}x{h}):\t{file}".format(w=record["width"], h=record["height"], file=record["output"])
+
+
+module = CreateThumbnail()  # initiate module class when module imported
@@ -1,9 +1,16 @@
-from tifinity.actions.icc_parser import IccProfile
+import os
+import sys
+from itertools import groupby
+
+from tifinity.actions.collection import TagTable, collection_rows, profile_inventory, write_parquet
+from tifinity.actions.icc_parser import profile_cache
 
 from tifinity.modules import BaseModule
 
+from tifinity.parser.sources import is_archive
 from tifinity.parser.tiff import Tiff
-from tifinity.parser.tiff import inv_ifdtag
+from tifinity.parser.tiff import ifdtag, inv_ifdtag
+from tifinity.scripts.formatters import Result, write_csv
 
 class TiffDetails(BaseModule):
     def __init__(self):
@@ -15,6 +22,7 @@ class TiffDetails(BaseModule):
 
         #m_parser.add_argument("--json", dest="json", action="store_true", help="output in json format")
         m_parser.add_argument("--csv", dest="csv", action="store_true", help="output table in csv format")
+        self.add_format_argument(m_parser)
 
         # note: if this is the last optional argument used before the file argument, then either this optional
         #       argument has to be specified *after* the file on the CLI or a "--" has to be used to separate the
@@ -28,7 +36,17 @@ class TiffDetails(BaseModule):
         # m_parser.add_argument("--expand", dest="expand", action="store_true",
         #                       help="prints the actual value not the hex representation")
 
-        m_parser.add_argument("file", help="the TIFF file whose tags to show")
+        m_parser.add_argument("--table", dest="table",
+                              help="write a table (one row per IFD, one column per tag) of the file, or of every TIFF "
+                                   "in the folder, to the specified .csv or .parquet file ('-' for stdout)")
+        m_parser.add_argument("--profiles", dest="profiles", action="store_true",
+                              help="list the distinct ICC profiles embedded in the file, or the TIFFs in the folder, "
+                                   "with the number of IFDs each is embedded in")
+        m_parser.add_argument("-w", "--workers", dest="workers", type=int,
+                              help="the number of worker processes used to build a table (default: number of cores)")
+
+        m_parser.add_argument("file", help="the TIFF file (or archive member, archive::member) whose tags to show, "
+                                            "or a folder or ZIP or tar archive of TIFFs to tabulate")
 
     @staticmethod
     def _normalise_tag(tag):
@@ -40,6 +58,52 @@ class TiffDetails(BaseModule):
         return norm_tag
 
     def process_cli(self, args):
+        if getattr(args, "profiles", False):
+            output = self.format_result(self.profiles(args), args)
+            print(output, end='' if output.endswith("\n") else "\n")
+            return output
+        if getattr(args, "table", None) is not None or os.path.isdir(args.file) or is_archive(args.file):
+            return self.process_collection(args)
+
+        output = self.format_result(self.run(args), args)
+        print(output, end='' if output.endswith("\n") else "\n")
+        return output
+
+    def process_collection(self, args):
+        """Writes a table of the tags of every IFD of every TIFF in the file or folder (header-only parsing, in
+           parallel), streaming rows to the CSV or Parquet output"""
+        table = TagTable(self._table_tags(getattr(args, "tags", None)))
+        rows = collection_rows([args.file], table, getattr(args, "workers", None))
+        to_file = getattr(args, "table", None) or "-"
+
+        if to_file.lower().endswith(".parquet"):
+            count = write_parquet(rows, table, to_file)
+        elif to_file == "-":
+            write_csv(Result(rows, table.columns), sys.stdout)
+            return None
+        else:
+            with open(to_file, "w", newline="") as out:
+                count = write_csv(Result(rows, table.columns), out)
+
+        output = "Table ({count} rows):\t{file}".format(count=count, file=to_file)
+        print(output)
+        return output
+
+    def profiles(self, args):
+        """Returns a Result with a record for each distinct ICC profile in the file or folder's TIFFs"""
+        return Result(profile_inventory([args.file], getattr(args, "workers", None)),
+                      ["count", "digest", "size", "version", "device_class", "colour_space", "description"])
+
+    @staticmethod
+    def _table_tags(tags):
+        """Returns the numeric tags for table columns from the requested tags, or None for the default columns"""
+        if tags is None:
+            return None
+        return [v for v in (TiffDetails._normalise_tag(t) for t in tags) if v is not None]
+
+    def run(self, args):
+        """Returns a Result with a record for each (requested) tag of each IFD: file, ifd, tag, name, type, count and
+           value (None if a requested tag is not present). ASCII values are strings and UNDEFINED values hex."""
         tiff = Tiff(args.file)
 
         numeric_tags = set([])
@@ -61,45 +125,58 @@ class TiffDetails(BaseModule):
 
             image_tags.append(directories)
 
-        for ifd in range(len(tiff.ifds)):
-            output = TiffDetails.format_output(args.file,
-                                            ifd,
-                                            tiff.ifds[ifd].offset,
-                                            tiff.ifds[ifd].numtags,
-                                            tiff.ifds[ifd].nextifd,
-                                            list(numeric_tags),
-                                            image_tags[ifd],
-                                            not args.detail,
-                                            args.csv)
-            print (output)
+        def records():
+            for i, ifd in enumerate(tiff.ifds):
+                for tag, directory in image_tags[i].items():
+                    yield {"file": args.file, "ifd": i, "offset": ifd.offset, "numtags": ifd.numtags,
+                           "nextifd": ifd.nextifd, "tag": tag, "name": ifdtag.get(tag, "Unknown"),
+                           "type": None if directory is None else directory.type,
+                           "count": None if directory is None else directory.count,
+                           "value": None if directory is None else TiffDetails.record_value(directory),
+                           "directory": directory}
 
-    @staticmethod
-    def format_output(filename, ifd, offset, numtags, nextifd, req_tags, directories, limit_value=False, csvout=False):
-        if csvout:
-            out = "{0}\t{1}\t".format(filename, ifd)
-            for key in sorted(req_tags):
-                if key in directories and directories[key] is not None:
-                    out += str(TiffDetails.display_value(directories[key], csvout))
-                out += "\t"
-        else:
-            out = "\n"
-            out += "IFD (Offset: " + str(offset) + " | num tags: " + str(numtags) + " | next IFD: " + str(nextifd)\
-                   + ")\n"
+        def text_lines(recs):
+            return TiffDetails.text_lines(recs, sorted(numeric_tags), not getattr(args, "detail", False),
+                                          getattr(args, "csv", False))
 
-            #out += "{0}\t{1:31}\t{2:4}\t{3:6}\t{4}\n".format("TAG #", "TAG NAME", "TYPE", "COUNT", "VALUE")
+        return Result(records(), ["file", "ifd", "tag", "name", "type", "count", "value"], text_lines)
 
-            for tag, directory in directories.items():
+    @staticmethod
+    def text_lines(records, req_tags, limit_value=False, csvout=False):
+        """Yields the text output for the records: a tab separated line per IFD if csvout, otherwise each IFD's
+           details followed by a line per tag"""
+        for ifd, ifd_records in groupby(records, key=lambda r: r["ifd"]):
+            ifd_records = list(ifd_records)
+            first = ifd_records[0]
+            if csvout:
+                directories = {r["tag"]: r["directory"] for r in ifd_records}
+                values = [str(TiffDetails.display_value(directories[key], csvout))
+                          if directories.get(key) is not None else "" for key in req_tags]
+                yield "{0}\t{1}\t".format(first["file"], ifd) + "".join(v + "\t" for v in values)
+                continue
+
+            yield ""
+            yield "IFD (Offset: " + str(first["offset"]) + " | num tags: " + str(first["numtags"]) + \
+                  " | next IFD: " + str(first["nextifd"]) + ")"
+            for record in ifd_records:
+                directory = record["directory"]
                 if directory is not None:
-                    out += directory.tostring(limit_value)
-
-                    if tag==34675:
-                        profile = IccProfile(directory.value)
-                        out += profile.tostring(limit_value)
+                    line = directory.tostring(limit_value)
+                    if record["tag"] == 34675:
+                        line += profile_cache.get(directory.value).tostring(limit_value)
+                    yield line
                 else:
-                    out += "[{0}]\t[Not Present]".format(tag)
-                out += "\n"
+                    yield "[{0}]\t[Not Present]".format(record["tag"])
+            yield ""
 
-        return out
+    @staticmethod
+    def record_value(directory):
+        """Returns the directory's value in a form suitable for structured output"""
+        if directory.type == 2:     # ascii
+            return ''.join(chr(i) for i in directory.value).rstrip('\x00')
+        if directory.type == 7:     # undefined
+            return bytes(directory.value).hex()
+        return directory.to_list()
 
     @staticmethod
     def display_value(directory, csvout=False):
@@ -111,16 +188,16 @@ class TiffDetails(BaseModule):
 
         # TAGS
         elif directory.tag == 34675:   # ICC Profile
-            profile = IccProfile(directory.value)
+            profile = profile_cache.get(directory.value)
             if csvout:
                 return profile.header['data_colour_space']
             else:
                 out = ""
-                for icc_tag, icc_value in profile.header.items:
+                for icc_tag, icc_value in profile.header.items():
                     out += "[{0}\t{1}\n".format(icc_tag, icc_value)
                 return out
 
-        return directory.value
+        return directory.to_list()
 
 
 module = TiffDetails()  # initiate module class when module imported
\ No newline at end of file
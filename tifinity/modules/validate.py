@@ -0,0 +1,70 @@
+import os
+
+from tifinity.actions.validate import DEFAULT_MIN_GAP, ERROR, validate_collection, validate_file
+from tifinity.modules import BaseModule
+from tifinity.scripts.formatters import Result
+
+
+class Validate(BaseModule):
+    """ Module checking the structure of TIFF files without reading image data: the byte ranges referenced by the
+        header, IFDs, tag values and strips are checked for overlaps, gaps and ranges past the end of the file, and
+        IFD chains for loops. """
+
+    def __init__(self):
+        self.cli_name = 'validate'
+
+    def add_subparser(self, mainparser):
+        m_parser = mainparser.add_parser(self.cli_name)
+        m_parser.set_defaults(func=self.process_cli)
+        m_parser.add_argument("--min-gap", dest="min_gap", type=int, default=DEFAULT_MIN_GAP,
+                              help="the smallest number of unreferenced bytes reported as a gap (default {0}, "
+                                   "ignoring word alignment padding)".format(DEFAULT_MIN_GAP))
+        m_parser.add_argument("--errors-only", dest="errors_only", action="store_true",
+                              help="only report errors (not gaps or shared strips)")
+        m_parser.add_argument("-w", "--workers", dest="workers", type=int,
+                              help="the number of worker processes used to validate a folder (default: number of "
+                                   "cores)")
+        self.add_format_argument(m_parser)
+        m_parser.add_argument("file", help="the TIFF file to validate, or a folder of TIFFs")
+
+    def process_cli(self, args):
+        output = self.format_result(self.run(args), args)
+        print(output, end='' if output.endswith("\n") else "\n")
+        return output
+
+    def run(self, args):
+        """Returns a Result with a record (file, severity, issue, start, end, description) per issue found, or a
+           single 'valid' record for a file without issues. Folders are validated in parallel worker processes."""
+        fields = ["file", "severity", "issue", "start", "end", "description"]
+        return Result(self._records(args), fields, Validate.text_lines)
+
+    def _records(self, args):
+        min_gap = getattr(args, "min_gap", DEFAULT_MIN_GAP)
+        if os.path.isdir(args.file):
+            results = validate_collection([args.file], min_gap, getattr(args, "workers", None))
+        else:
+            results = [(args.file, validate_file(args.file, min_gap))]
+
+        for filename, issues in results:
+            if getattr(args, "errors_only", False):
+                issues = [i for i in issues if i["severity"] == ERROR]
+            if not issues:
+                yield {"file": filename, "severity": "ok", "issue": "valid", "start": None, "end": None,
+                       "description": ""}
+            for i in issues:
+                yield dict(i, file=filename)
+
+    @staticmethod
+    def text_lines(records):
+        for record in records:
+            if record["issue"] == "valid":
+                yield "{0}:\tvalid".format(record["file"])
+                continue
+            location = ""
+            if record["start"] is not None:
+                location = "[{0}, {1})\t".format(record["start"], "?" if record["end"] is None else record["end"])
+            yield "{0}:\t{1}\t{2}\t{3}{4}".format(record["file"], record["severity"], record["issue"], location,
+                                                   record["description"])
+
+
+module = Validate()  # initiate module class when module imported
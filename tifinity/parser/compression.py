@@ -0,0 +1,351 @@
+"""
+Strip compression and predictor support for the TIFF parser.
+
+Supports decoding and encoding of uncompressed, LZW, Deflate and PackBits strips, along with horizontal
+differencing (Predictor=2) and floating point (Predictor=3) predictors.
+"""
+import zlib
+
+import numpy as np
+
+from tifinity.parser.errors import UnsupportedCompressionError
+
+NONE = 1
+LZW = 5
+ADOBE_DEFLATE = 8
+PACKBITS = 32773
+DEFLATE = 32946
+
+compression_names = {
+    'none': NONE,
+    'lzw': LZW,
+    'deflate': ADOBE_DEFLATE,
+    'packbits': PACKBITS
+}
+
+PREDICTOR_NONE = 1
+PREDICTOR_HORIZONTAL = 2
+PREDICTOR_FLOATING_POINT = 3
+
+LZW_CLEAR = 256
+LZW_EOI = 257
+LZW_FIRST = 258
+LZW_MAX_BITS = 12
+
+LZW_PROCESS_MIN_BYTES = 4 * 1024 * 1024     # LZW encode images of at least this many bytes in worker processes
+
+
+def get_compression_code(compression):
+    """Returns the numeric Compression tag value for the specified compression name or value"""
+    if isinstance(compression, str):
+        try:
+            return compression_names[compression.lower()]
+        except KeyError:
+            raise UnsupportedCompressionError(compression)
+    return compression
+
+
+def decode(data, compression):
+    """Decompresses the bytes of a single strip, returning a uint8 numpy array"""
+    if compression == NONE:
+        return np.asarray(data, dtype='uint8')
+    elif compression == LZW:
+        return np.frombuffer(lzw_decode(data), dtype='uint8')
+    elif compression in (ADOBE_DEFLATE, DEFLATE):
+        return np.frombuffer(zlib.decompress(_as_bytes(data)), dtype='uint8')
+    elif compression == PACKBITS:
+        return np.frombuffer(packbits_decode(data), dtype='uint8')
+    raise UnsupportedCompressionError(compression)
+
+
+def encode(data, compression, level=None, row_bytes=None):
+    """Compresses the bytes of a single strip, returning a uint8 numpy array.
+       PackBits packs each row separately, so requires the number of bytes per row."""
+    if compression == NONE:
+        return np.asarray(data, dtype='uint8')
+    elif compression == LZW:
+        return np.frombuffer(lzw_encode(data), dtype='uint8')
+    elif compression in (ADOBE_DEFLATE, DEFLATE):
+        level = 6 if level is None else level
+        return np.frombuffer(zlib.compress(_as_bytes(data), level), dtype='uint8')
+    elif compression == PACKBITS:
+        return np.frombuffer(packbits_encode(data, row_bytes), dtype='uint8')
+    raise UnsupportedCompressionError(compression)
+
+
+def encode_strip(data, compression, level, row_bytes, predictor, width, samples, bits, byteorder):
+    """Applies the predictor to the bytes of a single strip and compresses them, returning a uint8 numpy array"""
+    data = apply_predictor(data, predictor, width, samples, bits, byteorder)
+    return encode(data, compression, level, row_bytes)
+
+
+def _as_bytes(data):
+    if isinstance(data, np.ndarray):
+        return np.ascontiguousarray(data, dtype='uint8').tobytes()
+    return bytes(data)
+
+
+def lzw_decode(data):
+    """Decodes TIFF flavoured LZW data (MSB-first codes, 9 to 12 bits, with early code width change)"""
+    data = _as_bytes(data) + b'\x00\x00\x00\x00'
+    total_bits = (len(data) - 4) * 8
+    out = bytearray()
+
+    table = [bytes([i]) for i in range(256)] + [b'', b'']
+    nbits = 9
+    bitpos = 0
+    prev = None
+
+    while bitpos + nbits <= total_bits:
+        byte = bitpos >> 3
+        window = int.from_bytes(data[byte:byte + 4], byteorder='big')
+        code = (window >> (32 - (bitpos & 7) - nbits)) & ((1 << nbits) - 1)
+        bitpos += nbits
+
+        if code == LZW_EOI:
+            break
+        if code == LZW_CLEAR:
+            del table[LZW_FIRST:]
+            nbits = 9
+            prev = None
+            continue
+
+        if prev is None:
+            entry = table[code]
+        else:
+            if code < len(table):
+                entry = table[code]
+            else:
+                entry = prev + prev[:1]     # code not yet in table (KwKwK case)
+            table.append(prev + entry[:1])
+
+        out += entry
+        prev = entry
+
+        if len(table) + 1 >= (1 << nbits) and nbits < LZW_MAX_BITS:
+            nbits += 1
+
+    return bytes(out)
+
+
+def lzw_encode(data):
+    """Encodes data using TIFF flavoured LZW compression. Pure Python (holding the GIL), so strips are encoded in
+       parallel in worker processes rather than threads (see Tiff.encode_image)."""
+    data = _as_bytes(data)
+    out = bytearray()
+    append = out.append
+
+    # the table maps (code << 8 | next byte) to the code of the extended string, with single bytes as codes 0-255,
+    # so strings are never built
+    table = {}
+    next_code = LZW_FIRST
+    nbits = 9
+    limit = 1 << nbits
+    buffer = LZW_CLEAR      # pending bits, starting with a clear code
+    buffered = nbits        # number of pending bits
+
+    current = -1
+    for byte in data:
+        if current < 0:
+            current = byte
+            continue
+        key = (current << 8) | byte
+        code = table.get(key)
+        if code is not None:
+            current = code
+            continue
+
+        # emit the current code
+        buffer = (buffer << nbits) | current
+        buffered += nbits
+        while buffered >= 8:
+            buffered -= 8
+            append((buffer >> buffered) & 0xff)
+        buffer &= (1 << buffered) - 1
+
+        table[key] = next_code
+        next_code += 1
+        current = byte
+
+        if next_code == (1 << LZW_MAX_BITS) - 2:
+            # table full, so start again
+            buffer = (buffer << nbits) | LZW_CLEAR
+            buffered += nbits
+            table = {}
+            next_code = LZW_FIRST
+            nbits = 9
+            limit = 1 << nbits
+        elif next_code >= limit:
+            nbits += 1
+            limit = 1 << nbits
+
+    codes = []
+    if current >= 0:
+        codes.append((current, nbits))
+        next_code += 1
+        if next_code > (1 << nbits) - 1 and nbits < LZW_MAX_BITS:
+            nbits += 1
+    codes.append((LZW_EOI, nbits))
+    for code, width in codes:
+        buffer = (buffer << width) | code
+        buffered += width
+        while buffered >= 8:
+            buffered -= 8
+            append((buffer >> buffered) & 0xff)
+        buffer &= (1 << buffered) - 1
+
+    if buffered > 0:
+        append((buffer << (8 - buffered)) & 0xff)
+    return bytes(out)
+
+
+def packbits_decode(data):
+    """Decodes PackBits run-length encoded data"""
+    data = _as_bytes(data)
+    out = bytearray()
+    pos = 0
+    while pos < len(data):
+        n = data[pos]
+        pos += 1
+        if n < 128:                 # literal run of n+1 bytes
+            out += data[pos:pos + n + 1]
+            pos += n + 1
+        elif n > 128:               # next byte repeated 257-n times
+            out += data[pos:pos + 1] * (257 - n)
+            pos += 1
+        # n == 128 (-128) is a no-op
+    return bytes(out)
+
+
+def packbits_encode(data, row_bytes=None):
+    """Encodes data using PackBits run-length encoding, packing each row separately. Vectorised: runs of identical
+       bytes are found with numpy, split into packets of at most 128 bytes (runs of 3 or more bytes replicated, the
+       rest literal) and the packets' headers and bytes scattered into the output in a single pass."""
+    data = np.frombuffer(_as_bytes(data), dtype='uint8')
+    size = len(data)
+    if size == 0:
+        return b''
+    row_bytes = row_bytes or size
+    positions = np.arange(size)
+    row_start = positions % row_bytes == 0
+
+    # maximal runs of identical bytes within a row, split into pieces of at most 128 bytes
+    run_starts = np.flatnonzero(row_start | np.concatenate(([True], data[1:] != data[:-1])))
+    run_lengths = np.diff(np.append(run_starts, size))
+    starts, lengths = _split(run_starts, run_lengths)
+    replicate = lengths >= 3
+
+    # consecutive literal pieces of a row are merged, then split into packets of at most 128 bytes
+    new_group = replicate | row_start[starts]
+    new_group[1:] |= replicate[:-1]
+    group = np.cumsum(new_group) - 1
+    group_starts = starts[new_group]
+    group_lengths = np.bincount(group, weights=lengths).astype(np.int64)
+    group_replicate = replicate[new_group]
+    literal_starts, literal_lengths = _split(group_starts[~group_replicate], group_lengths[~group_replicate])
+
+    packet_starts = np.concatenate((starts[replicate], literal_starts))
+    packet_lengths = np.concatenate((lengths[replicate], literal_lengths))
+    packet_replicate = np.concatenate((np.ones(replicate.sum(), bool), np.zeros(len(literal_starts), bool)))
+    order = np.argsort(packet_starts, kind='stable')
+    packet_starts, packet_lengths, packet_replicate = packet_starts[order], packet_lengths[order], \
+        packet_replicate[order]
+
+    # each packet is a header byte followed by one (replicated) byte or its literal bytes
+    payload = np.where(packet_replicate, 1, packet_lengths)
+    header_positions = np.concatenate(([0], np.cumsum(payload + 1)[:-1]))
+    out = np.empty(int(payload.sum() + len(payload)), dtype='uint8')
+    out[header_positions] = np.where(packet_replicate, 257 - packet_lengths, packet_lengths - 1)
+
+    within = np.arange(out.size - len(payload)) - np.repeat(np.cumsum(payload) - payload, payload)
+    out[np.repeat(header_positions + 1, payload) + within] = data[np.repeat(packet_starts, payload) + within]
+    return out.tobytes()
+
+
+def _split(starts, lengths, size=128):
+    """Splits the (start, length) pieces into pieces of at most size"""
+    counts = (lengths + size - 1) // size
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    index = np.arange(counts.sum()) - first
+    piece_starts = np.repeat(starts, counts) + index * size
+    piece_lengths = np.minimum(np.repeat(lengths, counts) - index * size, size)
+    return piece_starts, piece_lengths
+
+
+def _sample_dtype(bits, byteorder):
+    order = '<' if byteorder == 'little' else '>'
+    try:
+        return np.dtype(order + {8: 'u1', 16: 'u2', 32: 'u4', 64: 'u8'}[bits])
+    except KeyError:
+        raise UnsupportedCompressionError("Predictor with {0} bits per sample".format(bits))
+
+
+def _rows(data, row_bytes):
+    """Returns data as a 2D (rows, row_bytes) array, ignoring any incomplete trailing row"""
+    num_rows = len(data) // row_bytes
+    return np.asarray(data, dtype='uint8')[:num_rows * row_bytes].reshape(num_rows, row_bytes)
+
+
+def check_predictor(predictor, bits, sample_format=1):
+    """Raises an UnsupportedCompressionError if the predictor cannot be used with samples of the specified
+       number of bits and SampleFormat (1 = unsigned, 2 = signed, 3 = floating point)"""
+    if predictor in (None, PREDICTOR_NONE):
+        return
+    if predictor == PREDICTOR_HORIZONTAL and bits in (8, 16, 32, 64):
+        return
+    if predictor == PREDICTOR_FLOATING_POINT and sample_format == 3 and bits in (16, 24, 32, 64):
+        return
+    raise UnsupportedCompressionError("Predictor {0} with {1} bit samples (format {2})".format(predictor, bits,
+                                                                                              sample_format))
+
+
+def apply_predictor(data, predictor, width, samples, bits, byteorder):
+    """Applies the specified predictor to uncompressed strip data prior to compression"""
+    if predictor in (None, PREDICTOR_NONE):
+        return data
+
+    samples_per_row = width * samples
+    row_bytes = samples_per_row * bits // 8
+    out = np.array(data, dtype='uint8')
+    rows = _rows(out, row_bytes)
+
+    if predictor == PREDICTOR_HORIZONTAL:
+        values = rows.view(_sample_dtype(bits, byteorder)).reshape(len(rows), width, samples)
+        values[:, 1:] = values[:, 1:] - values[:, :-1].copy()
+    elif predictor == PREDICTOR_FLOATING_POINT:
+        sample_bytes = bits // 8
+        planes = rows.reshape(len(rows), samples_per_row, sample_bytes)
+        if byteorder == 'little':
+            planes = planes[:, :, ::-1]
+        planes = planes.transpose(0, 2, 1).reshape(len(rows), row_bytes)    # most significant bytes first
+        rows[:, :samples] = planes[:, :samples]
+        rows[:, samples:] = planes[:, samples:] - planes[:, :-samples]
+    else:
+        raise UnsupportedCompressionError("Predictor {0}".format(predictor))
+    return out
+
+
+def undo_predictor(data, predictor, width, samples, bits, byteorder):
+    """Reverses the specified predictor on decompressed strip data"""
+    if predictor in (None, PREDICTOR_NONE):
+        return data
+
+    samples_per_row = width * samples
+    row_bytes = samples_per_row * bits // 8
+    out = np.array(data, dtype='uint8')
+    rows = _rows(out, row_bytes)
+
+    if predictor == PREDICTOR_HORIZONTAL:
+        dtype = _sample_dtype(bits, byteorder)
+        values = rows.view(dtype).reshape(len(rows), width, samples)
+        values[:] = np.cumsum(values, axis=1, dtype=dtype.newbyteorder('='))
+    elif predictor == PREDICTOR_FLOATING_POINT:
+        sample_bytes = bits // 8
+        planes = np.cumsum(rows.reshape(len(rows), -1, samples), axis=1, dtype='uint8')
+        planes = planes.reshape(len(rows), sample_bytes, samples_per_row).transpose(0, 2, 1)
+        if byteorder == 'little':
+            planes = planes[:, :, ::-1]
+        rows[:] = planes.reshape(len(rows), row_bytes)
+    else:
+        raise UnsupportedCompressionError("Predictor {0}".format(predictor))
+    return out
@@ -4,4 +4,19 @@ class Error(Exception):
 class InvalidTiffError(Error):
     def __init__(self, filename, message):
         self.filename = filename
-        self.message = message
\ No newline at end of file
+        self.message = message
+
+class UnsupportedCompressionError(Error):
+    def __init__(self, compression):
+        self.compression = compression
+        self.message = "Unsupported compression: {0}".format(compression)
+
+
+class UnsupportedPixelFormatError(Error):
+    def __init__(self, message):
+        self.message = message
+
+
+class UnsupportedProfileError(Error):
+    def __init__(self, message):
+        self.message = message
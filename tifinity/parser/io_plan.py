@@ -0,0 +1,99 @@
+"""
+Planning of coalesced reads of image data (strips or tiles) from disk.
+
+Strips are listed in logical (tag) order, which need not be file order, and each is typically small. Reading them one
+by one costs one request per strip, which dominates on network filesystems. Instead, extents are sorted by file
+offset and neighbours separated by small gaps merged into single large reads; each read scatters its bytes straight
+into the strips' (logical order) positions in the output array with preadv, with any gaps read into a scratch buffer.
+Where preadv is not available, each read is made with pread, or on Windows (which has neither) a seek and read under
+a lock, and scattered by copying.
+"""
+import contextlib
+import os
+import threading
+from collections import namedtuple
+
+from tifinity.parser.errors import InvalidTiffError
+
+DEFAULT_MAX_GAP = 64 * 1024             # merge extents separated by at most this many unused bytes
+DEFAULT_MAX_READ = 64 * 1024 * 1024     # but don't grow a merged read beyond this many bytes
+MAX_BUFFERS = 1024                      # buffers per preadv call (IOV_MAX on Linux)
+
+HAVE_PREADV = hasattr(os, "preadv")
+HAVE_PREAD = hasattr(os, "pread")
+
+# A single read of the file: size bytes from offset, covering the extents (indexes into the planned list) in file
+# order, as (index, position of the extent within the read)
+Read = namedtuple("Read", ["offset", "size", "extents"])
+
+
+def plan_reads(extents, max_gap=DEFAULT_MAX_GAP, max_read=DEFAULT_MAX_READ):
+    """Returns the list of Reads, in file order, covering the specified (offset, size) extents. Extents are merged
+       into one read when separated by no more than max_gap bytes, up to max_read bytes per read. Empty extents
+       are skipped, and overlapping extents start a new read (so each byte is read into one place)."""
+    order = sorted((i for i, (offset, size) in enumerate(extents) if size > 0), key=lambda i: extents[i][0])
+    reads = []
+    offset = end = None
+    members = []
+    for i in order:
+        start, size = extents[i]
+        if members and (start < end or start - end > max_gap or start + size - offset > max_read or
+                        2 * len(members) >= MAX_BUFFERS):
+            reads.append(Read(offset, end - offset, members))
+            members = []
+        if not members:
+            offset = start
+        members.append((i, start - offset))
+        end = start + size
+    if members:
+        reads.append(Read(offset, end - offset, members))
+    return reads
+
+
+def read_into(fd, read, extents, out, starts, lock=None):
+    """Performs the planned read from the file descriptor, copying each of its extents into out (a uint8 array) at
+       the extent's start position. Returns the number of bytes read. Without positioned reads, the file position is
+       shared, so concurrent reads of the same descriptor must hold the lock."""
+    buffers = []
+    position = 0
+    for i, extent_position in read.extents:
+        if extent_position > position:
+            buffers.append(bytearray(extent_position - position))      # gap: read and discarded
+        size = extents[i][1]
+        buffers.append(memoryview(out[starts[i]:starts[i] + size]))
+        position = extent_position + size
+
+    if HAVE_PREADV:
+        count = os.preadv(fd, buffers, read.offset)
+    else:
+        if HAVE_PREAD:
+            data = os.pread(fd, read.size, read.offset)
+        else:
+            with lock or contextlib.nullcontext():
+                os.lseek(fd, read.offset, os.SEEK_SET)
+                data = os.read(fd, read.size)
+        count = len(data)
+        position = 0
+        for buffer in buffers:
+            buffer[:] = data[position:position + len(buffer)]
+            position += len(buffer)
+
+    return count
+
+
+def read_extents(filename, extents, out, starts, executor=None, max_gap=DEFAULT_MAX_GAP):
+    """Reads the (offset, size) extents of the specified file into the out array, each at its start position, using
+       coalesced reads (run concurrently by the executor, if specified). Returns the list of Reads performed.
+       Raises an InvalidTiffError if the file is shorter than the extents."""
+    reads = plan_reads(extents, max_gap)
+    map_func = map if executor is None else executor.map
+    lock = threading.Lock()
+    with open(filename, 'rb') as f:
+        fd = f.fileno()
+        counts = list(map_func(lambda read: read_into(fd, read, extents, out, starts, lock), reads))
+    for read, count in zip(reads, counts):
+        if count < read.size:
+            raise InvalidTiffError(filename, "Read {0} of {1} bytes at offset {2}".format(count, read.size,
+                                                                                      read.offset))
+    return reads
+
@@ -0,0 +1,155 @@
+"""
+Sidecar parse indexes, so that repeatedly opened TIFFs need not have their IFDs parsed again.
+
+Parsing a TIFF walks its IFD chain and reads every tag value, one small read at a time; for files with thousands of
+pages and large strip tables this dominates opening the file. A parse index is a compact sidecar file (an uncompressed
+numpy .npz archive, loaded without pickle) holding the parsed structure: each IFD's offset, entry count, next IFD
+pointer, raw bytes and parent (for SubIFDs), and each tag's type, count, value location and value, the values of
+each kind concatenated into a single array. Loading it is a handful of array reads.
+
+An index is only used if it was written for a file of the same size and modification time (and the same index
+version); otherwise the file is parsed and the index rewritten.
+"""
+import os
+import zipfile
+
+import numpy as np
+
+from tifinity.scripts.instrument import phase
+
+VERSION = 1
+SIDECAR_SUFFIX = ".tifidx.npz"
+
+# value kinds, by the dtype values are read as
+INTS, FLOATS, BYTES, RATIONALS = range(4)
+
+# Whether Tiffs use parse indexes when not explicitly requested (set from the --index CLI option)
+_default_index = False
+
+
+def set_default_index(enabled):
+    """Sets whether Tiffs read and write parse indexes by default"""
+    global _default_index
+    _default_index = bool(enabled)
+
+
+def get_default_index():
+    return _default_index
+
+
+def sidecar_name(filename):
+    """Returns the name of the parse index for the specified file"""
+    return filename + SIDECAR_SUFFIX
+
+
+def _stamp(filename):
+    stat = os.stat(filename)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def write_index(filename, byteorder, ifds, index_file=None):
+    """Writes the parse index of the file's (parsed) IFDs. Returns True if written, False if the index could not be
+       written (e.g. to a read-only folder)."""
+    all_ifds = []                   # (ifd, parent index), each IFD after its parent
+
+    def add(ifd, parent):
+        all_ifds.append((ifd, parent))
+        position = len(all_ifds) - 1
+        for sub_ifd in ifd.sub_ifds:
+            add(sub_ifd, position)
+
+    for ifd in ifds:
+        add(ifd, -1)
+
+    ifd_rows, dir_rows = [], []
+    blobs = {INTS: [], FLOATS: [], BYTES: [], RATIONALS: []}
+    sizes = dict.fromkeys(blobs, 0)
+
+    def store(kind, values):
+        values = np.asarray(values).reshape(-1)
+        blobs[kind].append(values)
+        sizes[kind] += len(values)
+        return sizes[kind] - len(values), len(values)
+
+    for ifd, parent in all_ifds:
+        data_start, data_len = store(BYTES, np.asarray(ifd.ifd_data, dtype='uint8'))
+        ifd_rows.append((ifd.offset, ifd.numtags, ifd.nextifd, parent, len(dir_rows), len(ifd.directories),
+                         data_start, data_len))
+        for directory in ifd.directories.values():
+            value = np.asarray(directory.value)
+            if value.ndim == 2:
+                kind = RATIONALS
+            elif value.dtype.kind == 'f':
+                kind = FLOATS
+            elif value.dtype == np.uint8:
+                kind = BYTES
+            else:
+                kind = INTS
+            start, length = store(kind, value)
+            dir_rows.append((directory.tag, directory.type, directory.type_valid, directory.count,
+                             -1 if directory.value_offset is None else directory.value_offset, kind, start, length))
+
+    size, mtime = _stamp(filename)
+    index_file = index_file or sidecar_name(filename)
+    arrays = {"meta": np.array([VERSION, size, mtime, byteorder == 'big'], dtype='int64'),
+              "ifds": np.array(ifd_rows, dtype='int64').reshape(-1, 8),
+              "dirs": np.array(dir_rows, dtype='int64').reshape(-1, 8),
+              "ints": _concat(blobs[INTS], 'int64'),
+              "floats": _concat(blobs[FLOATS], 'float64'),
+              "bytes": _concat(blobs[BYTES], 'uint8'),
+              "rationals": _concat(blobs[RATIONALS], 'int64')}
+    try:
+        with phase("index_write"):
+            temp = index_file + ".tmp"
+            with open(temp, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(temp, index_file)
+    except OSError:
+        return False
+    return True
+
+
+def _concat(arrays, dtype):
+    return np.concatenate(arrays).astype(dtype) if arrays else np.array([], dtype=dtype)
+
+
+def read_index(filename, index_file=None):
+    """Returns (byte order, main chain IFDs) from the file's parse index, or None if there is no index, or it is not
+       for the current version of the file (or cannot be read)"""
+    index_file = index_file or sidecar_name(filename)
+    try:
+        with phase("index_read"), np.load(index_file, allow_pickle=False) as npz:
+            meta = npz["meta"]
+            if len(meta) != 4 or meta[0] != VERSION or tuple(meta[1:3].tolist()) != _stamp(filename):
+                return None
+            ifd_rows, dirs = npz["ifds"].tolist(), npz["dirs"].tolist()
+            blobs = {INTS: npz["ints"], FLOATS: npz["floats"], BYTES: npz["bytes"],
+                     RATIONALS: npz["rationals"].reshape(-1, 2)}
+        byteorder = 'big' if meta[3] else 'little'
+        return byteorder, _restore_ifds(byteorder, ifd_rows, dirs, blobs)
+    except (OSError, ValueError, KeyError, IndexError, TypeError, EOFError, zipfile.BadZipFile):
+        # missing, truncated or otherwise unreadable: the file is parsed instead
+        return None
+
+
+def _restore_ifds(byteorder, ifd_rows, dirs, blobs):
+    """Returns the main chain IFDs (with their SubIFDs) from the index's rows and value arrays"""
+    from tifinity.parser.tiff import IFD, Directory
+
+    ifds, all_ifds = [], []
+    for offset, numtags, nextifd, parent, first, count, data_start, data_len in ifd_rows:
+        ifd = IFD(offset, byteorder)
+        ifd.numtags = numtags
+        ifd.nextifd = nextifd
+        ifd.ifd_data = blobs[BYTES][data_start:data_start + data_len]
+        for tag, tag_type, type_valid, tag_count, value_offset, kind, start, length in dirs[first:first + count]:
+            if kind == RATIONALS:
+                value = blobs[kind][start // 2:(start + length) // 2]
+            else:
+                value = blobs[kind][start:start + length]
+            directory = Directory(tag, tag_type, tag_count, value, bool(type_valid))
+            directory.set_value_offset(None if value_offset < 0 else value_offset)
+            ifd.add_directory(directory)
+        all_ifds.append(ifd)
+        (ifds if parent < 0 else all_ifds[parent].sub_ifds).append(ifd)
+    return ifds
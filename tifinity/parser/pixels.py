@@ -0,0 +1,132 @@
+"""
+Typed pixel array views of TIFF image data.
+
+Byte-aligned samples (8, 16, 32 and 64 bit) are returned as zero-copy numpy views of the (uncompressed) image
+bytes, with the dtype derived from BitsPerSample, SampleFormat and the TIFF's byte order. Other sample sizes
+(e.g. 1, 4, 12 or 24 bits) are unpacked into the smallest suitable numpy dtype.
+"""
+import numpy as np
+
+from tifinity.parser.errors import UnsupportedPixelFormatError
+
+SAMPLE_FORMAT_UINT = 1
+SAMPLE_FORMAT_INT = 2
+SAMPLE_FORMAT_FLOAT = 3
+
+_dtype_codes = {
+    (SAMPLE_FORMAT_UINT, 8): 'u1', (SAMPLE_FORMAT_UINT, 16): 'u2',
+    (SAMPLE_FORMAT_UINT, 32): 'u4', (SAMPLE_FORMAT_UINT, 64): 'u8',
+    (SAMPLE_FORMAT_INT, 8): 'i1', (SAMPLE_FORMAT_INT, 16): 'i2',
+    (SAMPLE_FORMAT_INT, 32): 'i4', (SAMPLE_FORMAT_INT, 64): 'i8',
+    (SAMPLE_FORMAT_FLOAT, 16): 'f2', (SAMPLE_FORMAT_FLOAT, 32): 'f4', (SAMPLE_FORMAT_FLOAT, 64): 'f8',
+}
+
+
+def sample_dtype(bits, sample_format=SAMPLE_FORMAT_UINT, byteorder='little'):
+    """Returns the numpy dtype for samples of the specified size and format, or None if the samples are not
+       directly addressable (i.e. need unpacking)"""
+    if sample_format not in (SAMPLE_FORMAT_INT, SAMPLE_FORMAT_FLOAT):
+        sample_format = SAMPLE_FORMAT_UINT      # treat void/undefined sample formats as unsigned
+    code = _dtype_codes.get((sample_format, bits))
+    if code is None:
+        return None
+    return np.dtype(('<' if byteorder == 'little' else '>') + code)
+
+
+def unpacked_dtype(bits, sample_format=SAMPLE_FORMAT_UINT):
+    """Returns the (native) dtype samples of the specified size are unpacked to"""
+    if sample_format == SAMPLE_FORMAT_FLOAT:
+        return np.dtype('float32')
+    kind = 'i' if sample_format == SAMPLE_FORMAT_INT else 'u'
+    for size in (8, 16, 32, 64):
+        if bits <= size:
+            return np.dtype(kind + str(size // 8))
+    raise UnsupportedPixelFormatError("{0} bit samples".format(bits))
+
+
+def to_pixels(data, rows, width, samples, bits, sample_format=SAMPLE_FORMAT_UINT, byteorder='little',
+              fill_order=1):
+    """Returns uncompressed, chunky (interleaved) image data as a (rows, width, samples) array.
+       A view of data is returned if the samples are byte-aligned, otherwise the samples are unpacked."""
+    data = np.asarray(data, dtype='uint8')
+    dtype = sample_dtype(bits, sample_format, byteorder)
+
+    if dtype is not None:
+        num_bytes = rows * width * samples * dtype.itemsize
+        _check_length(data, num_bytes)
+        return data[:num_bytes].view(dtype).reshape(rows, width, samples)
+
+    samples_per_row = width * samples
+    row_bytes = (samples_per_row * bits + 7) // 8
+    _check_length(data, rows * row_bytes)
+    raw = data[:rows * row_bytes].reshape(rows, row_bytes)
+
+    if bits == 24:
+        values = _unpack_24(raw, samples_per_row, byteorder)
+        if sample_format == SAMPLE_FORMAT_FLOAT:
+            values = float24_to_float32(values)
+        elif sample_format == SAMPLE_FORMAT_INT:
+            values = (values.astype('int32') << 8) >> 8     # sign extend
+    elif bits == 12 and samples_per_row % 2 == 0:
+        values = _unpack_12(raw, samples_per_row)
+    elif sample_format == SAMPLE_FORMAT_FLOAT:
+        raise UnsupportedPixelFormatError("{0} bit floating point samples".format(bits))
+    else:
+        values = _unpack_bits(raw, samples_per_row, bits, fill_order)
+        if sample_format == SAMPLE_FORMAT_INT:
+            shift = values.dtype.itemsize * 8 - bits
+            signed = values.astype(unpacked_dtype(bits, SAMPLE_FORMAT_INT))
+            values = (signed << shift) >> shift               # sign extend
+    return values.reshape(rows, width, samples)
+
+
+def planes_to_pixels(planes):
+    """Combines a list of (rows, width, 1) sample planes into a (rows, width, samples) array"""
+    if len(planes) == 1:
+        return planes[0]
+    return np.concatenate(planes, axis=2)
+
+
+def _check_length(data, num_bytes):
+    if len(data) < num_bytes:
+        raise UnsupportedPixelFormatError("Image data is {0} bytes, expected {1}".format(len(data), num_bytes))
+
+
+def _unpack_24(raw, samples_per_row, byteorder):
+    """Unpacks 3 byte samples into uint32 values"""
+    b = raw[:, :samples_per_row * 3].reshape(len(raw), samples_per_row, 3).astype('uint32')
+    if byteorder == 'little':
+        return b[:, :, 0] | (b[:, :, 1] << 8) | (b[:, :, 2] << 16)
+    return (b[:, :, 0] << 16) | (b[:, :, 1] << 8) | b[:, :, 2]
+
+
+def _unpack_12(raw, samples_per_row):
+    """Unpacks pairs of 12 bit samples packed (MSB first) into 3 bytes"""
+    b = raw[:, :samples_per_row * 3 // 2].reshape(len(raw), samples_per_row // 2, 3).astype('uint16')
+    out = np.empty((len(raw), samples_per_row // 2, 2), dtype='uint16')
+    out[:, :, 0] = (b[:, :, 0] << 4) | (b[:, :, 1] >> 4)
+    out[:, :, 1] = ((b[:, :, 1] & 0x0f) << 8) | b[:, :, 2]
+    return out.reshape(len(raw), samples_per_row)
+
+
+def _unpack_bits(raw, samples_per_row, bits, fill_order=1):
+    """Unpacks samples of any size up to 64 bits, packed MSB first with rows padded to whole bytes"""
+    bitorder = 'little' if fill_order == 2 else 'big'
+    unpacked = np.unpackbits(raw, axis=1, bitorder=bitorder)[:, :samples_per_row * bits]
+    unpacked = unpacked.reshape(len(raw), samples_per_row, bits)
+    if bits == 1:
+        return unpacked[:, :, 0]
+
+    dtype = unpacked_dtype(bits)
+    weights = (np.uint64(1) << np.arange(bits - 1, -1, -1, dtype='uint64'))
+    return (unpacked.astype('uint64') * weights).sum(axis=2, dtype='uint64').astype(dtype)
+
+
+def float24_to_float32(values):
+    """Converts 24 bit floating point bit patterns (1 sign, 7 exponent, 16 mantissa bits; as written by
+       Photoshop) to float32: if value>0 then (0x80 * value)+0x20000000 else 0x00, keeping the sign bit"""
+    values = np.asarray(values, dtype='uint32')
+    magnitude = values & 0x007fffff
+    sign = (values & 0x00800000) << 8
+    converted = np.where(magnitude > 0x00, (0x80 * magnitude) + 0x20000000, 0x00).astype('uint32') | sign
+    return converted.view('float32')
@@ -0,0 +1,397 @@
+"""
+Byte sources a TIFF can be read from: local files, in-memory bytes and HTTP(S) servers supporting Range requests.
+
+A TiffFileHandler normally holds the whole file (or a memory map of it) as a numpy array. For other sources it holds a
+SourceArray instead, which behaves like a read-only uint8 array but fetches each slice from its source on demand, so
+parsing the header and IFDs only fetches the bytes they occupy, and image data is fetched with coalesced reads (see
+io_plan). Remote sources are wrapped in a BlockCache of fixed size blocks, so the many small reads of the header area
+(the header, IFD entries and out-of-line tag values) cost a few requests rather than one each.
+
+Members of ZIP and tar archives are named archive::member (e.g. bundle.tar::images/page1.tif). Members stored without
+compression are read in place, through a SliceSource of the archive file; compressed members are decompressed (as a
+stream) into memory, as TIFFs need random access. Whole compressed tar archives are processed in a single pass (see
+archive_sources), as reaching each member by name means decompressing the archive from its start.
+"""
+import functools
+import os
+import tarfile
+import threading
+import urllib.request
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+
+from tifinity.parser import io_plan
+from tifinity.parser.errors import InvalidTiffError
+from tifinity.scripts.instrument import add_count
+
+URL_SCHEMES = ("http://", "https://")
+ARCHIVE_SEPARATOR = "::"
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+TIFF_EXTENSIONS = (".tif", ".tiff")
+
+HAVE_PREAD = hasattr(os, "pread")   # positioned reads (not available on Windows)
+
+DEFAULT_BLOCK_SIZE = 64 * 1024      # bytes per cached block
+DEFAULT_MAX_BLOCKS = 64             # blocks held by a cache (4 MiB by default)
+REMOTE_MAX_GAP = 1024 * 1024        # merge remote reads separated by up to this many bytes (requests are expensive)
+
+
+def is_url(name):
+    """Returns whether the specified file name is a URL (rather than a local path)"""
+    return isinstance(name, str) and name.lower().startswith(URL_SCHEMES)
+
+
+def is_archive(path):
+    """Returns whether the specified path is a (local) ZIP or tar archive, by extension"""
+    return isinstance(path, str) and path.lower().endswith(ARCHIVE_EXTENSIONS) and os.path.isfile(path)
+
+
+def split_member(name):
+    """Returns the (archive, member) of an archive member name (archive::member), or None for other names"""
+    if not isinstance(name, str) or ARCHIVE_SEPARATOR not in name or os.path.exists(name):
+        return None
+    archive, member = name.split(ARCHIVE_SEPARATOR, 1)
+    return (archive, member) if is_archive(archive) else None
+
+
+def is_source_name(name):
+    """Returns whether the specified file name is read through a ByteSource (a URL or archive member) rather than
+       as a local file"""
+    return is_url(name) or split_member(name) is not None
+
+
+def open_source(name, block_size=DEFAULT_BLOCK_SIZE, max_blocks=DEFAULT_MAX_BLOCKS):
+    """Returns the ByteSource for the specified URL (with a block cache), archive member or local file name"""
+    if is_url(name):
+        return BlockCache(HttpSource(name), block_size, max_blocks)
+    member = split_member(name)
+    if member is not None:
+        return open_member(*member)
+    return FileSource(name)
+
+
+@functools.lru_cache(maxsize=16)
+def _archive_index(archive, size, mtime):
+    """Returns {member: (data offset, or None if compressed, size)} for the archive's files. Cached (by the archive's
+       size and modification time) so that reading many members does not re-read the archive's directory."""
+    index = {}
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as zf, open(archive, 'rb') as f:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                offset = None
+                if info.compress_type == zipfile.ZIP_STORED:
+                    # data follows the local header: 30 bytes, then the name and extra field
+                    f.seek(info.header_offset + 26)
+                    lengths = f.read(4)
+                    offset = info.header_offset + 30 + int.from_bytes(lengths[:2], 'little') + \
+                        int.from_bytes(lengths[2:], 'little')
+                index[info.filename] = (offset, info.file_size)
+        return index
+
+    try:
+        tf = tarfile.open(archive, "r:")            # uncompressed: members can be read in place
+        stored = True
+    except tarfile.ReadError:
+        tf = tarfile.open(archive, "r:*")
+        stored = False
+    with tf:
+        for info in tf:
+            if info.isfile():
+                index[info.name] = (info.offset_data if stored else None, info.size)
+    return index
+
+
+def archive_index(archive):
+    """Returns {member: (data offset, or None if compressed, size)} for the archive's files"""
+    stat = os.stat(archive)
+    return _archive_index(archive, stat.st_size, stat.st_mtime)
+
+
+def archive_members(archive, extensions=TIFF_EXTENSIONS):
+    """Returns the names (archive::member) of the TIFF members of the archive (by extension, or all members if
+       extensions is None), in archive order"""
+    return [archive + ARCHIVE_SEPARATOR + member for member in archive_index(archive)
+            if extensions is None or member.lower().endswith(extensions)]
+
+
+def archive_sources(archive, extensions=TIFF_EXTENSIONS):
+    """Yields the TIFF members of the archive (as archive_members), in archive order. Members of compressed tar
+       archives are yielded as MemorySources, decompressed in a single pass through the archive; other members are
+       yielded as names (archive::member), which are opened directly."""
+    if not _is_compressed_tar(archive):
+        yield from archive_members(archive, extensions)
+        return
+    with tarfile.open(archive, "r|*") as tf:
+        for info in tf:
+            if info.isfile() and (extensions is None or info.name.lower().endswith(extensions)):
+                with tf.extractfile(info) as f:
+                    data = _read_all(f, info.size)
+                add_count("bytes_decompressed", len(data))
+                yield MemorySource(data, archive + ARCHIVE_SEPARATOR + info.name)
+
+
+def _is_compressed_tar(archive):
+    if zipfile.is_zipfile(archive):
+        return False
+    try:
+        with tarfile.open(archive, "r:"):
+            return False
+    except tarfile.ReadError:
+        return True
+
+
+def source_name(file):
+    """Returns the name of a file (a file name, or a ByteSource)"""
+    return file.name if isinstance(file, ByteSource) else file
+
+
+def open_member(archive, member):
+    """Returns a ByteSource for the archive member: a slice of the archive file if stored uncompressed, otherwise
+       the member decompressed into memory"""
+    name = archive + ARCHIVE_SEPARATOR + member
+    entry = archive_index(archive).get(member)
+    if entry is None:
+        raise FileNotFoundError("No member {0} in {1}".format(member, archive))
+    offset, size = entry
+    if offset is not None:
+        return SliceSource(FileSource(archive), offset, size, name)
+
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as zf, zf.open(member) as f:
+            data = _read_all(f, size)
+    else:
+        with tarfile.open(archive, "r:*") as tf, tf.extractfile(member) as f:
+            data = _read_all(f, size)
+    add_count("bytes_decompressed", len(data))
+    return MemorySource(data, name)
+
+
+def _read_all(f, size, chunk_size=1024 * 1024):
+    """Reads the (size byte) file object into a bytearray, a chunk at a time"""
+    data = bytearray(size)
+    position = 0
+    while position < size:
+        read = f.readinto(memoryview(data)[position:position + chunk_size])
+        if not read:
+            break
+        position += read
+    del data[position:]
+    return data
+
+
+class ByteSource():
+    """A read-only sequence of bytes of a known size, read by offset"""
+    name = None
+    size = 0
+
+    def read(self, offset, size):
+        """Returns up to size bytes from the offset (fewer at the end of the source)"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class FileSource(ByteSource):
+    """A local file, read with pread (so reads from multiple threads don't share a file position), or where pread is
+       not available, with a seek and read under a lock"""
+
+    def __init__(self, filename):
+        self.name = filename
+        self._fd = os.open(filename, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        self.size = os.fstat(self._fd).st_size
+        self._lock = threading.Lock()
+
+    def read(self, offset, size):
+        if HAVE_PREAD:
+            data = os.pread(self._fd, size, offset)
+        else:
+            with self._lock:
+                os.lseek(self._fd, offset, os.SEEK_SET)
+                data = os.read(self._fd, size)
+        add_count("bytes_read", len(data))
+        return data
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __del__(self):
+        self.close()
+
+
+class MemorySource(ByteSource):
+    """Bytes (or any buffer) already in memory"""
+
+    def __init__(self, data, name="<memory>"):
+        self.name = name
+        self._data = memoryview(data).cast('B')
+        self.size = len(self._data)
+
+    def read(self, offset, size):
+        return self._data[offset:offset + size].tobytes()
+
+    def __reduce__(self):
+        # picklable, so members can be passed to worker processes
+        return MemorySource, (self._data.tobytes(), self.name)
+
+
+class SliceSource(ByteSource):
+    """A range of another source (e.g. an archive member stored in place)"""
+
+    def __init__(self, source, offset, size, name=None):
+        self.source = source
+        self.offset = offset
+        self.size = size
+        self.name = name or source.name
+
+    def read(self, offset, size):
+        size = min(size, self.size - offset)
+        if size <= 0:
+            return b""
+        return self.source.read(self.offset + offset, size)
+
+    def close(self):
+        self.source.close()
+
+
+class HttpSource(ByteSource):
+    """A file on an HTTP(S) server, read with Range requests. The size is found with a HEAD request."""
+
+    def __init__(self, url, timeout=60):
+        self.name = url
+        self.timeout = timeout
+        self.requests = 0
+        request = urllib.request.Request(url, method="HEAD")
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            length = response.headers.get("Content-Length")
+        self.requests += 1
+        if length is None:
+            raise InvalidTiffError(url, "Server did not report the file size")
+        self.size = int(length)
+
+    def read(self, offset, size):
+        size = min(size, self.size - offset)
+        if size <= 0:
+            return b""
+        request = urllib.request.Request(self.name, headers={"Range": "bytes={0}-{1}".format(offset,
+                                                                                           offset + size - 1)})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            data = response.read()
+            if response.status != 206:
+                data = data[offset:offset + size]       # server ignored the Range header and sent the whole file
+        self.requests += 1
+        add_count("http_requests", 1)
+        add_count("bytes_read", len(data))
+        return data
+
+
+class BlockCache(ByteSource):
+    """A least recently used cache of fixed size blocks of another source. Small reads are served from (and fill)
+       the cache, fetching each run of missing blocks with a single read; reads larger than half the cache bypass it,
+       so that reading image data does not evict the header area."""
+
+    def __init__(self, source, block_size=DEFAULT_BLOCK_SIZE, max_blocks=DEFAULT_MAX_BLOCKS):
+        self.source = source
+        self.name = source.name
+        self.size = source.size
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.hits = 0
+        self.misses = 0
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def read(self, offset, size):
+        size = min(size, self.size - offset)
+        if size <= 0:
+            return b""
+        first = offset // self.block_size
+        last = (offset + size - 1) // self.block_size
+        if (last - first + 1) * 2 > self.max_blocks:
+            return self.source.read(offset, size)
+
+        blocks = [self._get(block) for block in range(first, last + 1)]
+        missing = [i for i, block in enumerate(blocks) if block is None]
+        if missing:
+            # a single read from the first missing block to the last
+            start = (first + missing[0]) * self.block_size
+            data = self.source.read(start, (missing[-1] - missing[0] + 1) * self.block_size)
+            for i in range(missing[0], missing[-1] + 1):
+                position = (first + i) * self.block_size - start
+                blocks[i] = data[position:position + self.block_size]
+                self._put(first + i, blocks[i])
+        data = b"".join(blocks)
+        start = offset - first * self.block_size
+        return data[start:start + size]
+
+    def _get(self, block):
+        with self._lock:
+            data = self._blocks.get(block)
+            if data is None:
+                self.misses += 1
+            else:
+                self._blocks.move_to_end(block)
+                self.hits += 1
+            return data
+
+    def _put(self, block, data):
+        with self._lock:
+            self._blocks[block] = data
+            self._blocks.move_to_end(block)
+            while len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
+
+    def close(self):
+        self.source.close()
+
+
+class SourceArray():
+    """A read-only, array-like view of a ByteSource: its length is the source size, and slicing returns a uint8
+       numpy array of the bytes read from the source"""
+
+    def __init__(self, source):
+        self.source = source
+
+    def __len__(self):
+        return self.source.size
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.source.size)
+            data = np.frombuffer(self.source.read(start, max(0, stop - start)), dtype='uint8')
+            return data if step == 1 else data[::step]
+        if key < 0:
+            key += self.source.size
+        if not 0 <= key < self.source.size:
+            raise IndexError("index {0} out of range".format(key))
+        return np.uint8(self.source.read(key, 1)[0])
+
+    def read_extents(self, extents, out, starts, executor=None):
+        """Reads the (offset, size) extents into the out array at their start positions, coalescing them into
+           large reads as for files (see io_plan). Returns the list of Reads performed."""
+        reads = io_plan.plan_reads(extents, REMOTE_MAX_GAP)
+
+        def read_into(read):
+            data = self.source.read(read.offset, read.size)
+            if len(data) < read.size:
+                raise InvalidTiffError(self.source.name, "Read {0} of {1} bytes at offset {2}".format(
+                    len(data), read.size, read.offset))
+            for i, position in read.extents:
+                out[starts[i]:starts[i] + extents[i][1]] = np.frombuffer(data, 'uint8', extents[i][1], position)
+
+        list((map if executor is None else executor.map)(read_into, reads))
+        return reads
+
+    def chunks(self, size=io_plan.DEFAULT_MAX_READ):
+        """Yields the whole source, in chunks of up to size bytes"""
+        for offset in range(0, self.source.size, size):
+            yield self.source.read(offset, size)
+
+    def tobytes(self):
+        return self.source.read(0, self.source.size)
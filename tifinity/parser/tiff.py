@@ -1,8 +1,16 @@
+import functools
 import numpy as np
 import math
-from struct import unpack_from
+import os
 
-from tifinity.parser.errors import InvalidTiffError
+from tifinity.parser import compression
+from tifinity.parser import io_plan
+from tifinity.parser import pixels
+from tifinity.parser.errors import InvalidTiffError, UnsupportedPixelFormatError
+from tifinity.parser.parse_index import get_default_index, read_index, write_index
+from tifinity.parser.sources import ByteSource, SourceArray, is_source_name, open_source
+from tifinity.scripts.executor import get_executor
+from tifinity.scripts.instrument import add_count, phase
 
 ifdtype = {
     1: (1, "read_bytes", "insert_bytes"),          # byte      - 1 byte
@@ -10,13 +18,14 @@ ifdtype = {
     3: (2, "read_shorts", "insert_shorts"),        # short     - 2 bytes
     4: (4, "read_ints", "insert_ints"),            # long      - 4 bytes
     5: (8, "read_rationals", "insert_rationals"),  # rational  - 8 bytes
-    6: (1, "read", "insert_bytes"),                # sbyte     - 1 byte
+    6: (1, "read_bytes", "insert_bytes"),          # sbyte     - 1 byte
     7: (1, "read_bytes", "insert_bytes"),          # undefined - 1 byte
     8: (2, "read_shorts", "insert_shorts"),        # sshort    - 2 bytes
     9: (4, "read_ints", "insert_ints"),            # slong     - 4 bytes
     10: (8, "read_rationals", "insert_rationals"), # srational - 8 bytes
     11: (4, "read_floats", "insert_floats"),       # float     - 4 bytes
-    12: (8, "read_doubles", "insert_doubles")      # double    - 8 bytes
+    12: (8, "read_doubles", "insert_doubles"),     # double    - 8 bytes
+    13: (4, "read_ints", "insert_ints")            # ifd       - 4 bytes (offset to an IFD)
 }
 
 ifdtag = {
@@ -60,6 +69,11 @@ ifdtag = {
     318: "WhitePoint",  # ext; TIFF 6.0 Section 20
     319: "PrimaryChromaticities",  # ext; TIFF 6.0 Section 20
     320: "ColorMap",
+    322: "TileWidth",
+    323: "TileLength",
+    324: "TileOffsets",
+    325: "TileByteCounts",
+    330: "SubIFDs",
     338: "ExtraSamples",
     339: "SampleFormat",  # ext; TIFF 6.0 Section 19
     700: "XMP",
@@ -74,8 +88,18 @@ ifdtag = {
 inv_ifdtag = {v: k for k, v in ifdtag.items()}
 
 
+def _item(value):
+    """Returns a numpy scalar (e.g. from a tag value array) as the equivalent python number"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
 # TIFF stuff
 class Directory:
+    """A single tag (IFD entry). Values read from files are numpy arrays: uint8 for BYTE, ASCII and UNDEFINED
+       values (views of the file data, when it is held in memory), int64 for integers, (count, 2) int64 arrays of
+       numerators and denominators for rationals, and float64 for floats. Values set in code may also be lists."""
+    __slots__ = ('tag', 'type', 'type_valid', 'count', 'value', 'sot_offset', 'value_offset')
+
     def __init__(self, tag, ttype, count, value, valid_type):
         self.tag = tag
         self.type = ttype
@@ -83,15 +107,27 @@ class Directory:
         self.count = count
         self.value = value
         self.sot_offset = 0
+        self.value_offset = None
 
     def set_tag_offset(self, offset):
         self.sot_offset = offset  # start of tag offset
 
+    def set_value_offset(self, offset):
+        self.value_offset = offset  # location of the value (within the IFD entry, or out-of-line)
+
+    def to_list(self):
+        """Returns the value as a list of python numbers (or (numerator, denominator) tuples for rationals)"""
+        if not isinstance(self.value, np.ndarray):
+            return list(self.value)
+        if self.value.ndim == 2:
+            return [tuple(v) for v in self.value.tolist()]
+        return self.value.tolist()
+
     def tostring(self, limit_value=False):
         tagname = "Unknown"
         if self.tag in ifdtag:
             tagname = ifdtag[self.tag]
-        val_to_print = self.value
+        val_to_print = self.to_list()
         if self.type == 2:
             val_to_print = ''.join(chr(i) for i in val_to_print)
 
@@ -107,26 +143,70 @@ class Directory:
 
 
 class IFD:
-    def __init__(self, offset):
+    __slots__ = ('offset', 'byteorder', 'numtags', 'directories', 'nextifd', 'pointerlocation', 'img_data',
+                 'ifd_data', 'sub_ifds')
+
+    def __init__(self, offset, byteorder='little'):
         self.offset = offset
+        self.byteorder = byteorder
         self.numtags = 0
         self.directories = {}
         self.nextifd = 0
         self.pointerlocation = 0
         self.img_data = None
         self.ifd_data = None
+        self.sub_ifds = []
 
     def add_directory(self, directory):
         self.directories[directory.tag] = directory
 
+    def set_tag(self, tag, ttype, value):
+        """Sets the type and value(s) of the specified tag, adding the tag if not already present.
+           Directories are kept in ascending tag order, as required when saving."""
+        if not isinstance(tag, int):
+            tag = inv_ifdtag[tag]
+        self.directories[tag] = Directory(tag, ttype, len(value), value, True)
+        self.directories = dict(sorted(self.directories.items()))
+        self.numtags = len(self.directories)
+
+    def remove_tag(self, tag):
+        """Removes the specified tag from this IFD, if present"""
+        if not isinstance(tag, int):
+            tag = inv_ifdtag[tag]
+        if self.directories.pop(tag, None) is not None:
+            self.numtags = len(self.directories)
+
+    def _get_single_value(self, tag, default):
+        value = self.get_tag_value(inv_ifdtag[tag])
+        return default if value is None else _item(value[0])
+
     def get_image_width(self):
-        return self.directories[256].value[0]
+        return _item(self.directories[256].value[0])
 
     def get_image_height(self):
-        return self.directories[257].value[0]
+        return _item(self.directories[257].value[0])
 
     def get_bits_per_sample(self):
-        return self.directories[258].value
+        """Returns the BitsPerSample values (defaulting to 1 bit per sample)"""
+        bps = self.get_tag_value(258)
+        if bps is None:
+            return [1] * self.get_samples_per_pixel()
+        return bps.tolist() if isinstance(bps, np.ndarray) else bps
+
+    def get_samples_per_pixel(self):
+        return self._get_single_value("SamplesPerPixel", 1)
+
+    def get_compression(self):
+        return self._get_single_value("Compression", compression.NONE)
+
+    def get_predictor(self):
+        return self._get_single_value("Predictor", compression.PREDICTOR_NONE)
+
+    def get_planar_configuration(self):
+        return self._get_single_value("PlanarConfiguration", 1)
+
+    def get_sample_format(self):
+        return self._get_single_value("SampleFormat", 1)
 
     def set_bits_per_sample(self, bps=None):
         if bps is None:
@@ -141,21 +221,194 @@ class IFD:
     #     return self.directories[262].value
 
     def get_rows_per_strip(self):
-        """Returns the number of pixel rows per strip in this IFD's image"""
-        # TODO: Default number of rows per strip
-        return self.directories[inv_ifdtag["RowsPerStrip"]].value[0]
+        """Returns the number of pixel rows per strip in this IFD's image (defaulting to the full image).
+           For tiled images, this is the number of rows in a row of tiles."""
+        if self.is_tiled():
+            return self.get_tile_size()[1]
+        return min(self._get_single_value("RowsPerStrip", 2**32 - 1), self.get_image_height())
+
+    def is_tiled(self):
+        """Returns True if this IFD's image is stored as tiles rather than strips"""
+        return inv_ifdtag["TileOffsets"] in self.directories
+
+    def get_tile_size(self):
+        """Returns the (width, length) of the tiles of this IFD's image"""
+        return _item(self.get_tag_value_by_name("TileWidth")[0]), _item(self.get_tag_value_by_name("TileLength")[0])
+
+    def get_tiles_across(self):
+        """Returns the number of tiles across this IFD's image"""
+        tile_width = self.get_tile_size()[0]
+        return (self.get_image_width() + tile_width - 1) // tile_width
 
     def set_rows_per_strip(self, rows):
         self.directories[inv_ifdtag["RowsPerStrip"]].value = rows
 
     def get_number_strips(self):
-        """Returns the number of Strips for this IFD's image"""
+        """Returns the number of Strips for this IFD's image (per plane, when planar configuration is 2).
+           For tiled images, this is the number of rows of tiles."""
         rps = self.get_rows_per_strip()
         return math.floor((self.get_image_height() + rps - 1) / rps)
 
+    def get_row_bytes(self):
+        """Returns the number of bytes in one (uncompressed) row of a strip"""
+        bps = self.get_bits_per_sample()
+        if self.get_planar_configuration() == 2:
+            return (self.get_image_width() * bps[0] + 7) // 8
+        return (self.get_image_width() * sum(bps) + 7) // 8
+
+    def get_strip_rows(self, index):
+        """Returns the number of pixel rows in the specified strip (the last strip of a plane may be short)"""
+        rps = self.get_rows_per_strip()
+        return min(rps, self.get_image_height() - (index % self.get_number_strips()) * rps)
+
+    def decode_strip(self, index, data):
+        """Decompresses the specified strip's (or tile's) data, reversing any predictor, to give uncompressed bytes"""
+        with phase("decode"):
+            decoded = compression.decode(data, self.get_compression())
+            predictor = self.get_predictor()
+            if predictor != compression.PREDICTOR_NONE:
+                bps = self.get_bits_per_sample()
+                samples = 1 if self.get_planar_configuration() == 2 else self.get_samples_per_pixel()
+                width = self.get_tile_size()[0] if self.is_tiled() else self.get_image_width()
+                decoded = compression.undo_predictor(decoded, predictor, width, samples, bps[0], self.byteorder)
+        add_count("bytes_decoded", len(decoded))
+        return decoded
+
+    def get_fill_order(self):
+        return self._get_single_value("FillOrder", 1)
+
+    def pixels(self, executor=None):
+        """Returns this IFD's image as a (height, width, samples) numpy array, typed according to BitsPerSample,
+           SampleFormat and byte order. For uncompressed byte-aligned samples this is a zero-copy view of img_data;
+           planar (PlanarConfiguration=2) images are returned as a transposed view of the sample planes."""
+        if self.is_tiled():
+            map_func = map if executor is None else executor.map
+            bands = list(map_func(self.strip_pixels, range(self.get_number_strips())))
+            return np.concatenate(bands)
+
+        bits = self._get_uniform_bits_per_sample()
+        height = self.get_image_height()
+        width = self.get_image_width()
+        samples = self.get_samples_per_pixel()
+        data = self.decode_image(executor)
+
+        if self.get_planar_configuration() == 2:
+            dtype = pixels.sample_dtype(bits, self.get_sample_format(), self.byteorder)
+            if dtype is not None:
+                planes = pixels.to_pixels(data, samples * height, width, 1, bits, self.get_sample_format(),
+                                          self.byteorder)
+                return planes.reshape(samples, height, width).transpose(1, 2, 0)
+
+            plane_bytes = self.get_row_bytes() * height
+            return pixels.planes_to_pixels([self._to_pixels(data[p * plane_bytes:(p + 1) * plane_bytes], height, 1)
+                                            for p in range(samples)])
+
+        return self._to_pixels(data, height, samples)
+
+    def strip_pixels(self, index, strips=None):
+        """Returns the pixels of the specified strip (a band of RowsPerStrip rows) as a (rows, width, samples)
+           numpy array. For planar images the corresponding strip of each sample plane is combined, and for tiled
+           images the band is assembled from the corresponding row of tiles.
+
+           Strip (or tile) data is taken from img_data, or from the specified list of each strip's data (e.g. views
+           of a memory mapped file, when the image has not been read)."""
+        rows = self.get_strip_rows(index)
+        if strips is None:
+            strips = self.get_strip_data()
+
+        if self.is_tiled():
+            tile_width = self.get_tile_size()[0]
+            across = self.get_tiles_across()
+            tiles = [self.tile_pixels(t, strips) for t in range(index * across, (index + 1) * across)]
+            return np.concatenate(tiles, axis=1)[:rows, :self.get_image_width()]
+
+        if self.get_planar_configuration() == 2:
+            num_strips = self.get_number_strips()
+            indexes = [index + (p * num_strips) for p in range(self.get_samples_per_pixel())]
+            return pixels.planes_to_pixels([self._to_pixels(self.decode_strip(i, strips[i]), rows, 1)
+                                            for i in indexes])
+
+        return self._to_pixels(self.decode_strip(index, strips[index]), rows, self.get_samples_per_pixel())
+
+    def tile_pixels(self, index, tiles=None):
+        """Returns the pixels of the specified (full size) tile as a (length, width, samples) numpy array. For
+           planar images the corresponding tile of each sample plane is combined."""
+        if tiles is None:
+            tiles = self.get_strip_data()
+        tile_width, tile_length = self.get_tile_size()
+
+        if self.get_planar_configuration() == 2:
+            num_tiles = self.get_number_strips() * self.get_tiles_across()
+            indexes = [index + (p * num_tiles) for p in range(self.get_samples_per_pixel())]
+            return pixels.planes_to_pixels([self._to_pixels(self.decode_strip(i, tiles[i]), tile_length, 1, tile_width)
+                                            for i in indexes])
+
+        return self._to_pixels(self.decode_strip(index, tiles[index]), tile_length, self.get_samples_per_pixel(),
+                               tile_width)
+
+    def _to_pixels(self, data, rows, samples, width=None):
+        if width is None:
+            width = self.get_image_width()
+        return pixels.to_pixels(data, rows, width, samples, self._get_uniform_bits_per_sample(),
+                                self.get_sample_format(), self.byteorder, self.get_fill_order())
+
+    def _get_uniform_bits_per_sample(self):
+        bps = self.get_bits_per_sample()
+        if any(b != bps[0] for b in bps):
+            raise UnsupportedPixelFormatError("Mixed bits per sample: {0}".format(list(bps)))
+        return bps[0]
+
+    def decode_image(self, executor=None):
+        """Returns this IFD's image as uncompressed bytes, decoding strips with the executor if supplied.
+           Tiled images are returned as if stored in a single strip."""
+        if self.is_tiled():
+            image = self.pixels(executor)
+            dtype = pixels.sample_dtype(self._get_uniform_bits_per_sample(), self.get_sample_format(),
+                                        self.byteorder)
+            if dtype is None or image.dtype != dtype:
+                raise UnsupportedPixelFormatError("Tiled images must have byte-aligned samples")
+            if self.get_planar_configuration() == 2:
+                image = image.transpose(2, 0, 1)
+            return np.ascontiguousarray(image).reshape(-1).view('uint8')
+
+        strips = self.get_strip_data()
+        if self.get_compression() == compression.NONE and self.get_predictor() == compression.PREDICTOR_NONE:
+            return self.img_data
+        map_func = map if executor is None else executor.map
+        decoded = list(map_func(self.decode_strip, range(len(strips)), strips))
+        return np.concatenate(decoded) if decoded else np.array([], dtype='uint8')
+
     def get_strips(self):
-        """Returns a list of tuples about each Strip in this IFD's image(strip_offset, strip_byte_count)"""
-        return list(zip(self.directories[273].value, self.directories[279].value))
+        """Returns a list of tuples about each Strip (or Tile) in this IFD's image(strip_offset, strip_byte_count)"""
+        offsets_tag, counts_tag = self.get_offsets_tags()
+        return list(zip(self.directories[offsets_tag].value, self.directories[counts_tag].value))
+
+    def get_offsets_tags(self):
+        """Returns the (offsets, byte counts) tags locating this IFD's image data: strip or tile tags"""
+        if self.is_tiled():
+            return inv_ifdtag["TileOffsets"], inv_ifdtag["TileByteCounts"]
+        return inv_ifdtag["StripOffsets"], inv_ifdtag["StripByteCounts"]
+
+    def set_strips(self, strips, rows_per_strip):
+        """Replaces this IFD's image data with the specified list of (encoded) strips, updating the strip tags and
+           removing any tile tags"""
+        for tag in ("TileWidth", "TileLength", "TileOffsets", "TileByteCounts"):
+            self.remove_tag(tag)
+        self.set_tag("RowsPerStrip", 4, [rows_per_strip])
+        self.set_tag("StripOffsets", 4, [0] * len(strips))          # actual offsets are set when saved
+        self.set_tag("StripByteCounts", 4, [len(s) for s in strips])
+        self.img_data = np.concatenate(strips) if strips else np.array([], dtype='uint8')
+
+    def set_tiles(self, tiles, tile_width, tile_length):
+        """Replaces this IFD's image data with the specified list of (encoded) tiles, updating the tile tags and
+           removing any strip tags"""
+        for tag in ("RowsPerStrip", "StripOffsets", "StripByteCounts"):
+            self.remove_tag(tag)
+        self.set_tag("TileWidth", 4, [tile_width])
+        self.set_tag("TileLength", 4, [tile_length])
+        self.set_tag("TileOffsets", 4, [0] * len(tiles))            # actual offsets are set when saved
+        self.set_tag("TileByteCounts", 4, [len(t) for t in tiles])
+        self.img_data = np.concatenate(tiles) if tiles else np.array([], dtype='uint8')
 
     def set_strip_offsets(self, offsets):
         """Sets the strip offsets for this IFD's image"""
@@ -167,6 +420,15 @@ class IFD:
         """Returns a list of offsets for each Strip in this IFD's image"""
         return self.directories[273].value
 
+    def get_strip_data(self):
+        """Returns a list of numpy views onto img_data, one per Strip, in StripOffsets order"""
+        strips = []
+        start_pos = 0
+        for (offset, num_bytes) in self.get_strips():
+            strips.append(self.img_data[start_pos:start_pos + num_bytes])
+            start_pos += num_bytes
+        return strips
+
     def set_strip_byte_counts(self, counts):
         # TODO: store counts in byte size relating to tag type
         # counts_bytes = [x.to_bytes(4, byteorder='little') for x in counts]
@@ -251,16 +513,88 @@ class IFD:
 #      - Next IFD
 
 class Tiff:
-    def __init__(self, filename: str):
-        """Creates a new Tiff object from the specified Tiff file"""
+    def __init__(self, filename: str = None, threads=None, images=True, in_memory=True, index=None):
+        """Creates a new Tiff object from the specified Tiff file, or an empty (little-endian) Tiff if no file is
+           specified. Strip work is spread over the specified number of threads (or the default set via --threads).
+
+           If images is False, only the header and IFDs are parsed: the file is memory mapped rather than read, and
+           image data is not loaded (each IFD's img_data is None), for fast metadata extraction. Images can then be
+           loaded individually with read_image.
+
+           If in_memory is False, the file is memory mapped rather than read whole, and image data is read from disk
+           with coalesced reads (see io_plan), so that out of order or many small strips need few read requests.
+
+           If index is True (or None, and parse indexes are enabled by default, see --index), the IFDs of a local
+           file are loaded from its sidecar parse index (see parse_index) if it is up to date, rather than parsed,
+           and the index is written after parsing otherwise. index may also be the name of the index file."""
         self.tif_file = None
         self.byteOrder = 'big'
         self.magic = None
         self.ifds = []
+        self.executor = get_executor(threads)
+        self.images = images
+        self.index = get_default_index() if index is None else index
 
         if filename is not None:
-            self.tif_file = TiffFileHandler(filename)
+            self.tif_file = TiffFileHandler(filename, mmap=not (images and in_memory))
             self.load_tiff()
+        else:
+            self.byteOrder = 'little'
+            self.magic = 42
+            self.tif_file = TiffFileHandler(None)
+            self.tif_file.set_byte_order(self.byteOrder)
+
+    def add_image(self, image, photometric=None, subfile_type=0):
+        """Appends a new uncompressed, single strip image to this Tiff from a (height, width, samples) numpy array
+           (a 2D array is treated as a single sample image), returning the new IFD.
+
+           Samples must be 8, 16, 32 or 64 bit integers or 16, 32 or 64 bit floats. If not specified, the
+           PhotometricInterpretation is RGB for 3 or more samples, otherwise BlackIsZero."""
+        if image.ndim == 2:
+            image = image[:, :, np.newaxis]
+        height, width, samples = image.shape
+
+        ifd = self.create_ifd(width, height, samples, image.dtype, photometric, subfile_type)
+        dtype = self.file_dtype(image.dtype)
+        ifd.set_strips([np.ascontiguousarray(image, dtype=dtype).reshape(-1).view('uint8')], height)
+
+        self.ifds.append(ifd)
+        return ifd
+
+    def create_ifd(self, width, height, samples, dtype, photometric=None, subfile_type=0):
+        """Returns a new IFD describing an uncompressed, chunky image of the specified size and numpy dtype, without
+           any image data (see IFD.set_strips and IFD.set_tiles). The IFD is not added to this Tiff."""
+        dtype = self.file_dtype(dtype)
+        sample_format = {'u': 1, 'i': 2, 'f': 3}[dtype.kind]
+        if photometric is None:
+            photometric = 2 if samples >= 3 else 1
+
+        ifd = IFD(0, self.byteOrder)
+        ifd.set_tag("NewSubfileType", 4, [subfile_type])
+        ifd.set_tag("ImageWidth", 4, [width])
+        ifd.set_tag("ImageLength", 4, [height])
+        ifd.set_tag("BitsPerSample", 3, [dtype.itemsize * 8] * samples)
+        ifd.set_tag("Compression", 3, [compression.NONE])
+        ifd.set_tag("PhotometricInterpretation", 3, [photometric])
+        ifd.set_tag("SamplesPerPixel", 3, [samples])
+        ifd.set_tag("PlanarConfiguration", 3, [1])
+        if (photometric == 2 and samples > 3) or (photometric in (0, 1) and samples > 1):
+            ifd.set_tag("ExtraSamples", 3, [2] * (samples - (3 if photometric == 2 else 1)))   # unassociated alpha
+        if sample_format != 1:
+            ifd.set_tag("SampleFormat", 3, [sample_format] * samples)
+        return ifd
+
+    def file_dtype(self, dtype):
+        """Returns the numpy dtype used to store samples of the specified dtype in this Tiff (i.e. in its byte order),
+           raising an UnsupportedPixelFormatError if the samples cannot be stored."""
+        dtype = np.dtype(dtype)
+        sample_format = {'u': 1, 'i': 2, 'f': 3}.get(dtype.kind)
+        file_dtype = None
+        if sample_format is not None:
+            file_dtype = pixels.sample_dtype(dtype.itemsize * 8, sample_format, self.byteOrder)
+        if file_dtype is None:
+            raise UnsupportedPixelFormatError("Cannot create image from {0} data".format(dtype))
+        return file_dtype
 
     def raw_data(self):
         """Returns the numpy array for the entire file"""
@@ -268,48 +602,196 @@ class Tiff:
 
     def load_tiff(self):
         """Loads this TIFF into an internal data structure, ready for maniupulation"""
+        filename = self.tif_file._filename
+        index_file = self.index if isinstance(self.index, str) else None
+        use_index = bool(self.index) and isinstance(filename, str) and not is_source_name(filename)
+        if use_index and self.load_index(filename, index_file):
+            return
 
+        with phase("header"):
+            nextifd_offset = self.read_header()
+
+        # read in each IFD and image data
+        seen = set()
+        while nextifd_offset != 0:
+            if nextifd_offset in seen:
+                raise InvalidTiffError(self.tif_file._filename, "IFD loop at offset {0}".format(nextifd_offset))
+            seen.add(nextifd_offset)
+            with phase("ifd_parse"):
+                ifd = self.read_ifd(nextifd_offset)
+            self.ifds.append(ifd)
+            if self.images:
+                self.read_image(ifd)
+            self.read_sub_ifds(ifd)
+            nextifd_offset = ifd.nextifd
+
+        if use_index:
+            write_index(filename, self.byteOrder, self.ifds, index_file)
+
+    def load_index(self, filename, index_file=None):
+        """Loads the IFDs (and, if images are loaded, image data) from the file's parse index, returning False if it
+           has no up to date index"""
+        indexed = read_index(filename, index_file)
+        if indexed is None:
+            return False
+        self.byteOrder, self.ifds = indexed
+        self.magic = 42
+        self.tif_file.set_byte_order(self.byteOrder)
+        if self.images:
+            for ifd in self.ifds:
+                for image_ifd in [ifd] + ifd.sub_ifds:
+                    self.read_image(image_ifd)
+        return True
+
+    def read_header(self):
+        """Reads the byte order and magic number from the file header, returning the offset of the first IFD"""
         try:
             # Byte order
-            h = bytes(self.tif_file.read(2))
+            h = bytes(self.tif_file.read(2, location=0))
             self.byteOrder = {b'II': 'little', b'MM': 'big'}[h]
             assert (self.byteOrder == 'little' or self.byteOrder == 'big')
             self.tif_file.set_byte_order(self.byteOrder)
 
             # Magic number
-            self.magic = self.tif_file.read_int(2)
+            self.magic = self.tif_file.read_int(2, location=2)
             assert (self.magic == 42)
         except (KeyError, AssertionError):
             raise InvalidTiffError(self.tif_file._filename, "Incorrect header")
 
         # IFD offset
-        nextifd_offset = self.tif_file.read_int(4)  # returns offset to first IFD
+        return self.tif_file.read_int(4, location=4)  # returns offset to first IFD
+
+    def read_sub_ifds(self, ifd):
+        """Reads the IFDs (and image data) pointed to by the specified IFD's SubIFDs tag, if present"""
+        offsets = ifd.get_tag_value(inv_ifdtag["SubIFDs"])
+        for offset in ([] if offsets is None else offsets):
+            with phase("ifd_parse"):
+                sub_ifd = self.read_ifd(offset)
+            if self.images:
+                self.read_image(sub_ifd)
+            ifd.sub_ifds.append(sub_ifd)
+
+    def save_tiff(self, to_file=None, compression=None, level=None, predictor=None, strip_size=None):
+        """Saves the TIFF represented by the internal data structure into the specified file.
+
+           If any of compression (e.g. 'lzw', 'deflate', 'packbits', 'none' or a Compression tag value), level
+           (Deflate compression level), predictor (1, 2 or 3) or strip_size (target uncompressed bytes per strip) are
+           specified, each image is re-stripped and re-compressed accordingly before saving."""
+        if not (compression is None and level is None and predictor is None and strip_size is None):
+            for ifd in self.ifds:
+                for image_ifd in [ifd] + ifd.sub_ifds:
+                    self.encode_image(image_ifd, compression, level, predictor, strip_size)
+
+        self.save_header()
+
+        previous = None
+        for ifd in self.ifds:
+            # IFDs must begin on a word boundary
+            if self.tif_file.tell() % 2 == 1:
+                self.tif_file.insert_bytes([0])
 
-        # read in each IFD and image data
-        while nextifd_offset != 0:
-            ifd = self.read_ifd(nextifd_offset)
-            self.ifds.append(ifd)
-            self.read_image(ifd)
-            nextifd_offset = ifd.nextifd
+            # link the previous IFD to this one, as offsets may have changed since the TIFF was read
+            if previous is not None:
+                self.tif_file.insert_int(self.tif_file.tell(), size=4, location=previous.pointerlocation,
+                                         overwrite=True)
+
+            # self.calculateIFDSpace(ifd)     # Readjusts counts because of changes to image data
+            self._save_ifd_and_image(ifd)
+            previous = ifd
+
+        with phase("write"):
+            self.tif_file.write(to_file)        # lastly, write to file
 
-    def save_tiff(self, to_file=None):
-        """Saves the TIFF represented by the internal data structure into the specified file"""
+    def save_header(self):
+        """Empties the file array and writes the header, with the first IFD at offset 8"""
         self.tif_file.clear()   # Empty the array first
 
         # Header
         byteo = 'II'
         if self.byteOrder != 'little':
             byteo = 'MM'
+        self.tif_file.set_byte_order(self.byteOrder)
         self.tif_file.insert_bytes(list(byteo.encode()))    # byte order
         self.tif_file.insert_int(42, 2)                     # Magic number
         self.tif_file.insert_int(8, 4)                      # first IFD always at 0x08
 
-        for ifd in self.ifds:
-            # self.calculateIFDSpace(ifd)     # Readjusts counts because of changes to image data
-            endpos = self.save_ifd(ifd)
-            self.save_image(ifd, endpos)
+    def _save_ifd_and_image(self, ifd):
+        """Saves the specified IFD and its image data, followed by any SubIFDs (e.g. reduced resolution images),
+           whose offsets are then written into the IFD's SubIFDs tag"""
+        if ifd.sub_ifds:
+            ifd.set_tag("SubIFDs", 4, [0] * len(ifd.sub_ifds))     # actual offsets are set below
+        else:
+            ifd.remove_tag("SubIFDs")
+
+        endpos = self.save_ifd(ifd)
+        self.save_image(ifd, endpos)
+
+        sub_ifd_offsets = []
+        for sub_ifd in ifd.sub_ifds:
+            if self.tif_file.tell() % 2 == 1:
+                self.tif_file.insert_bytes([0])
+            sub_ifd_offsets.append(self.tif_file.tell())
+            self._save_ifd_and_image(sub_ifd)
+        if sub_ifd_offsets:
+            self._patch_tag_value(ifd, inv_ifdtag["SubIFDs"], sub_ifd_offsets)
+
+    def encode_image(self, ifd, compression_type=None, level=None, predictor=None, strip_size=None):
+        """Re-strips and compresses the specified IFD's image data, updating its strip related tags.
+           Options left as None keep the IFD's current setting. Strips are encoded in parallel: in threads, or for
+           large LZW images (as the LZW encoder holds the GIL), in worker processes."""
+        raw = ifd.decode_image(self.executor)
+
+        if compression_type is None:
+            compression_type = ifd.get_compression()
+        compression_type = compression.get_compression_code(compression_type)
+        if predictor is None:
+            predictor = ifd.get_predictor()
+        if compression_type == compression.NONE:
+            predictor = compression.PREDICTOR_NONE     # predictors only make sense for compressed data
+
+        width = ifd.get_image_width()
+        height = ifd.get_image_height()
+        row_bytes = ifd.get_row_bytes()
+        rows_per_strip = ifd.get_rows_per_strip()
+        if strip_size is not None:
+            rows_per_strip = max(1, min(height, strip_size // max(1, row_bytes)))
+
+        # planar configuration 2 stores each sample plane in its own set of strips
+        planes = 1
+        samples = ifd.get_samples_per_pixel()
+        if ifd.get_planar_configuration() == 2:
+            planes = samples
+            samples = 1
+        plane_bytes = row_bytes * height
+        strips = []
+        for plane in range(planes):
+            for row in range(0, height, rows_per_strip):
+                start = (plane * plane_bytes) + (row * row_bytes)
+                strips.append(raw[start:start + (min(rows_per_strip, height - row) * row_bytes)])
+
+        bits = ifd.get_bits_per_sample()[0]
+        compression.check_predictor(predictor, bits, ifd.get_sample_format())
+
+        encode_strip = functools.partial(compression.encode_strip, compression=compression_type, level=level,
+                                         row_bytes=row_bytes, predictor=predictor, width=width, samples=samples,
+                                         bits=bits, byteorder=ifd.byteorder)
+        if compression_type == compression.LZW and len(raw) >= compression.LZW_PROCESS_MIN_BYTES:
+            # the LZW encoder holds the GIL, so large images are encoded in worker processes
+            with phase("encode"):
+                encoded = self.executor.map_processes(encode_strip, strips)
+        else:
+            def encode_timed(data):
+                with phase("encode"):
+                    return encode_strip(data)
+
+            encoded = self.executor.map(encode_timed, strips)
 
-        self.tif_file.write(to_file)            # lastly, write to file
+        ifd.set_tag("Compression", 3, [compression_type])
+        if predictor == compression.PREDICTOR_NONE:
+            ifd.remove_tag("Predictor")
+        else:
+            ifd.set_tag("Predictor", 3, [predictor])
+        ifd.set_strips(encoded, rows_per_strip)
 
     # # Do this if change stuff having read the TIFF, e.g. migrated the image data. Otherwise
     # # assume all is the same size - even if the offsets have changed.
@@ -320,13 +802,13 @@ class Tiff:
 
     def read_ifd(self, ifd_offset):
         # go through IFD
-        ifd = IFD(ifd_offset)
+        ifd = IFD(ifd_offset, self.byteOrder)
 
         self.tif_file.seek(ifd.offset)
         ifd.numtags = self.tif_file.read_int(2)
 
         # save the raw data in the IFD
-        ifd.ifd_data = self.tif_file.read(size=(2+(ifd.numtags*12)+4), location=ifd_offset)
+        ifd.ifd_data = self.tif_file.read_bytes(count=(2+(ifd.numtags*12)+4), location=ifd_offset)
 
         for i in range(ifd.numtags):
             # read IFD bytes
@@ -360,8 +842,10 @@ class Tiff:
                 value = self.tif_file.read_ints(4)
                 type_valid = False
 
-            # add directory
-            ifd.add_directory(Directory(tag, tag_type, count, value, type_valid))
+            # add directory, recording where its value was read from
+            directory = Directory(tag, tag_type, count, value, type_valid)
+            directory.set_value_offset(value_loc)
+            ifd.add_directory(directory)
 
         # finally get the next IFD offset
         ifd.nextifd = self.tif_file.read_int(4)
@@ -400,6 +884,7 @@ class Tiff:
                 value_loc = end_of_ifd
                 overwrite_value = False
 
+            directory.set_value_offset(value_loc)
             num_written = write_func(directory.value, location=value_loc, overwrite=overwrite_value)
 
             if directory.count * ifdtype[directory.type][0] > 4:
@@ -407,16 +892,31 @@ class Tiff:
             else:
                 self.tif_file.offset(4)             # _offset is not updated if location set in write_func
 
-        self.tif_file.insert_int(ifd.nextifd, size=4, overwrite=True)  # pointer to next IFD, or 0x00000000
+        ifd.pointerlocation = self.tif_file.tell()
+        self.tif_file.insert_int(0, size=4, overwrite=True)  # pointer to next IFD, set when next IFD is saved
 
         return end_of_ifd
 
     def read_image(self, ifd):
         """Reads the full image data for the specified IFD into a numpy array"""
-        ifd.img_data = np.array([], dtype='uint8')
         strips = ifd.get_strips()  # [(strip_offset, strip_byte_count)]
-        for strip in strips:
-            ifd.img_data = np.append(ifd.img_data, self.tif_file.read(size=strip[1], location=strip[0]))
+        file_size = len(self.tif_file.raw_data())
+
+        # strips running past the end of the file are truncated, as when slicing
+        sizes = [max(0, min(count, file_size - offset)) for (offset, count) in strips]
+        starts = np.cumsum([0] + sizes[:-1], dtype='int64')
+        ifd.img_data = np.empty((sum(sizes),), dtype='uint8')
+
+        extents = [(offset, size) for (offset, _), size in zip(strips, sizes)]
+        with phase("strip_read"):
+            self.tif_file.read_extents(extents, ifd.img_data, starts, self.executor)
+        add_count("strip_bytes_read", len(ifd.img_data))
+
+    def strip_views(self, ifd):
+        """Returns a view of each of the specified IFD's strips (or tiles) in the file, without reading them: for
+           working strip by strip on images which have not been read (see IFD.strip_pixels)"""
+        raw = self.tif_file.raw_data()
+        return [raw[offset:offset + count] for (offset, count) in ifd.get_strips()]
 
     def save_image(self, ifd, endpos):
         """Inserts the specified IFD's image data into the tiff numpy array at the specified end position."""
@@ -426,47 +926,80 @@ class Tiff:
         #  3. StripOffsets or StripByteCounts count value is correct for the number of strips per image (at least for
         #     chunky planar configuration (RGBRGBRGB...))
 
-        num_strips = ifd.get_number_strips()
-
-        strip_byte_counts = [y for (x, y) in ifd.get_strips()]
-        strip_offsets = []
+        strip_data = ifd.get_strip_data()
 
         self.tif_file.seek(endpos)  # jump to the end for writing image data
 
-        start_pos = 0
-        for num_bytes in strip_byte_counts:
-            strip_offsets.append(self.tif_file.tell())                              # record position of strip start
-            self.tif_file.insert_bytes(ifd.img_data[start_pos:start_pos + num_bytes])
-            start_pos += num_bytes
-
-        # now set strip offsets in IFD
-        strip_offset_tag = inv_ifdtag["StripOffsets"]
-        strip_offset_value_location = ifd.get_tag_offset(strip_offset_tag) + 8
+        strip_offsets = []
+        position = endpos
+        for data in strip_data:
+            strip_offsets.append(position)                              # record position of strip start
+            position += len(data)
 
-        if ifdtype[ifd.get_tag_type(strip_offset_tag)][0] * num_strips > 4:
-            # value to write is larger than 4 bytes, so get the offset for the value array
-            strip_offset_value_location = ifd.get_tag_value(strip_offset_tag)
+        # insert all strips in one go, rather than growing the array strip by strip
+        if len(strip_data) > 0:
+            self.tif_file.insert_bytes(np.concatenate(strip_data))
 
-        # now write the offsets
-        tag_type_size = ifd.get_tag_type_size("StripOffsets")
+        # now set strip (or tile) offsets in IFD, at the value location recorded when the IFD was saved
+        self._patch_tag_value(ifd, ifd.get_offsets_tags()[0], strip_offsets)
 
-        self.tif_file.insert_ints(strip_offsets, tag_type_size, location=strip_offset_value_location, overwrite=True)
+    def _patch_tag_value(self, ifd, tag, values):
+        """Overwrites the value(s) of the specified (already saved) tag with the specified integers"""
+        value_location = ifd.directories[tag].value_offset
+        tag_type_size = ifd.get_tag_type_size(tag)
+        self.tif_file.insert_ints(values, tag_type_size, location=value_location, overwrite=True)
 
 
 class TiffFileHandler(object):
     """Handler which imports a TIFF file into a numpy array for reading and/or writing.
        Writing creates a copy of the file."""
-    def __init__(self, filename: str) -> object:
+    def __init__(self, filename: str, mmap=False) -> object:
+        """Reads the specified file into memory, or memory maps it (read only) if mmap is True, so that only the
+           parts of the file actually read are loaded.
+
+           The file may also be a URL, an archive member (archive::member) or a ByteSource (see sources), in which
+           case only the parts of the file actually read are fetched from it."""
         self._byteorder = 'little'
         self._filename = filename
         self._offset = 0
+        self._tiff = np.array([], dtype="uint8")
 
-        with open(filename, 'rb') as in_file:
-            self._tiff = np.fromfile(in_file, dtype="uint8")
+        if isinstance(filename, ByteSource) or is_source_name(filename):
+            source = filename if isinstance(filename, ByteSource) else open_source(filename)
+            self._filename = source.name
+            self._tiff = SourceArray(source)
+        elif filename is not None:
+            if mmap and os.path.getsize(filename) > 0:
+                self._tiff = np.memmap(filename, dtype="uint8", mode='r')
+            else:
+                with phase("file_read"), open(filename, 'rb') as in_file:
+                    self._tiff = np.fromfile(in_file, dtype="uint8")
+                add_count("bytes_read", len(self._tiff))
 
     def raw_data(self):
         return self._tiff
 
+    def is_mapped(self):
+        """Returns True if the file is memory mapped (or read from a ByteSource) rather than held in memory"""
+        return isinstance(self._tiff, (np.memmap, SourceArray))
+
+    def read_extents(self, extents, out, starts, executor=None):
+        """Copies each (offset, size) extent of the file into the out array at the corresponding start position.
+           Memory mapped files (and ByteSources) are read with coalesced reads (see io_plan)."""
+        if not self.is_mapped():
+            def copy_extent(extent, start):
+                out[start:start + extent[1]] = self._tiff[extent[0]:extent[0] + extent[1]]
+
+            list((map if executor is None else executor.map)(copy_extent, extents, starts))
+            return
+        if isinstance(self._tiff, SourceArray):
+            # the source counts the bytes it reads
+            add_count("read_requests", len(self._tiff.read_extents(extents, out, starts, executor)))
+            return
+        reads = io_plan.read_extents(self._filename, extents, out, starts, executor)
+        add_count("read_requests", len(reads))
+        add_count("bytes_read", sum(read.size for read in reads))
+
     def set_byte_order(self, byteorder='little'):
         """Sets the byte order to be used for subsequent reads"""
         self._byteorder = byteorder
@@ -490,16 +1023,21 @@ class TiffFileHandler(object):
             return b
 
     def read_bytes(self, count=1, location=None):
-        """Reads 'count' bytes from the specified location, or the current offset if no location is supplied."""
-        return_vals = []
-        if self._tiff is not None:
-            off = self._offset
-            if location is not None:
-                off = location
-            return_vals = list(self._tiff[off:off+count])
-            if location is None:
-                self._offset += count
-            return return_vals
+        """Reads 'count' bytes from the specified location, or the current offset if no location is supplied, as a
+           uint8 array: a view of the file data if held in memory, or a copy if memory mapped (so that values don't
+           keep the file mapped)."""
+        values = self.read(size=count, location=location)
+        return np.array(values) if self.is_mapped() else values
+
+    def _read_array(self, dtype, count, location):
+        """Reads 'count' values of the specified numpy dtype (in this file's byte order) from the specified location,
+           or the current offset if no location is supplied, as a copied array of native values. Values running
+           past the end of the file are not read."""
+        dtype = np.dtype(dtype).newbyteorder('<' if self._byteorder == 'little' else '>')
+        data = self.read(size=count * dtype.itemsize, location=location)
+        data = data[:len(data) - (len(data) % dtype.itemsize)]
+        native = 'float64' if dtype.kind == 'f' else 'int64'
+        return np.frombuffer(data.tobytes(), dtype=dtype).astype(native)
 
     def insert_bytes(self, bytes_to_write, location=None, overwrite=False):
         """Inserts or overwrites the values at the specified location, or the current offset if no location
@@ -523,69 +1061,42 @@ class TiffFileHandler(object):
             and interprets these bytes as a IEEE 754 float.
 
             If location is specified, this read will not update the current offset"""
-        return_vals = []
-        byteorder = {'little':'<f', 'big':'>f'}[self._byteorder]
-        if self._tiff is not None:
-            off = self._offset
-            if location is not None:
-                off = location
-            for c in range(count):
-                return_vals.append(unpack_from(byteorder, self._tiff[off:off+4])[0])
-                off += 4# size
-            if location is None:
-                self._offset += (count * 4) #size)
-            return return_vals
+        return self._read_array('f4', count, location)
 
     def read_doubles(self, count=1, location=None):
         """Reads the next 'count' lots of 8 bytes at the specified location, or the current offset if no location is supplied,
             and interprets these bytes as a IEEE 754 double.
 
             If location is specified, this read will not update the current offset"""
-        return_vals = []
-        byteorder = {'little': '<d', 'big': '>d'}[self._byteorder]
-        if self._tiff is not None:
-            off = self._offset
-            if location is not None:
-                off = location
-            for c in range(count):
-                return_vals.append(unpack_from(byteorder, self._tiff[off:off + 8])[0])
-                off += 8  # size
-            if location is None:
-                self._offset += (count * 8)  # size)
-            return return_vals
+        return self._read_array('f8', count, location)
 
     def insert_floats(self, numbers, location=None, overwrite=False):
         """Inserts the specified IEEE 754 floats into the tiff array at the specified location.
            If overwrite is True, the bytes overwrite those at the write location; if False, the bytes are
            inserted at the write location"""
-        pass
-        # def flatten(l): return [x for sublist in l for x in sublist]
-        # def tobytes(x): return list(x.to_bytes(size, byteorder=self._byteorder))
-        #
-        # bytes_to_write = flatten([tobytes(x) for x in numbers])
-        # return self.insert_bytes(bytes_to_write, location, overwrite)
+        return self.insert_bytes(self._to_bytes(numbers, 'f4'), location, overwrite)
+
+    def insert_doubles(self, numbers, location=None, overwrite=False):
+        """Inserts the specified IEEE 754 doubles into the tiff array at the specified location"""
+        return self.insert_bytes(self._to_bytes(numbers, 'f8'), location, overwrite)
+
+    def _to_bytes(self, numbers, dtype):
+        """Returns the numbers encoded as the specified numpy dtype, in this file's byte order, as a uint8 array.
+           Negative integers are encoded as two's complement, for signed tag types."""
+        dtype = np.dtype(dtype).newbyteorder('<' if self._byteorder == 'little' else '>')
+        return np.asarray(numbers).astype(dtype).reshape(-1).view('uint8')
 
     def read_int(self, size=4, location=None):
         """Reads a single int of 'size' bytes at the specified location, or the current offset if no location is
            supplied."""
-        return self.read_ints(size=size, location=location)[0]
+        return int.from_bytes(self.read(size=size, location=location), byteorder=self._byteorder)
 
     def read_ints(self, size=4, count=1, location=None):
         """Reads the next 'count' 'size' bytes at the specified location, or the current offset if no location is supplied,
            and interprets these bytes as an integer.
 
            If location is specified, this read will not update the current offset"""
-        return_vals = []
-        if self._tiff is not None:
-            off = self._offset
-            if location is not None:
-                off = location
-            for c in range(count):
-                return_vals.append(int.from_bytes(self._tiff[off:off+size], byteorder=self._byteorder))
-                off += size
-            if location is None:
-                self._offset += (count * size)
-            return return_vals
+        return self._read_array('u{0}'.format(size), count, location)
 
     def insert_int(self, value, size=4, location=None, overwrite=False):
         """Inserts the specified value encoded in size bytes into the tiff array at the specified location.
@@ -597,48 +1108,18 @@ class TiffFileHandler(object):
         """Inserts the specified number encoded in size bytes into the tiff array at the specified location.
            If overwrite is True, the bytes overwrite those at the write location; if False, the bytes are
            inserted at the write location"""
-        def flatten(l): return [x for sublist in l for x in sublist]
-        def tobytes(x): return list(x.to_bytes(size, byteorder=self._byteorder))
-
-        bytes_to_write = flatten([tobytes(x) for x in numbers])
-        return self.insert_bytes(bytes_to_write, location, overwrite)
+        return self.insert_bytes(self._to_bytes(numbers, 'u{0}'.format(size)), location, overwrite)
 
     def read_rationals(self, count=1, location=None):
-        """Reads in a TIFF Rational data type (2 4-byte integers)"""
-        return_vals = []
-        if self._tiff is not None:
-            off = self._offset
-            if location is not None:
-                off = location
-            for c in range(count):
-                num = int.from_bytes(self._tiff[off:off + 4], byteorder=self._byteorder)
-                denom = int.from_bytes(self._tiff[off+4:off + 8], byteorder=self._byteorder)
-                return_vals.append((num, denom))
-                off += 8
-            if location is None:
-                self._offset += (count * 8)
-            return return_vals
+        """Reads in a TIFF Rational data type (2 4-byte integers), as a (count, 2) array of numerators and
+           denominators"""
+        values = self._read_array('u4', count * 2, location)
+        return values[:len(values) - (len(values) % 2)].reshape(-1, 2)
 
     def insert_rationals(self, values, location=None, overwrite=False):
         """Inserts or overwrites the specified rational values at the specified location, or the current offset
            if no location is specified."""
-        def flatten(l): return [x for sublist in l for x in sublist]
-        def tobytes(x): return list(x.to_bytes(4, byteorder=self._byteorder))
-
-        bytes_to_write = flatten([tobytes(n) + tobytes(d) for (n, d) in values])
-        num_bytes = len(bytes_to_write)
-
-        off = self._offset
-        if location is not None:
-            off = location
-        if overwrite:
-            self._tiff[off:off + num_bytes] = bytes_to_write
-        else:
-            self._tiff = np.insert(self._tiff, off, bytes_to_write)
-        if location is None:
-            self._offset += num_bytes
-
-        return num_bytes
+        return self.insert_bytes(self._to_bytes(values, 'u4'), location, overwrite)
 
     def read_shorts(self, count=1, location=None):
         """Reads in a TIFF Short data type (2-byte integer)"""
@@ -657,6 +1138,7 @@ class TiffFileHandler(object):
 
         with open(tofile, 'wb') as out_file:
             self._tiff.tofile(out_file)         # numpy.tofile()
+        add_count("bytes_written", len(self._tiff))
 
     def seek(self, offset, location=0):
         """Sets the current offset relative to the specified location"""
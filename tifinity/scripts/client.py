@@ -0,0 +1,32 @@
+"""
+Thin client for a tifinity server (see the serve module), running commands in the server's warm worker pool rather
+than starting a new interpreter and importing the parser for each command.
+"""
+import json
+import os
+import socket
+import sys
+
+
+def send_jobs(socket_path, jobs):
+    """Sends the specified jobs (dictionaries, see tifinity.actions.server) to the server listening on the
+       specified Unix socket, yielding each result as it is received (in order of completion)"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        with sock.makefile('rw', encoding='utf-8', newline='\n') as stream:
+            for job in jobs:
+                stream.write(json.dumps(job) + "\n")
+            stream.flush()
+            sock.shutdown(socket.SHUT_WR)       # no more jobs
+            for line in stream:
+                yield json.loads(line)
+
+
+def run_remote(socket_path, argv):
+    """Runs a tifinity command line (without the program name) in the server listening on the specified Unix
+       socket, printing its output as if run locally, and returns its exit status"""
+    for result in send_jobs(socket_path, [{"id": 0, "argv": argv, "cwd": os.getcwd()}]):
+        sys.stdout.write(result.get("output", ""))
+        sys.stderr.write(result.get("errors", ""))
+        return result.get("status", 1)
+    return 1
@@ -0,0 +1,97 @@
+"""
+Executor for running independent per-strip tasks (reading, encoding, hashing, converting) concurrently.
+
+Strips are independent units within a TIFF image. zlib, hashlib and numpy all release the GIL when working on
+large buffers, so a pool of threads is enough to spread strip work across cores. Pure Python work (LZW encoding)
+holds the GIL, so is spread over a pool of worker processes instead (see StripExecutor.map_processes).
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Number of threads used when none is explicitly requested (set from the --threads CLI option)
+_default_threads = 1
+
+# Shared executors, keyed by thread count, so pools are reused between Tiffs
+_executors = {}
+
+
+def set_default_threads(threads):
+    """Sets the number of threads used by executors created without an explicit thread count.
+       A value of 0 (or less) means use all available cores."""
+    global _default_threads
+    _default_threads = _normalise_threads(threads)
+
+
+def get_default_threads():
+    """Returns the number of threads used by default"""
+    return _default_threads
+
+
+def get_executor(threads=None):
+    """Returns a shared StripExecutor using the specified number of threads, or the default number if None"""
+    threads = _default_threads if threads is None else _normalise_threads(threads)
+    executor = _executors.get(threads)
+    if executor is None:
+        executor = _executors.setdefault(threads, StripExecutor(threads))
+    return executor
+
+
+def _normalise_threads(threads):
+    if threads is None or threads < 1:
+        return os.cpu_count() or 1
+    return threads
+
+
+class StripExecutor(object):
+    """Runs a task over a sequence of independent items (typically strips), returning results in order."""
+
+    def __init__(self, threads=1):
+        self.threads = _normalise_threads(threads)
+        self._pool = None
+        self._processes = None
+        self._lock = threading.Lock()
+
+    def map(self, func, *iterables):
+        """Applies func to each item of the iterables, returning a list of the results in the original order.
+           Runs in the calling thread when only one thread is configured."""
+        if self.threads == 1:
+            return list(map(func, *iterables))
+
+        items = [list(i) for i in iterables]
+        if len(items[0]) <= 1:
+            return list(map(func, *items))
+
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="tifinity-strip")
+        return list(self._pool.map(func, *items))
+
+    def map_processes(self, func, *iterables):
+        """As map, but in a pool of (as many) worker processes, for pure Python tasks which hold the GIL and so gain
+           nothing from threads. func and the items must be picklable (e.g. a partial of a module level function).
+           The pool is started on first use, and reused."""
+        if self.threads == 1:
+            return list(map(func, *iterables))
+
+        items = [list(i) for i in iterables]
+        if len(items[0]) <= 1:
+            return list(map(func, *items))
+
+        with self._lock:
+            if self._processes is None:
+                # spawned (as on Windows), as forking a process with running threads is unsafe
+                self._processes = ProcessPoolExecutor(max_workers=self.threads,
+                                                      mp_context=multiprocessing.get_context("spawn"))
+        return list(self._processes.map(func, *items))
+
+    def shutdown(self):
+        """Stops any worker threads (and processes) held by this executor"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+            if self._processes is not None:
+                self._processes.shutdown()
+                self._processes = None
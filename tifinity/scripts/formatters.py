@@ -0,0 +1,117 @@
+"""
+Structured module results and streaming output formatters.
+
+A module's run(args) returns a Result: an iterable of records (dictionaries), which may be a generator so that
+records are formatted and written as they are produced, rather than building the whole output in memory. Formatters
+write a Result directly to a file object, one record at a time, as text, JSON lines, CSV or (for compatibility with
+the --json options) a single JSON document.
+"""
+import csv
+import json
+
+
+class Result(object):
+    """The result of running a module.
+
+       records:     an iterable of dictionaries (possibly a generator, consumed once by a formatter)
+       fields:      the record keys written to JSON lines and CSV output, in column order (default: all keys)
+       text_lines:  function taking the records and yielding the lines of the module's text output
+       document:    function taking the list of records and returning a JSON document (for --json output)"""
+
+    def __init__(self, records, fields=None, text_lines=None, document=None):
+        self.records = records
+        self.fields = fields
+        self._text_lines = text_lines
+        self._document = document
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def text_lines(self):
+        """Yields the lines of this result's text output"""
+        if self._text_lines is not None:
+            return self._text_lines(iter(self.records))
+        return ("\t".join(str(value) for value in self.row(record)) for record in self.records)
+
+    def document(self):
+        """Returns this result as a single JSON document (by default, a list of the records)"""
+        records = list(self.records)
+        if self._document is not None:
+            return self._document(records)
+        return [self.select(record) for record in records]
+
+    def select(self, record):
+        """Returns the record restricted to this result's fields"""
+        if self.fields is None:
+            return record
+        return {field: record.get(field) for field in self.fields}
+
+    def row(self, record):
+        """Returns the record's values, in field order"""
+        return list(self.select(record).values())
+
+
+def json_default(value):
+    """Converts values json cannot serialise: numpy arrays and scalars, bytes, and anything else as a string"""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    return str(value)
+
+
+def write_text(result, out):
+    """Writes the result's text output to the file object"""
+    for line in result.text_lines():
+        out.write(line)
+        out.write("\n")
+
+
+def write_jsonl(result, out):
+    """Writes each of the result's records as a JSON object on its own line"""
+    for record in result.records:
+        out.write(json.dumps(result.select(record), default=json_default))
+        out.write("\n")
+
+
+def write_csv(result, out):
+    """Writes the result's records as CSV, with a header row of the field names. Lists and dictionaries are written
+       as JSON. Returns the number of records written."""
+    writer = None
+    count = 0
+    for record in result.records:
+        record = result.select(record)
+        if writer is None:
+            writer = csv.DictWriter(out, fieldnames=list(record.keys()), extrasaction='ignore')
+            writer.writeheader()
+        writer.writerow({k: _csv_value(v) for k, v in record.items()})
+        count += 1
+    if writer is None and result.fields is not None:
+        csv.writer(out).writerow(result.fields)
+    return count
+
+
+def _csv_value(value):
+    if hasattr(value, 'tolist'):
+        value = value.tolist()
+    if isinstance(value, (list, tuple, dict)):
+        return json.dumps(value, default=json_default)
+    return value
+
+
+def write_json(result, out):
+    """Writes the result as a single JSON document"""
+    out.write(json.dumps(result.document(), default=json_default))
+
+
+formatters = {
+    "text": write_text,
+    "jsonl": write_jsonl,
+    "csv": write_csv,
+    "json": write_json
+}
+
+
+def write_result(result, out, output_format="text"):
+    """Writes the result to the file object in the specified format (text, jsonl, csv or json)"""
+    formatters[output_format](result, out)
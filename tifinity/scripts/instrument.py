@@ -0,0 +1,136 @@
+"""
+Instrumentation of where time (and memory) is spent: per-phase timers, byte counters and peak memory.
+
+Code marks phases of work (e.g. ``with phase("hash"):``) and counts bytes (``add_count("bytes_hashed", n)``).
+Instrumentation is off by default, when phase and add_count do almost nothing. When enabled (e.g. by the --profile
+option), phase times are measured with perf_counter_ns and accumulated by phase name, along with the number of calls,
+and counters are summed. Phases may nest (times are inclusive) and run concurrently in strip executor threads, so
+phase totals can exceed the wall clock time.
+"""
+import contextlib
+import cProfile
+import json
+import threading
+import time
+import tracemalloc
+
+_NULL_PHASE = contextlib.nullcontext()
+
+
+class _Phase(object):
+    """Context manager timing one call of a phase"""
+    __slots__ = ('_instruments', '_name', '_start')
+
+    def __init__(self, instruments, name):
+        self._instruments = instruments
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self._instruments.add_time(self._name, time.perf_counter_ns() - self._start)
+        return False
+
+
+class Instruments(object):
+    """Accumulates phase timings and counters, optionally tracing peak memory with tracemalloc"""
+
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.phases = {}        # name: [calls, total ns]
+        self.counters = {}
+        self._start = None
+        self._wall = 0
+        self._peak = None
+
+    def start(self, memory=False):
+        """Resets and enables instrumentation, tracing memory allocations if memory is True"""
+        self.reset()
+        self.enabled = True
+        self.memory = memory
+        if memory:
+            tracemalloc.start()
+        self._start = time.perf_counter_ns()
+
+    def stop(self):
+        """Disables instrumentation, recording the wall clock time (and peak memory) since it was started"""
+        if not self.enabled:
+            return
+        self._wall = time.perf_counter_ns() - self._start
+        if self.memory:
+            self._peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.enabled = False
+
+    def phase(self, name):
+        """Returns a context manager timing the enclosed code as a call of the named phase"""
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def add_time(self, name, ns):
+        with self._lock:
+            phase = self.phases.get(name)
+            if phase is None:
+                phase = self.phases[name] = [0, 0]
+            phase[0] += 1
+            phase[1] += ns
+
+    def count(self, name, n):
+        """Adds n to the named counter (e.g. bytes read)"""
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self):
+        """Returns the phase timings (ms), counters and peak memory (if traced) as a dictionary"""
+        report = {"wall_ms": self._wall / 1e6,
+                  "phases": {name: {"calls": calls, "total_ms": total / 1e6, "mean_ms": total / 1e6 / calls}
+                             for name, (calls, total) in sorted(self.phases.items(), key=lambda p: -p[1][1])},
+                  "counters": dict(sorted(self.counters.items()))}
+        if self._peak is not None:
+            report["peak_memory_kib"] = self._peak / 1024
+        return report
+
+
+instruments = Instruments()
+
+
+def phase(name):
+    """Returns a context manager timing the enclosed code as a call of the named phase, if instrumentation is
+       enabled"""
+    return instruments.phase(name)
+
+
+def add_count(name, n):
+    """Adds n to the named counter, if instrumentation is enabled"""
+    instruments.count(name, n)
+
+
+def run_profiled(func, args, filename, memory=False):
+    """Calls func(args), writing a profile to the specified file: cProfile statistics (for pstats or snakeviz) if
+       the filename ends with .prof or .pstats, otherwise a JSON report of phase timings and counters (including
+       peak memory if memory is True). Returns func's return value."""
+    if filename.endswith((".prof", ".pstats")):
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(func, args)
+        finally:
+            profiler.dump_stats(filename)
+
+    instruments.start(memory)
+    try:
+        return func(args)
+    finally:
+        instruments.stop()
+        report = instruments.report()
+        report["command"] = getattr(args, "module", None)
+        with open(filename, "w") as out:
+            json.dump(report, out, indent=2)
@@ -1,12 +1,12 @@
-import time
+import functools
+
+from tifinity.scripts.instrument import phase
+
 
 def time_usage(func):
+    """Decorator timing each call of the function as an instrumentation phase named after it (see instrument)"""
+    @functools.wraps(func)
     def timing_wrapper(*args, **kwargs):
-        start = time.time()
-        value = func(*args, **kwargs)
-        end = time.time()
-        runtime = end - start
-        msg = "{func} took {time} seconds"
-        print (msg.format(func=func.__name__, time=runtime))
-        return value
+        with phase(func.__name__):
+            return func(*args, **kwargs)
     return timing_wrapper